@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Description:
+Run the helper scripts of the web-server, e.g. job_final_process.py,
+run_server_statistics.py and clean_cached_result.py, with one of the backends
+
+    inline     : call main() of the script in the current process
+    process    : call main() of the script in a pool of warm worker processes
+    subprocess : run "python script.py args" and wait for it to finish
+    slurm      : write a bash script and submit it with sbatch
+
+The scripts are loaded by importlib once per process, and then called with
+sys.argv set to the arguments, just like from the command line
+
+Author: Nanjiang Shu (nanjiang.shu@scilifelab.se)
+
+Address: Science for Life Laboratory Stockholm, Box 1031, 17121 Solna, Sweden
+"""
+
+import os
+import sys
+import time
+import threading
+import contextlib
+import importlib.util
+import concurrent.futures
+from . import myfunc
+from . import metrics
+from . import webserver_common as webcom
+
+BACKEND_LIST = ["inline", "process", "subprocess", "slurm"]
+NUM_PROCESS_EXECUTOR = 4 # default size of the process pool
+
+g_script_module_dict = {} # loaded scripts, keyed by path
+g_executor = None
+g_pending_dict = {} # tasks running in the process pool, keyed by task key
+g_lock = threading.Lock()
+
+def GetBackend(g_params, bsname, default):#{{{
+    """Get the backend to run the script bsname, configured by
+    g_params['EXECUTOR_<BSNAME>'], e.g. EXECUTOR_JOB_FINAL_PROCESS
+    """
+    key = "EXECUTOR_%s"%(bsname.upper())
+    if key in g_params and g_params[key] in BACKEND_LIST:
+        return g_params[key]
+    else:
+        return default
+#}}}
+def LoadScriptModule(scriptfile):#{{{
+    """Load the python script as a module, the module is cached so that the
+    script is only loaded once in each process"""
+    try:
+        return g_script_module_dict[scriptfile]
+    except KeyError:
+        pass
+    modname = os.path.splitext(os.path.basename(scriptfile))[0]
+    spec = importlib.util.spec_from_file_location(modname, scriptfile)
+    module = importlib.util.module_from_spec(spec)
+    scriptdir = os.path.dirname(scriptfile)
+    if not scriptdir in sys.path:
+        sys.path.insert(0, scriptdir)
+    # progname of the scripts is taken from sys.argv[0] when loaded
+    orig_argv = sys.argv
+    sys.argv = [scriptfile]
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.argv = orig_argv
+    g_script_module_dict[scriptfile] = module
+    return module
+#}}}
+@contextlib.contextmanager
+def RedirectOutputFD(logfile, errfile):#{{{
+    """Append stdout and stderr of the process to logfile and errfile, at the
+    level of the file descriptors. Only used in the worker processes of the
+    pool, since it affects all threads of the process"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fd_list = [os.dup(1), os.dup(2)]
+    try:
+        with open(logfile, "a") as fplog, open(errfile, "a") as fperr:
+            os.dup2(fplog.fileno(), 1)
+            os.dup2(fperr.fileno(), 2)
+            try:
+                yield
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os.dup2(saved_fd_list[0], 1)
+                os.dup2(saved_fd_list[1], 2)
+    finally:
+        for fd in saved_fd_list:
+            os.close(fd)
+#}}}
+def CallScriptMain(module, g_params):#{{{
+    """Call main() of the script, with g_params if main takes an argument,
+    e.g. main() of clean_cached_result.py takes none"""
+    if module.main.__code__.co_argcount > 0:
+        return module.main(g_params)
+    else:
+        return module.main()
+#}}}
+def RunScriptInProcess(argv, logfile, errfile, isRedirect=False):#{{{
+    """Call main() of the script argv[0] with sys.argv set to argv
+    isRedirect: append the output to logfile and errfile, set for the worker
+                processes of the pool. With the backend inline the output
+                goes to stdout and stderr of the daemon, which are shared by
+                its threads
+    The lockfile set by the script in g_params['lockfile'] is removed
+    afterwards, as done in the __main__ block of the scripts
+    Return (isSuccess, runtime_in_sec)
+    """
+    begin_time = time.time()
+    status = 1
+    orig_argv = sys.argv
+    orig_cwd = os.getcwd()
+    t_g_params = {}
+    if isRedirect:
+        redirect = RedirectOutputFD(logfile, errfile)
+    else:
+        redirect = contextlib.nullcontext()
+    try:
+        with redirect:
+            try:
+                module = LoadScriptModule(argv[0])
+                sys.argv = argv
+                if hasattr(module, 'InitGlobalParameter'):
+                    t_g_params = module.InitGlobalParameter()
+                status = CallScriptMain(module, t_g_params)
+            except SystemExit as e:
+                status = e.code
+            except Exception as e:
+                msg = "cmdline: %s\nFailed with message \"%s\""%(" ".join(argv), str(e))
+                webcom.loginfo(msg, errfile)
+                status = 1
+            finally:
+                sys.argv = orig_argv
+                os.chdir(orig_cwd)
+    except (IOError, OSError) as e:
+        print("Failed to redirect the output of %s. errmsg=%s"%(argv[0], str(e)), file=sys.stderr)
+    isSuccess = status in [0, None]
+    if (isinstance(t_g_params, dict) and 'lockfile' in t_g_params and
+            t_g_params['lockfile'] != "" and os.path.exists(t_g_params['lockfile'])):
+        try:
+            os.remove(t_g_params['lockfile'])
+        except OSError:
+            pass
+    return (isSuccess, time.time() - begin_time)
+#}}}
+def InitWorker():#{{{
+    """Initializer of the worker processes, the library has already been
+    imported when the workers are forked, reset the inherited states"""
+    global g_executor
+    g_executor = None
+    g_pending_dict.clear()
+#}}}
+def GetExecutor(g_params):#{{{
+    """Get the process pool, created at the first call"""
+    global g_executor
+    with g_lock:
+        if g_executor is None:
+            if 'NUM_PROCESS_EXECUTOR' in g_params:
+                max_workers = g_params['NUM_PROCESS_EXECUTOR']
+            else:
+                max_workers = NUM_PROCESS_EXECUTOR
+            g_executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=max_workers, initializer=InitWorker)
+        return g_executor
+#}}}
+def AddTiming(bsname, backend, runtime_in_sec):#{{{
+    """Add the runtime of the task to the metrics registry, reported as the
+    function executor.<bsname> labeled by the backend, see metrics.py"""
+    metrics.Observe("executor.%s"%(bsname), runtime_in_sec, backend=backend)
+#}}}
+def IsTaskPending(key):#{{{
+    """Whether the task with the key is still running in the process pool"""
+    with g_lock:
+        return key in g_pending_dict
+#}}}
+def WriteSlurmScript(argv, bash_scriptfile):#{{{
+    code_str_list = []
+    code_str_list.append("#!/bin/bash")
+    code_str_list.append("python %s"%(" ".join(argv)))
+    code = "\n".join(code_str_list)
+    myfunc.WriteFile(code, bash_scriptfile, mode="w", isFlush=True)
+    os.chmod(bash_scriptfile, 0o755)
+#}}}
+def RunScript(bsname, argv, backend, g_params, logfile, errfile,#{{{
+        bash_scriptfile="", key=""):
+    """Run the script argv[0] with the arguments argv[1:] by the backend
+    bash_scriptfile: the bash script submitted with sbatch for the backend
+                     slurm, the sbatch is run in the folder of the script
+    key: identifier of the task, a task is not started again with the backend
+         process if it is still pending
+    For the backends process and slurm, the task is only submitted
+    Return (isSuccess, runtime_in_sec)
+    """
+    isVerbose = 'DEBUG' in g_params and g_params['DEBUG']
+    if key == "":
+        key = bsname
+    if backend == "inline":
+        (isSuccess, runtime_in_sec) = RunScriptInProcess(argv, logfile, errfile)
+    elif backend == "process":
+        begin_time = time.time()
+        with g_lock:
+            if key in g_pending_dict:
+                return (True, 0.0)
+            g_pending_dict[key] = None
+        try:
+            future = GetExecutor(g_params).submit(RunScriptInProcess, argv,
+                    logfile, errfile, True)
+        except Exception as e:
+            with g_lock:
+                g_pending_dict.pop(key, None)
+            webcom.loginfo("Failed to submit %s to the process pool. errmsg=%s"%(
+                key, str(e)), errfile)
+            return (False, time.time() - begin_time)
+        def OnDone(future):
+            with g_lock:
+                g_pending_dict.pop(key, None)
+            try:
+                (isSuccess, runtime_in_sec) = future.result()
+            except Exception as e:
+                webcom.loginfo("%s failed in the process pool. errmsg=%s"%(
+                    key, str(e)), errfile)
+                return
+            AddTiming(bsname, backend, runtime_in_sec)
+            webcom.loginfo("executor: %s backend=process success=%s runtime=%.3f s"%(
+                key, isSuccess, runtime_in_sec), logfile)
+        future.add_done_callback(OnDone)
+        return (True, time.time() - begin_time)
+    elif backend == "slurm":
+        WriteSlurmScript(argv, bash_scriptfile)
+        os.chdir(os.path.dirname(bash_scriptfile))
+        cmd = ['sbatch', bash_scriptfile]
+        if isVerbose:
+            webcom.loginfo("Run cmdline: %s"%(" ".join(cmd)), logfile)
+        (isSuccess, runtime_in_sec) = webcom.RunCmd(cmd, logfile, errfile,
+                isVerbose)
+        if isVerbose:
+            webcom.loginfo("isSubmitSuccess: %s"%(str(isSuccess)), logfile)
+    else:
+        cmd = ["python"] + argv
+        (isSuccess, runtime_in_sec) = webcom.RunCmd(cmd, logfile, errfile)
+
+    AddTiming(bsname, backend, runtime_in_sec)
+    if isVerbose:
+        webcom.loginfo("executor: %s backend=%s success=%s runtime=%.3f s"%(
+            key, backend, isSuccess, runtime_in_sec), logfile)
+    return (isSuccess, runtime_in_sec)
+#}}}
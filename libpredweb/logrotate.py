@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Description:
+Rotation of the log files of the web-server
+
+Log files are registered by glob patterns with a rotation rule: the max size,
+the number of archives to keep, the max age of the archives in days and the
+rotation method
+
+    rename       : rename the log to <log>.<YYYYmmdd-HHMMSS>, the next write
+                   creates a new log. Nothing is lost for writers that open
+                   the log for each message, e.g. webcom.loginfo
+    copytruncate : copy the log and truncate it, for writers keeping the log
+                   open, e.g. stdout of a daemon redirected with >>. Lines
+                   written between the copy and the truncation are lost
+
+The rotated file is compressed to <log>.<YYYYmmdd-HHMMSS>.gz by a background
+thread, streamed with gzip at the configured level. Rotated files left
+uncompressed, e.g. by a crash, are compressed at the next check. The
+archives of each log, including the ones named <log>.<N>.gz by the earlier
+versions, are removed beyond keep_count and older than keep_days.
+
+Author: Nanjiang Shu (nanjiang.shu@scilifelab.se)
+
+Address: Science for Life Laboratory Stockholm, Box 1031, 17121 Solna, Sweden
+"""
+
+import os
+import re
+import sys
+import time
+import glob
+import gzip
+import shutil
+import threading
+import concurrent.futures
+
+METHOD_LIST = ["rename", "copytruncate"]
+BLOCK_SIZE = 1024*1024
+ROTATED_SUFFIX_PATTERN = r"\d{8}-\d{6}(_\d+)?"
+
+class LogRotateRule(object):#{{{
+    def __init__(self, pattern, max_size=20*1024*1024, keep_count=1,#{{{
+            keep_days=0, method="rename"):
+        """keep_count: number of archives to keep, 0 for no limit
+        keep_days: max age of the archives in days, 0 for no limit"""
+        if not method in METHOD_LIST:
+            print("Unknown rotation method %s, use rename"%(method), file=sys.stderr)
+            method = "rename"
+        self.pattern = pattern
+        self.max_size = max_size
+        self.keep_count = keep_count
+        self.keep_days = keep_days
+        self.method = method
+#}}}
+#}}}
+class LogRotator(object):#{{{
+# Description:
+#   Rotate the registered logs, compress the rotated files in a background
+#   thread and apply the retention of the archives
+#
+# Functions:
+#     Register(pattern, ...)   : add or replace the rule for the glob pattern
+#     CheckAll()               : check all registered logs
+#     Check(filelist, rule)    : check the given logs with the rule
+#     Wait()                   : wait for the compression to finish
+    def __init__(self, compresslevel=6):#{{{
+        self.compresslevel = compresslevel
+        self.rule_dict = {} # pattern -> LogRotateRule
+        self.pending_set = set([]) # rotated files being compressed
+        self.scanned_dir_set = set([]) # folders listed at least once
+        self.future_list = []
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+#}}}
+    def Register(self, pattern, max_size=20*1024*1024, keep_count=1,#{{{
+            keep_days=0, method="rename"):
+        self.rule_dict[pattern] = LogRotateRule(pattern, max_size, keep_count,
+                keep_days, method)
+#}}}
+    def GetRotatedFileName(self, logfile):#{{{
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        rotated = "%s.%s"%(logfile, stamp)
+        cnt = 0
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            cnt += 1
+            rotated = "%s.%s_%d"%(logfile, stamp, cnt)
+        return rotated
+#}}}
+    def Rotate(self, logfile, rule):#{{{
+        """Rotate the logfile and schedule the compression"""
+        rotated = self.GetRotatedFileName(logfile)
+        try:
+            if rule.method == "copytruncate":
+                with open(logfile, "r+b") as fpin:
+                    with open(rotated, "wb") as fpout:
+                        shutil.copyfileobj(fpin, fpout, BLOCK_SIZE)
+                        # copy also what is appended during the copy
+                        fpout.write(fpin.read())
+                        fpin.truncate(0)
+            else:
+                os.replace(logfile, rotated)
+        except (IOError, OSError) as e:
+            print("Failed to rotate %s. errmsg=%s"%(logfile, str(e)), file=sys.stderr)
+            return 1
+        self.SubmitCompress(rotated)
+        return 0
+#}}}
+    def SubmitCompress(self, rotated):#{{{
+        with self.lock:
+            if rotated in self.pending_set:
+                return
+            self.pending_set.add(rotated)
+            self.future_list = [x for x in self.future_list if not x.done()]
+            self.future_list.append(self.executor.submit(self.Compress, rotated))
+#}}}
+    def Compress(self, rotated):#{{{
+        """Compress rotated to rotated.gz, streamed in blocks"""
+        outfile = rotated + ".gz"
+        tmpfile = outfile + ".tmp"
+        if not os.path.exists(rotated): # already compressed
+            with self.lock:
+                self.pending_set.discard(rotated)
+            return
+        try:
+            with open(rotated, "rb") as fpin:
+                with gzip.open(tmpfile, "wb", compresslevel=self.compresslevel) as fpout:
+                    shutil.copyfileobj(fpin, fpout, BLOCK_SIZE)
+            st = os.stat(rotated)
+            os.utime(tmpfile, (st.st_atime, st.st_mtime))
+            os.replace(tmpfile, outfile)
+            os.remove(rotated)
+        except (IOError, OSError) as e:
+            print("Failed to compress %s. errmsg=%s"%(rotated, str(e)), file=sys.stderr)
+        finally:
+            with self.lock:
+                self.pending_set.discard(rotated)
+#}}}
+    def ApplyRetention(self, archive_list, rule):#{{{
+        """Remove the archives beyond rule.keep_count and older than
+        rule.keep_days, archive_list: [(path, mtime)]"""
+        archive_list = sorted(archive_list, key=lambda x:x[1], reverse=True)
+        now = time.time()
+        numdeleted = 0
+        for i in range(len(archive_list)):
+            (path, mtime) = archive_list[i]
+            if ((rule.keep_count > 0 and i >= rule.keep_count) or
+                    (rule.keep_days > 0 and now - mtime > rule.keep_days*86400)):
+                try:
+                    os.remove(path)
+                    numdeleted += 1
+                except OSError:
+                    pass
+        return numdeleted
+#}}}
+    def Check(self, filelist, rule, isTrackDir=True):#{{{
+        """Rotate the logs in filelist exceeding rule.max_size, and apply the
+        retention to their archives. The archives only change when a log is
+        rotated, so the folder of the logs is listed at the first check, after
+        a rotation, or at every check if rule.keep_days is set
+        The rotated files not compressed yet are counted as archives
+        isTrackDir: remember the folders listed at the first check, set to
+        False for folders checked only a few times, e.g. the job folders,
+        which are then listed only after a rotation
+        Return the number of rotated logs
+        """
+        dirdict = {} # dirname -> {name: mtime} of the rotated files
+        numrotated = 0
+        for logfile in filelist:
+            (dirname, name) = os.path.split(logfile)
+            isRotated = False
+            try:
+                if os.path.getsize(logfile) > rule.max_size:
+                    if self.Rotate(logfile, rule) == 0:
+                        numrotated += 1
+                        isRotated = True
+                        dirdict.pop(dirname, None)
+            except OSError:
+                pass
+
+            if not (isRotated or rule.keep_days > 0 or dirname in dirdict
+                    or (isTrackDir and not dirname in self.scanned_dir_set)):
+                continue
+            if not dirname in dirdict:
+                if isTrackDir:
+                    self.scanned_dir_set.add(dirname)
+                dirdict[dirname] = {}
+                try:
+                    for entry in os.scandir(dirname if dirname != "" else "."):
+                        if re.search(r"\.(\d+|%s)(\.gz)?$"%(ROTATED_SUFFIX_PATTERN), entry.name):
+                            try:
+                                dirdict[dirname][entry.name] = entry.stat().st_mtime
+                            except OSError:
+                                pass
+                except OSError:
+                    pass
+            prefix = name + "."
+            archive_list = []
+            uncompressed_list = []
+            for (t_name, mtime) in dirdict[dirname].items():
+                if not t_name.startswith(prefix):
+                    continue
+                suffix = t_name[len(prefix):]
+                path = os.path.join(dirname, t_name)
+                if re.match(r"^(\d+|%s)\.gz$"%(ROTATED_SUFFIX_PATTERN), suffix):
+                    archive_list.append((path, mtime))
+                elif (re.match(r"^%s$"%(ROTATED_SUFFIX_PATTERN), suffix)
+                        and not t_name + ".gz" in dirdict[dirname]):
+                    # rotated but not compressed, e.g. the one just rotated
+                    archive_list.append((path, mtime))
+                    uncompressed_list.append(path)
+            self.ApplyRetention(archive_list, rule)
+            for path in uncompressed_list:
+                if os.path.exists(path):
+                    self.SubmitCompress(path)
+        return numrotated
+#}}}
+    def CheckAll(self):#{{{
+        """Check all registered logs, return the number of rotated logs"""
+        numrotated = 0
+        for rule in list(self.rule_dict.values()):
+            filelist = [f for f in glob.glob(rule.pattern) if not
+                    re.search(r"\.(%s(\.gz)?|\d+\.gz|gz\.tmp)$"%(ROTATED_SUFFIX_PATTERN), f)]
+            numrotated += self.Check(filelist, rule)
+        return numrotated
+#}}}
+    def Wait(self, timeout=None):#{{{
+        """Wait for the scheduled compression to finish"""
+        with self.lock:
+            future_list = list(self.future_list)
+        concurrent.futures.wait(future_list, timeout=timeout)
+#}}}
+#}}}
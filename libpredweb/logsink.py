@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Description:
+Buffered writing of the log files of the web-server
+
+By default webcom.loginfo and webcom.logwrite append to the log file
+directly, i.e. open, append, flush and close the file for every message,
+which is a round trip to the file server on NFS. When the buffered sink is
+enabled, messages are queued and appended by a background thread every
+flush_interval seconds, with one open/append/close for each log file.
+
+Only complete lines are queued. Partial lines, e.g. "\\tSubmitting seq 1"
+followed later by " succeeded on node ...\\n", are kept for each thread and
+log file until the newline is written, so that lines from different threads
+are not interleaved.
+
+The queue is bounded, when it is full the caller writes the queue itself.
+The queue is flushed by Flush(), e.g. at the end of each loop of the
+daemon, and at exit. Processes forked from a process with the buffered sink
+write the logs directly, since the worker processes of multiprocessing exit
+without running the atexit handlers.
+
+Configuration, e.g. in the g_params of qd_fe.py
+    LOG_FLUSH_INTERVAL : interval in seconds to write the buffered logs, 0 to
+                         write the logs directly, (default: 0)
+    LOG_MAX_QUEUE      : max number of queued lines, (default: 10000)
+
+Author: Nanjiang Shu (nanjiang.shu@scilifelab.se)
+
+Address: Science for Life Laboratory Stockholm, Box 1031, 17121 Solna, Sweden
+"""
+
+import os
+import sys
+import atexit
+import threading
+
+g_sink = None
+
+class BufferedLogSink(object):#{{{
+    def __init__(self, flush_interval=1.0, max_queue=10000):#{{{
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.queue = [] # [(outfile, text)] of complete lines
+        self.partial_dict = {} # (thread ident, outfile) -> partial line
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock() # keeps the order of the flushes
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.Run, name="BufferedLogSink",
+                daemon=True)
+        self.thread.start()
+#}}}
+    def Write(self, text, outfile):#{{{
+        key = (threading.get_ident(), outfile)
+        with self.lock:
+            partial = self.partial_dict.pop(key, "")
+            if partial != "":
+                text = partial + text
+            idx = text.rfind("\n")
+            if idx < len(text)-1:
+                self.partial_dict[key] = text[idx+1:]
+                text = text[:idx+1]
+            if text != "":
+                self.queue.append((outfile, text))
+            isFull = len(self.queue) >= self.max_queue
+        if isFull:
+            self.Flush()
+        return ""
+#}}}
+    def Flush(self, isFinal=False):#{{{
+        """Append the queued lines to the log files, with isFinal also the
+        partial lines"""
+        with self.write_lock:
+            with self.lock:
+                queue = self.queue
+                self.queue = []
+                if isFinal:
+                    for ((ident, outfile), text) in self.partial_dict.items():
+                        queue.append((outfile, text))
+                    self.partial_dict = {}
+            if len(queue) == 0:
+                return 0
+            content_dict = {} # outfile -> [text], in the order of writing
+            for (outfile, text) in queue:
+                try:
+                    content_dict[outfile].append(text)
+                except KeyError:
+                    content_dict[outfile] = [text]
+            status = 0
+            for outfile in content_dict:
+                try:
+                    with open(outfile, "a") as fpout:
+                        fpout.write("".join(content_dict[outfile]))
+                except IOError as e:
+                    print("Failed to write to %s. errmsg=%s"%(outfile, str(e)),
+                            file=sys.stderr)
+                    status = 1
+            return status
+#}}}
+    def Run(self):#{{{
+        while not self.stop_event.wait(self.flush_interval):
+            self.Flush()
+#}}}
+    def Stop(self):#{{{
+        self.stop_event.set()
+        self.Flush(isFinal=True)
+#}}}
+#}}}
+def Write(text, outfile):#{{{
+    """Append text to outfile, through the buffered sink if enabled
+    Return "" on success, as myfunc.WriteFile"""
+    if outfile == "":
+        return "Empty log file name"
+    sink = g_sink
+    if sink is not None:
+        return sink.Write(text, outfile)
+    try:
+        with open(outfile, "a") as fpout:
+            fpout.write(text)
+        return ""
+    except IOError:
+        return "Failed to write to %s with mode \"a\""%(outfile)
+#}}}
+def Flush():#{{{
+    """Write the queued lines, e.g. at the end of each loop of the daemon"""
+    sink = g_sink
+    if sink is not None:
+        return sink.Flush()
+    return 0
+#}}}
+def Enable(flush_interval=1.0, max_queue=10000):#{{{
+    """Buffer the logs written by Write, flush_interval <= 0 disables it"""
+    global g_sink
+    if g_sink is not None:
+        if (g_sink.flush_interval == flush_interval and
+                g_sink.max_queue == max_queue):
+            return
+        g_sink.Stop()
+        g_sink = None
+    if flush_interval > 0:
+        g_sink = BufferedLogSink(flush_interval, max_queue)
+#}}}
+def Disable():#{{{
+    Enable(0)
+#}}}
+def ConfigureFromParams(g_params):#{{{
+    Enable(g_params.get('LOG_FLUSH_INTERVAL', 0),
+            g_params.get('LOG_MAX_QUEUE', 10000))
+#}}}
+def AtExit():#{{{
+    if g_sink is not None:
+        g_sink.Stop()
+#}}}
+def ResetAfterFork():#{{{
+    # the queued lines are written by the parent process
+    global g_sink
+    g_sink = None
+#}}}
+
+atexit.register(AtExit)
+os.register_at_fork(after_in_child=ResetAfterFork)
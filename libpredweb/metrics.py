@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Description:
+Runtime metrics of the web-server daemon (qd_fe.py) and the views
+
+The functions decorated with timeit.timeit are timed with a monotonic clock
+and the runtimes are added to histograms in a registry of the process, one
+histogram for each function and set of labels (server, node and jobid).
+The runtimes of the tasks run by executor.py are added as the functions
+executor.<name> labeled by the backend.
+The histograms are written periodically to path_log, either as JSON
+(metrics.json, with count, sum, p50, p95 and p99) or as a Prometheus textfile
+(metrics.prom). Optionally a sampling profiler records the stacks of the
+thread that configured the metrics, written as folded stacks to
+metrics.profile.folded, which can be read by flamegraph.pl
+
+Configuration, e.g. in the g_params of qd_fe.py
+    METRICS_FORMAT          : json, prom or none, (default: json)
+    METRICS_WEB             : also write the metrics of the views, one file
+                              for each web process, (default: False)
+    METRICS_FLUSH_INTERVAL  : interval in seconds to write the metrics, (default: 60)
+    PROFILE_SAMPLE_INTERVAL : interval in seconds to sample the stacks, 0 to
+                              disable the profiler, (default: 0)
+
+Author: Nanjiang Shu (nanjiang.shu@scilifelab.se)
+
+Address: Science for Life Laboratory Stockholm, Box 1031, 17121 Solna, Sweden
+"""
+
+import os
+import sys
+import time
+import json
+import atexit
+import bisect
+import threading
+
+# upper bounds of the histogram buckets in seconds, from 1 us to ~35 min
+BUCKET_BOUNDS = [0.000001*2**i for i in range(32)]
+QUANTILE_LIST = [0.5, 0.95, 0.99]
+LABEL_NAMES = ["server", "node", "backend", "jobid"]
+METRIC_NAME = "libpredweb_function_duration_seconds"
+FORMAT_LIST = ["json", "prom", "none"]
+
+g_lock = threading.Lock()
+g_registry = {} # (function, labels) -> Histogram
+g_default_labels = {} # labels added to all histograms, e.g. server
+g_config = {'path_log': "", 'name': "metrics", 'format': "json",
+        'flush_interval': 60.0, 'next_flush': None}
+g_profiler = None
+
+class Histogram(object):#{{{
+# Description:
+#   Runtime histogram with fixed buckets (BUCKET_BOUNDS), the quantiles are
+#   interpolated within the buckets
+    def __init__(self):#{{{
+        self.counts = [0]*(len(BUCKET_BOUNDS)+1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = 0.0
+        self.last_update = 0.0
+#}}}
+    def Observe(self, value):#{{{
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+#}}}
+    def Quantile(self, q):#{{{
+        if self.count == 0:
+            return 0.0
+        rank = q*self.count
+        cum = 0
+        for i in range(len(self.counts)):
+            if self.counts[i] == 0:
+                continue
+            if cum + self.counts[i] >= rank:
+                lower = BUCKET_BOUNDS[i-1] if i > 0 else 0.0
+                upper = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                value = lower + (upper-lower)*(rank-cum)/self.counts[i]
+                return min(max(value, self.min), self.max)
+            cum += self.counts[i]
+        return self.max
+#}}}
+    def ToDict(self):#{{{
+        d = {'count': self.count, 'sum': self.sum,
+                'min': self.min if self.min is not None else 0.0,
+                'max': self.max}
+        for q in QUANTILE_LIST:
+            d['p%d'%(int(q*100))] = self.Quantile(q)
+        return d
+#}}}
+#}}}
+def SetDefaultLabels(**labels):#{{{
+    """Set labels added to all observations in this process, e.g. server"""
+    with g_lock:
+        g_default_labels.update(labels)
+#}}}
+def GetLabelKey(labels):#{{{
+    if not labels:
+        d = g_default_labels
+    else:
+        d = dict(g_default_labels)
+        d.update(labels)
+    return tuple((name, str(d[name])) for name in LABEL_NAMES
+            if name in d and d[name] not in [None, ""])
+#}}}
+def Observe(funcname, runtime_in_sec, **labels):#{{{
+    """Add the runtime of funcname to the registry. For labels with jobid, the
+    runtime is also added to the histogram without jobid, so that the
+    histograms per function are kept after the ones per job are expired
+    Nothing is recorded before the metrics are configured
+    """
+    if g_config['path_log'] == "":
+        return
+    labelkey = GetLabelKey(labels)
+    now = time.monotonic()
+    with g_lock:
+        keylist = [(funcname, labelkey)]
+        if len(labelkey) > 0 and labelkey[-1][0] == "jobid":
+            keylist.append((funcname, labelkey[:-1]))
+        for key in keylist:
+            try:
+                hist = g_registry[key]
+            except KeyError:
+                hist = g_registry[key] = Histogram()
+            hist.Observe(runtime_in_sec)
+            hist.last_update = now
+    MaybeFlush(now)
+#}}}
+def GetLabelArgs(method):#{{{
+    """Return [(argname, position)] of the arguments jobid and node of
+    method, which are used as labels"""
+    try:
+        code = method.__code__
+        argnames = list(code.co_varnames[:code.co_argcount])
+    except AttributeError:
+        argnames = []
+    return [(x, argnames.index(x)) for x in ["jobid", "node"] if x in argnames]
+#}}}
+def GetLabelsFromArgs(labelargs, args, kw):#{{{
+    labels = {}
+    for (argname, idx) in labelargs:
+        if argname in kw:
+            labels[argname] = kw[argname]
+        elif idx < len(args):
+            labels[argname] = args[idx]
+    return labels
+#}}}
+def GetSnapshot():#{{{
+    """Return a list of (funcname, labels_dict, histogram_dict)"""
+    with g_lock:
+        return [(funcname, dict(labelkey), hist.ToDict())
+                for ((funcname, labelkey), hist) in sorted(g_registry.items())]
+#}}}
+def GetPromText():#{{{
+    """Return the histograms in the Prometheus text format"""
+    li = []
+    li.append("# HELP %s Runtime of the instrumented functions"%(METRIC_NAME))
+    li.append("# TYPE %s histogram"%(METRIC_NAME))
+    with g_lock:
+        for ((funcname, labelkey), hist) in sorted(g_registry.items()):
+            labelstr = ",".join(['function="%s"'%(funcname)] +
+                    ['%s="%s"'%(name, value.replace('"', '\\"')) for (name, value) in labelkey])
+            cum = 0
+            for i in range(len(BUCKET_BOUNDS)):
+                cum += hist.counts[i]
+                li.append('%s_bucket{%s,le="%g"} %d'%(METRIC_NAME, labelstr,
+                    BUCKET_BOUNDS[i], cum))
+            li.append('%s_bucket{%s,le="+Inf"} %d'%(METRIC_NAME, labelstr, hist.count))
+            li.append('%s_sum{%s} %.6f'%(METRIC_NAME, labelstr, hist.sum))
+            li.append('%s_count{%s} %d'%(METRIC_NAME, labelstr, hist.count))
+    return "\n".join(li) + "\n"
+#}}}
+def WriteFileAtomic(content, outfile):#{{{
+    tmpfile = "%s.tmp.%d"%(outfile, os.getpid())
+    try:
+        with open(tmpfile, "w") as fpout:
+            fpout.write(content)
+        os.replace(tmpfile, outfile)
+    except IOError as e:
+        print("Failed to write %s. errmsg=%s"%(outfile, str(e)), file=sys.stderr)
+        return 1
+    return 0
+#}}}
+def ExpireJobHistograms(max_idle_in_sec):#{{{
+    """Remove the histograms labeled with jobid not updated in max_idle_in_sec"""
+    now = time.monotonic()
+    with g_lock:
+        for key in [key for (key, hist) in g_registry.items()
+                if len(key[1]) > 0 and key[1][-1][0] == "jobid"
+                and now - hist.last_update > max_idle_in_sec]:
+            del g_registry[key]
+#}}}
+def Flush():#{{{
+    """Write the metrics, and the profile if enabled, to path_log"""
+    path_log = g_config['path_log']
+    if path_log == "" or not os.path.isdir(path_log):
+        return 1
+    fmt = g_config['format']
+    if fmt == "json":
+        li = [{'function': funcname, 'labels': labels, 'runtime_in_sec': d}
+                for (funcname, labels, d) in GetSnapshot()]
+        content = json.dumps({'date': time.strftime("%Y-%m-%d %H:%M:%S %Z"),
+            'pid': os.getpid(), 'metrics': li}, sort_keys=True, indent=1)
+        WriteFileAtomic(content, "%s/%s.json"%(path_log, g_config['name']))
+    elif fmt == "prom":
+        WriteFileAtomic(GetPromText(), "%s/%s.prom"%(path_log, g_config['name']))
+    if g_profiler is not None:
+        WriteFileAtomic(g_profiler.GetFoldedText(), "%s/%s.profile.folded"%(
+            path_log, g_config['name']))
+    # each job is handled within a few loops of the daemon, keep the
+    # histograms of a job for at least two intervals after the last update
+    ExpireJobHistograms(2*g_config['flush_interval'])
+    return 0
+#}}}
+def MaybeFlush(now=None):#{{{
+    next_flush = g_config['next_flush']
+    if next_flush is None:
+        return
+    if now is None:
+        now = time.monotonic()
+    if now >= next_flush:
+        g_config['next_flush'] = now + g_config['flush_interval']
+        Flush()
+#}}}
+class SamplingProfiler(object):#{{{
+# Description:
+#   Sample the stack of a thread every interval seconds in a daemon thread,
+#   the samples are counted by the folded stack
+#   "file:function;file:function;... "
+    def __init__(self, interval, thread_ident=None):#{{{
+        self.interval = interval
+        if thread_ident is None:
+            thread_ident = threading.get_ident()
+        self.thread_ident = thread_ident
+        self.stack_count_dict = {}
+        self.numsample = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.Run, name="SamplingProfiler",
+                daemon=True)
+#}}}
+    def Start(self):#{{{
+        self.thread.start()
+#}}}
+    def Stop(self):#{{{
+        self.stop_event.set()
+#}}}
+    def Run(self):#{{{
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_ident)
+            if frame is None:
+                continue
+            li = []
+            while frame is not None:
+                code = frame.f_code
+                li.append("%s:%s"%(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            stack = ";".join(reversed(li))
+            with self.lock:
+                self.stack_count_dict[stack] = self.stack_count_dict.get(stack, 0) + 1
+                self.numsample += 1
+#}}}
+    def GetFoldedText(self):#{{{
+        with self.lock:
+            li = ["%s %d"%(stack, cnt) for (stack, cnt) in
+                    sorted(self.stack_count_dict.items(), key=lambda x:-x[1])]
+        return "\n".join(li) + "\n"
+#}}}
+#}}}
+def Configure(path_log, fmt="json", flush_interval=60, profile_interval=0,#{{{
+        name="metrics", **labels):
+    """Write the metrics to path_log every flush_interval seconds, and at exit
+    name: rootname of the output files, e.g. metrics.json
+    fmt: json, prom or none
+    profile_interval: sampling interval of the profiler in seconds, 0 to
+                      disable it. The thread calling Configure is profiled
+    labels: default labels, e.g. server=name_server
+    """
+    global g_profiler
+    if not fmt in FORMAT_LIST:
+        print("Unknown metrics format %s, use json"%(fmt), file=sys.stderr)
+        fmt = "json"
+    isFirst = g_config['next_flush'] is None
+    g_config['path_log'] = path_log
+    g_config['name'] = name
+    g_config['format'] = fmt
+    g_config['flush_interval'] = float(flush_interval)
+    g_config['next_flush'] = time.monotonic() + g_config['flush_interval']
+    SetDefaultLabels(**labels)
+    if profile_interval > 0 and g_profiler is None:
+        g_profiler = SamplingProfiler(profile_interval)
+        g_profiler.Start()
+    elif profile_interval <= 0 and g_profiler is not None:
+        g_profiler.Stop()
+        g_profiler = None
+    if isFirst:
+        atexit.register(Flush)
+#}}}
+def ConfigureFromParams(g_params, name="metrics"):#{{{
+    """Configure the metrics from g_params, only once in each process"""
+    if g_config['next_flush'] is not None:
+        return
+    if 'path_log' in g_params:
+        path_log = g_params['path_log']
+    elif 'path_static' in g_params:
+        path_log = "%s/log"%(g_params['path_static'])
+    else:
+        return
+    fmt = g_params.get('METRICS_FORMAT', "json")
+    flush_interval = g_params.get('METRICS_FLUSH_INTERVAL', 60)
+    profile_interval = g_params.get('PROFILE_SAMPLE_INTERVAL', 0)
+    Configure(path_log, fmt, flush_interval, profile_interval, name=name,
+            server=g_params.get('name_server', ""))
+#}}}
+def ResetAfterFork():#{{{
+    # the metrics of the parent process are written by the parent, so that
+    # the child does not overwrite them with its stale copy. The child
+    # records nothing until it is configured, e.g. a web process with
+    # METRICS_WEB
+    global g_lock, g_profiler
+    g_lock = threading.Lock()
+    g_registry.clear()
+    g_config['path_log'] = ""
+    g_config['next_flush'] = None
+    g_profiler = None
+#}}}
+
+os.register_at_fork(after_in_child=ResetAfterFork)
@@ -1,6 +1,14 @@
 import os
+import re
 import sys
+import time
+import itertools
+import multiprocessing
+import threading
+from array import array
 from . import mydb_common
+
+g_dbfile_generation = itertools.count()
 class MyDB: #{{{
 # Description:
 #   A class to handle a database of dumped data. The content for each query id
@@ -12,9 +20,13 @@ class MyDB: #{{{
 #     GetRecord(id)  : retrieve record for id, 
 #                      return None if failed
 #     GetAllRecord() : retrieve all records in the form of list
+#     GetCacheStat() : hit/miss/eviction counters of the record cache
+#
+#   With cache_size > 0 (in bytes), the retrieved records are kept in a LRU
+#   cache bounded by cache_size. The object can be shared by threads.
 
     def __init__(self, dbname, index_format = mydb_common.FORMAT_BINARY,#{{{
-                    isPrintWarning = False):
+                    isPrintWarning = False, cache_size = 0):
 #        print "Init", dbname
         self.failure = False
         self.index_type = mydb_common.TYPE_DICT
@@ -26,6 +38,10 @@ class MyDB: #{{{
         self.index_format = index_format
         self.isPrintWarning = isPrintWarning
         self.fpdbList = []
+        self.fplock = threading.Lock()
+        self.cache = None
+        if cache_size > 0:
+            self.cache = mydb_common.RecordCache(cache_size)
         (self.indexfile, self.index_format) =\
                         mydb_common.GetIndexFile(self.dbname_full,
                                         self.index_format)
@@ -71,42 +87,62 @@ class MyDB: #{{{
             return mydb_common.ReadIndex_binary(indexfile, self.isPrintWarning)
 #}}}
     def OpenDBFile(self):#{{{
+# the dbfiles are opened in binary mode since the offsets and sizes in the
+# index are counted in bytes
+        ext = self.headerinfo[2]
+        if ext == "":
+            ext = ".db"
         for i in self.dbfileindexList:
-            dbfile = self.dbname_full + "%d.db"%(i)
+            dbfile = self.dbname_full + "%d%s"%(i, ext)
             try:
-                self.fpdbList.append(open(dbfile,"r"))
+                self.fpdbList.append(open(dbfile,"rb"))
             except IOError:
                 print("Failed to read dbfile %s"%(dbfile), file=sys.stderr)
                 return 1
         return 0
+#}}}
+    def ReadRecord(self, idxItem):#{{{
+# the file handles are shared, seek and read must not be interleaved
+        fpdb = self.fpdbList[self.indexList[1][idxItem]]
+        with self.fplock:
+            fpdb.seek(self.indexList[2][idxItem])
+            data = fpdb.read(self.indexList[3][idxItem])
+        return data.decode('utf-8')
 #}}}
     def GetRecordByIndexList(self, record_id):#{{{
         try:
             idxItem = self.indexedIDList.index(record_id);
-            fpdb = self.fpdbList[self.indexList[1][idxItem]];
-            fpdb.seek(self.indexList[2][idxItem]);
-            data = fpdb.read(self.indexList[3][idxItem]);
-            return data
-        except (IndexError, IOError):
+            return self.ReadRecord(idxItem)
+        except (ValueError, IndexError, IOError, UnicodeDecodeError):
             print("Failed to retrieve record %s"%(record_id), file=sys.stderr)
             return None
 #}}}
     def GetRecordByIndexDict(self, record_id):#{{{
         try:
             idxItem = self.indexDict[record_id]
-            fpdb = self.fpdbList[self.indexList[1][idxItem]];
-            fpdb.seek(self.indexList[2][idxItem]);
-            data = fpdb.read(self.indexList[3][idxItem]);
-            return data
-        except (KeyError, IndexError, IOError):
+            return self.ReadRecord(idxItem)
+        except (KeyError, IndexError, IOError, UnicodeDecodeError):
             print("Failed to retrieve record %s"%(record_id), file=sys.stderr)
             return None
 #}}}
     def GetRecord(self, record_id):#{{{
+        if self.cache != None:
+            data = self.cache.Get(record_id)
+            if data != None:
+                return data
+        data = None
         if self.index_type == mydb_common.TYPE_LIST:
-            return self.GetRecordByIndexList(record_id)
+            data = self.GetRecordByIndexList(record_id)
         elif self.index_type == mydb_common.TYPE_DICT:
-            return self.GetRecordByIndexDict(record_id)
+            data = self.GetRecordByIndexDict(record_id)
+        if self.cache != None and data != None:
+            self.cache.Put(record_id, data)
+        return data
+#}}}
+    def GetCacheStat(self):#{{{
+        if self.cache == None:
+            return None
+        return self.cache.GetStat()
 #}}}
     def GetAllRecord(self): #{{{
         recordList = []
@@ -124,3 +160,326 @@ class MyDB: #{{{
         #}}}
     #}}}
 #}}}
+class MyDBWriter: #{{{
+# Description:
+#   A class to build a database of dumped data that can be read by MyDB.
+#   Records are streamed into the dbfiles <dbname>0<ext>, <dbname>1<ext>, ...
+#   and a new dbfile is started when the current one exceeds max_dbfile_size.
+#   The extension <ext> is unique for each build (see NewDBFileExtension) and
+#   is recorded in the index file, so the dbfiles of a new build never replace
+#   the dbfiles used by the current index. All files are written to temporary
+#   names and the index file is published last by rename when close() is
+#   called, so that a reader never sees a partially written index nor pairs
+#   an index with the dbfiles of another build
+#
+# Functions:
+#     AddRecord(id, content) : append one record, return 0 on success
+#     close()                : write the index file and publish the database
+#
+# Usage:
+# writer = MyDBWriter(dbname)
+# for (record_id, content) in records:
+#     writer.AddRecord(record_id, content)
+# writer.close()
+
+    def __init__(self, dbname, index_format = mydb_common.FORMAT_BINARY,#{{{
+            max_dbfile_size = mydb_common.LargeFileThresholdSize, prefix=""):
+        self.failure = False
+        self.dbname = dbname
+        self.index_format = index_format
+        self.max_dbfile_size = max_dbfile_size
+        self.prefix = prefix
+        self.ext = NewDBFileExtension()
+        self.tmpsuffix = ".tmp%d"%(os.getpid())
+        self.idList = []
+        self.v1 = array('B') # dbfile index
+        self.v2 = array('L') # offset
+        self.v3 = array('I') # block size
+        self.idSet = set([])
+        self.fpdb = None
+        self.dbfileindex = -1
+        self.offset = 0
+        self.isClosed = False
+        if self.OpenNextDBFile() == 1:
+            self.failure = True
+#}}}
+    def GetDBFileName(self, dbfileindex):#{{{
+        return self.dbname + "%d%s"%(dbfileindex, self.ext)
+#}}}
+    def OpenNextDBFile(self):#{{{
+        if self.fpdb != None:
+            self.fpdb.close()
+        if self.dbfileindex + 1 >= mydb_common.MAX_NUM_DBFILE:
+            msg = "Number of dbfiles exceeds the limit {} for db {}"
+            print(msg.format(mydb_common.MAX_NUM_DBFILE, self.dbname),
+                    file=sys.stderr)
+            self.fpdb = None
+            return 1
+        self.dbfileindex += 1
+        dbfile = self.GetDBFileName(self.dbfileindex) + self.tmpsuffix
+        try:
+            self.fpdb = open(dbfile, "wb")
+        except IOError:
+            print("Failed to write to dbfile %s"%(dbfile), file=sys.stderr)
+            self.fpdb = None
+            return 1
+        self.offset = 0
+        return 0
+#}}}
+    def AddRecord(self, record_id, content):#{{{
+        if self.failure or self.isClosed:
+            return 1
+        if record_id in self.idSet:
+            msg = "Duplicated record {} ignored for db {}"
+            print(msg.format(record_id, self.dbname), file=sys.stderr)
+            return 1
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        size = len(content)
+        if self.offset > 0 and self.offset + size > self.max_dbfile_size:
+            if self.OpenNextDBFile() == 1:
+                self.failure = True
+                return 1
+        try:
+            self.fpdb.write(content)
+        except IOError:
+            print("Failed to write record %s"%(record_id), file=sys.stderr)
+            self.failure = True
+            return 1
+        self.idList.append(record_id)
+        self.idSet.add(record_id)
+        self.v1.append(self.dbfileindex)
+        self.v2.append(self.offset)
+        self.v3.append(size)
+        self.offset += size
+        return 0
+#}}}
+    def close(self):#{{{
+        """Write the index file and publish the dbfiles and the index file"""
+        if self.isClosed:
+            return 0
+        self.isClosed = True
+        if self.fpdb != None:
+            self.fpdb.close()
+            self.fpdb = None
+        if self.failure:
+            self.Discard()
+            return 1
+        prev_ext = GetPublishedDBFileExtension(self.dbname)
+        for i in range(self.dbfileindex + 1):
+            dbfile = self.GetDBFileName(i)
+            os.replace(dbfile + self.tmpsuffix, dbfile)
+        indexList = [self.idList, self.v1, self.v2, self.v3]
+        status = WriteDBIndex(self.dbname, indexList, self.index_format,
+                self.prefix, self.ext)
+        if status == 0:
+            # keep the dbfiles of the previous build for the readers that
+            # still use the previous index
+            RemoveStaleDBFile(self.dbname, [self.ext, prev_ext])
+        return status
+#}}}
+    def Discard(self):#{{{
+        """Remove the temporary dbfiles without publishing"""
+        for i in range(self.dbfileindex + 1):
+            dbfile = self.GetDBFileName(i) + self.tmpsuffix
+            if os.path.exists(dbfile):
+                os.remove(dbfile)
+#}}}
+#}}}
+def NewDBFileExtension():#{{{
+    """
+    Get a new extension for the dbfiles of a build, e.g.
+    ".g1700000000000_123_0.db" made of the time in ms, the pid and a counter
+    """
+    return ".g%d_%d_%d.db"%(int(time.time()*1000), os.getpid(),
+            next(g_dbfile_generation))
+#}}}
+def GetPublishedDBFileExtension(dbname):#{{{
+    """
+    Get the extension of the dbfiles used by the current index file of the
+    database, return "" if there is no index file
+    """
+    for (indexfile, index_format) in [
+            (dbname + ".indexbin", mydb_common.FORMAT_BINARY),
+            (dbname + ".index", mydb_common.FORMAT_TEXT)]:
+        if os.path.exists(indexfile):
+            headerinfo = mydb_common.ReadIndexHeader(indexfile, index_format)
+            if headerinfo == None:
+                return ""
+            if headerinfo[2] == "":
+                return ".db"
+            return headerinfo[2]
+    return ""
+#}}}
+def WriteDBIndex(dbname, indexList, index_format, prefix="", ext=".db"):#{{{
+    """
+    Write the index file of the database to a temporary file and publish it
+    by rename, return 0 on success
+    ext is the extension of the dbfiles referred to by the index
+    """
+    if index_format == mydb_common.FORMAT_TEXT:
+        indexfile = dbname + ".index"
+        mode = "w"
+    else:
+        indexfile = dbname + ".indexbin"
+        mode = "wb"
+    headerinfo = (os.path.basename(dbname), mydb_common.version, ext, prefix)
+    indexFileHeaderText = mydb_common.GetIndexFileHeaderText(headerinfo)
+    tmpindexfile = indexfile + ".tmp%d"%(os.getpid())
+    try:
+        fpindex = open(tmpindexfile, mode)
+        mydb_common.WriteIndexHeader(indexFileHeaderText, index_format, fpindex)
+        if len(indexList[0]) > 0:
+            mydb_common.WriteIndexContent(indexList, index_format, fpindex)
+        fpindex.close()
+        os.replace(tmpindexfile, indexfile)
+    except (IOError, OSError):
+        print("Failed to write index file %s"%(indexfile), file=sys.stderr)
+        if os.path.exists(tmpindexfile):
+            os.remove(tmpindexfile)
+        return 1
+    # remove the index file of the other format so that it will not shadow
+    # the newly written one
+    if index_format == mydb_common.FORMAT_TEXT:
+        otherindexfile = dbname + ".indexbin"
+    else:
+        otherindexfile = dbname + ".index"
+    if os.path.exists(otherindexfile):
+        os.remove(otherindexfile)
+    return 0
+#}}}
+def RemoveStaleDBFile(dbname, keepExtList):#{{{
+    """
+    Remove the dbfiles of the database left over from the previous builds, the
+    dbfiles with the extension in keepExtList are kept
+    """
+    dirname = os.path.dirname(dbname)
+    if dirname == "":
+        dirname = "."
+    pattern = re.compile(re.escape(os.path.basename(dbname)) +
+            r"\d+((\.g\d+_\d+_\d+)?\.db)$")
+    try:
+        for entry in os.scandir(dirname):
+            m = pattern.match(entry.name)
+            if m and not m.group(1) in keepExtList:
+                os.remove(entry.path)
+    except OSError:
+        print("Failed to remove stale dbfiles of db %s"%(dbname), file=sys.stderr)
+#}}}
+def BuildDBPart(partdbname, pairlist, index_format, max_dbfile_size):#{{{
+    """
+    Build a part of the database from a list of (record_id, file), the file
+    content is used as the record. Return (partdbname, status)
+    """
+    writer = MyDBWriter(partdbname, index_format, max_dbfile_size)
+    for (record_id, infile) in pairlist:
+        try:
+            with open(infile, "rb") as fpin:
+                content = fpin.read()
+        except IOError:
+            print("Failed to read file %s"%(infile), file=sys.stderr)
+            continue
+        if writer.AddRecord(record_id, content) == 1 and writer.failure:
+            break
+    status = writer.close()
+    return (partdbname, status)
+#}}}
+def MergeDBPart(dbname, partdbnameList, index_format = mydb_common.FORMAT_BINARY):#{{{
+    """
+    Merge the databases built in parts into one database. The dbfiles of each
+    part are renamed to the dbfiles of the merged database and the index
+    files are merged with the dbfile indices renumbered.
+    Return 0 on success
+    """
+    idList = []
+    v1 = array('B')
+    v2 = array('L')
+    v3 = array('I')
+    renameList = []
+    numdbfile = 0
+    ext = NewDBFileExtension()
+    for partdbname in partdbnameList:
+        (indexfile, t_format) = mydb_common.GetIndexFile(partdbname, index_format)
+        if indexfile == "":
+            return 1
+        if t_format == mydb_common.FORMAT_TEXT:
+            (indexList, headerinfo, dbfileindexList) = \
+                    mydb_common.ReadIndex_text(indexfile)
+        else:
+            (indexList, headerinfo, dbfileindexList) = \
+                    mydb_common.ReadIndex_binary(indexfile)
+        if indexList == None:
+            return 1
+        if numdbfile + len(dbfileindexList) > mydb_common.MAX_NUM_DBFILE:
+            msg = "Number of dbfiles exceeds the limit {} for db {}"
+            print(msg.format(mydb_common.MAX_NUM_DBFILE, dbname),
+                    file=sys.stderr)
+            return 1
+        idList += indexList[0]
+        v1.extend([x + numdbfile for x in indexList[1]])
+        v2.extend(list(indexList[2]))
+        v3.extend(list(indexList[3]))
+        partext = headerinfo[2]
+        if partext == "":
+            partext = ".db"
+        for i in dbfileindexList:
+            renameList.append((partdbname + "%d%s"%(i, partext),
+                dbname + "%d%s"%(numdbfile + i, ext)))
+        renameList.append((indexfile, None))
+        numdbfile += len(dbfileindexList)
+
+    if len(set(idList)) != len(idList):
+        print("Duplicated record IDs in parts of db %s"%(dbname), file=sys.stderr)
+        return 1
+
+    prev_ext = GetPublishedDBFileExtension(dbname)
+    for (src, dest) in renameList:
+        if dest != None:
+            os.replace(src, dest)
+    status = WriteDBIndex(dbname, [idList, v1, v2, v3], index_format, "", ext)
+    for (src, dest) in renameList:
+        if dest == None and os.path.exists(src):
+            os.remove(src)
+    if status == 0:
+        RemoveStaleDBFile(dbname, [ext, prev_ext])
+    for partdbname in partdbnameList:
+        RemoveStaleDBFile(partdbname, [])
+    return status
+#}}}
+def BuildDBFromFileList(dbname, pairlist, num_process=1, #{{{
+        index_format = mydb_common.FORMAT_BINARY,
+        max_dbfile_size = mydb_common.LargeFileThresholdSize):
+    """
+    Build the database from a list of (record_id, file), the file content is
+    used as the record. With num_process > 1, the list is split into parts
+    which are built in parallel processes and merged at the end.
+    Return 0 on success
+    """
+    num_process = max(1, min(num_process, len(pairlist)))
+    if num_process == 1:
+        writer = MyDBWriter(dbname, index_format, max_dbfile_size)
+        for (record_id, infile) in pairlist:
+            try:
+                with open(infile, "rb") as fpin:
+                    content = fpin.read()
+            except IOError:
+                print("Failed to read file %s"%(infile), file=sys.stderr)
+                continue
+            if writer.AddRecord(record_id, content) == 1 and writer.failure:
+                break
+        return writer.close()
+
+    chunksize = (len(pairlist) + num_process - 1) // num_process
+    taskList = []
+    for i in range(num_process):
+        partdbname = "%s.part%d"%(dbname, i)
+        taskList.append((partdbname, pairlist[i*chunksize:(i+1)*chunksize],
+            index_format, max_dbfile_size))
+    with multiprocessing.Pool(num_process) as pool:
+        resultList = pool.starmap(BuildDBPart, taskList)
+    if any(status != 0 for (partdbname, status) in resultList):
+        print("Failed to build parts of db %s"%(dbname), file=sys.stderr)
+        return 1
+    partdbnameList = [partdbname for (partdbname, status) in resultList]
+    return MergeDBPart(dbname, partdbnameList, index_format)
+#}}}
@@ -10,14 +10,18 @@
 
 import sys
 import os
+import threading
+from collections import OrderedDict
 from array import array
 from . import mybase
+from . import myfunc
 
 FORMAT_BINARY = 0
 FORMAT_TEXT = 1
 TYPE_DICT = 0
 TYPE_LIST = 1
 LargeFileThresholdSize = 1.5*1024*1024*1024
+MAX_NUM_DBFILE = 256 # the dbfile index is stored as unsigned char
 version = "1.4"
 
 def GetIndexFileHeaderText(headerinfo):#{{{
@@ -72,7 +76,7 @@ def WriteIndexHeader(indexFileHeaderText, formatindex, fpindex):#{{{
         for s in indexFileHeaderText:
             print(s, file=fpindex)
     else:
-        dumpedtext='\n'.join(s for s in indexFileHeaderText)
+        dumpedtext='\n'.join(s for s in indexFileHeaderText).encode('utf-8')
         vI = array('I')
         vI.append(len(dumpedtext))
         vI.tofile(fpindex)
@@ -96,14 +100,14 @@ def WriteIndexContent(indexList, formatindex, fpindex):#{{{
         numRecord = len(indexList[0])
 
         idList = indexList[0]
-        v1 = indexList[1]
-        v3 = indexList[3]
+        v1 = array('B', indexList[1])
+        v3 = array('I', indexList[3])
         if maxOffset > LargeFileThresholdSize:
-            v2 = indexList[2]
+            v2 = array('L', indexList[2])
         else: #'I'
-            v2 = array('I', [x for x in indexList[2]])
+            v2 = array('I', indexList[2])
 
-        dumpedliststr = '\n'.join(s for s in idList)
+        dumpedliststr = '\n'.join(s for s in idList).encode('utf-8')
 
         vI=array('I')
         vI.append(len(dumpedliststr))
@@ -118,6 +122,37 @@ def WriteIndexContent(indexList, formatindex, fpindex):#{{{
         v2.tofile(fpindex)
         v3.tofile(fpindex)
 #}}}
+def ReadIndexHeader(indexfile, formatindex):#{{{
+    """
+    Read only the header of the index file
+    return headerinfo = (dbname, version, ext, prefix) or None if failed
+    """
+    headerDict = {}
+    try:
+        if formatindex == FORMAT_BINARY:
+            with open(indexfile, "rb") as fpin:
+                vI = array('I')
+                vI.fromfile(fpin,1)
+                lines = fpin.read(vI[0]).decode('utf-8').split("\n")
+        else:
+            lines = []
+            with open(indexfile, "r") as fpin:
+                for line in fpin:
+                    if line.startswith("DEF_") or line.startswith("#"):
+                        lines.append(line)
+                    elif line.strip() != "":
+                        break
+    except (IOError, EOFError):
+        msg = "Failed to read index file {} in function {}"
+        print(msg.format(indexfile, sys._getframe().f_code.co_name), file=sys.stderr)
+        return None
+    for line in lines:
+        ss = line.split()
+        if len(ss) >= 2 and ss[0].startswith("DEF_"):
+            headerDict[ss[0]] = ss[1]
+    return (headerDict.get("DEF_DBNAME", ""), headerDict.get("DEF_VERSION", ""),
+            headerDict.get("DEF_EXTENSION", ""), headerDict.get("DEF_PREFIX", ""))
+#}}}
 def ReadIndex_binary(indexfile, isPrintWarning = False):#{{{
     """
     Read the index file of the binary format
@@ -132,7 +167,7 @@ def ReadIndex_binary(indexfile, isPrintWarning = False):#{{{
         vI = array('I')
         vI.fromfile(fpin,1)
         cntReadByte += vI.itemsize
-        dumpedtext = fpin.read(vI[0])
+        dumpedtext = fpin.read(vI[0]).decode('utf-8')
         cntReadByte += vI[0]
 
         strs = dumpedtext.split("\n")
@@ -170,10 +205,15 @@ def ReadIndex_binary(indexfile, isPrintWarning = False):#{{{
         headerinfo = (origdbname, origversion, origext, origprefix)
         #read in other information
         vI = array('I')
-        vI.fromfile(fpin,1)
+        try:
+            vI.fromfile(fpin,1)
+        except EOFError:
+            # only the header is written for an empty database
+            fpin.close()
+            return ([[], array('B'), array('L'), array('I')], headerinfo, [])
         cntReadByte += vI.itemsize
 
-        dumpedidlist=fpin.read(vI[0])
+        dumpedidlist=fpin.read(vI[0]).decode('utf-8')
         cntReadByte += vI[0]
 
         idlist = dumpedidlist.split("\n")
@@ -207,7 +247,7 @@ def ReadIndex_binary(indexfile, isPrintWarning = False):#{{{
             indexList.append(vIarray[i])
         fpin.close()
         return (indexList, headerinfo, dbfileindexList)
-    except IOError:
+    except (IOError, EOFError):
         msg = "Failed to read index file {} in function {}"
         print(msg.format(indexfile, sys._getframe().f_code.co_name), file=sys.stderr)
         return (None, None, None)
@@ -233,7 +273,7 @@ def ReadIndex_text(indexfile, isPrintWarning = False):#{{{
     origprefix=""
     try:
 
-        hdl = mybase.ReadLineByBlock(indexfile)
+        hdl = myfunc.ReadLineByBlock(indexfile)
         lines = hdl.readlines()
         while lines != None:
             for line in lines:
@@ -267,8 +307,11 @@ def ReadIndex_text(indexfile, isPrintWarning = False):#{{{
         headerinfo = (origdbname, origversion, origext, origprefix)
 
         numRecord = len(idList)
-        lastDBFileIndex = v1[numRecord-1]
-        dbfileindexList = list(range(lastDBFileIndex+1))
+        if numRecord > 0:
+            lastDBFileIndex = v1[numRecord-1]
+            dbfileindexList = list(range(lastDBFileIndex+1))
+        else:
+            dbfileindexList = []
 
         if isPrintWarning:
             if origversion == "":
@@ -286,3 +329,64 @@ def ReadIndex_text(indexfile, isPrintWarning = False):#{{{
         print(msg.format(indexfile, sys._getframe().f_code.co_name), file=sys.stderr)
         return (None, None, None)
 #}}}
+class RecordCache: #{{{
+# Description:
+#   A least recently used cache for the records of MyDB. The cache is bounded
+#   by the total size of the cached records in bytes, str records are
+#   counted by the size of their UTF-8 encoding as stored in the dbfiles.
+#   The cache is safe to be shared by threads in the same process
+#
+# Functions:
+#     Get(key)         : return the cached record or None
+#     Put(key, record) : add the record to the cache
+#     GetStat()        : return a dict with hit, miss, eviction and size
+
+    def __init__(self, maxsize):#{{{
+        self.maxsize = maxsize
+        self.size = 0
+        self.hit = 0
+        self.miss = 0
+        self.eviction = 0
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+#}}}
+    def Get(self, key):#{{{
+        with self.lock:
+            try:
+                (record, recordsize) = self.cache[key]
+            except KeyError:
+                self.miss += 1
+                return None
+            self.cache.move_to_end(key)
+            self.hit += 1
+            return record
+#}}}
+    def Put(self, key, record):#{{{
+        if isinstance(record, str):
+            recordsize = len(record.encode('utf-8'))
+        else:
+            recordsize = len(record)
+        if recordsize > self.maxsize:
+            return
+        with self.lock:
+            if key in self.cache:
+                self.size -= self.cache.pop(key)[1]
+            self.cache[key] = (record, recordsize)
+            self.size += recordsize
+            while self.size > self.maxsize:
+                (k, v) = self.cache.popitem(last=False)
+                self.size -= v[1]
+                self.eviction += 1
+#}}}
+    def Clear(self):#{{{
+        with self.lock:
+            self.cache.clear()
+            self.size = 0
+#}}}
+    def GetStat(self):#{{{
+        with self.lock:
+            return {'hit': self.hit, 'miss': self.miss,
+                    'eviction': self.eviction, 'size': self.size,
+                    'maxsize': self.maxsize, 'numrecord': len(self.cache)}
+#}}}
+#}}}
@@ -12,15 +12,19 @@ Address: Science for Life Laboratory Stockholm, Box 1031, 17121 Solna, Sweden
 import os
 from . import myfunc
 from . import webserver_common as webcom
+from . import executor
+from . import metrics
+from . import trace
+from . import logsink
 import math
 import random
 import time
 from datetime import datetime
 # from pytz import timezone
 import shutil
-from suds.client import Client
 import json
 import hashlib
+import concurrent.futures
 from .timeit import timeit
 
 
@@ -42,30 +46,14 @@ def RunStatistics(g_params):  # {{{
     name_server = g_params['name_server']
     webcom.loginfo(f"Run server statistics..", g_params['gen_logfile'])
     if 'RUN_STATISTICS_IN_QD' in g_params and g_params['RUN_STATISTICS_IN_QD']:
-        cmd = ["python", py_scriptfile, "-i", jsonfile]
-        webcom.RunCmd(cmd, logfile, errfile)
-    elif not os.path.exists(lock_file):
-        bash_scriptfile = f"{path_tmp}/{bsname}-{name_server}.sh"
-        code_str_list = []
-        code_str_list.append("#!/bin/bash")
-        cmdline = f"python {py_scriptfile} -i {jsonfile}"
-        code_str_list.append(cmdline)
-        code = "\n".join(code_str_list)
-        myfunc.WriteFile(code, bash_scriptfile, mode="w", isFlush=True)
-        os.chmod(bash_scriptfile, 0o755)
-        os.chdir(path_tmp)
-        cmd = ['sbatch', bash_scriptfile]
-        cmdline = " ".join(cmd)
-        verbose = False
-        if 'DEBUG' in g_params and g_params['DEBUG']:
-            verbose = True
-            webcom.loginfo(f"Run cmdline: {cmdline}", logfile)
-        (isSubmitSuccess, t_runtime) = webcom.RunCmd(cmd,
-                                                     logfile,
-                                                     errfile,
-                                                     verbose)
-        if 'DEBUG' in g_params and g_params['DEBUG']:
-            webcom.loginfo("isSubmitSuccess: {isSubmitSuccess}", logfile)
+        backend = executor.GetBackend(g_params, bsname, "subprocess")
+    else:
+        backend = executor.GetBackend(g_params, bsname, "slurm")
+    argv = [py_scriptfile, "-i", jsonfile]
+    bash_scriptfile = f"{path_tmp}/{bsname}-{name_server}.sh"
+    if backend in ["inline", "subprocess"] or not os.path.exists(lock_file):
+        executor.RunScript(bsname, argv, backend, g_params, logfile, errfile,
+                           bash_scriptfile=bash_scriptfile)
 # }}}
 
 
@@ -75,6 +63,12 @@ def CreateRunJoblog(loop, isOldRstdirDeleted, g_params):#{{{
     """
     gen_logfile = g_params['gen_logfile']
     name_server = g_params['name_server']
+    metrics.ConfigureFromParams(g_params)
+    trace.ConfigureFromParams(g_params)
+    trace.SetLoop(loop)
+    # write the logs of the previous loop
+    logsink.ConfigureFromParams(g_params)
+    logsink.Flush()
 
     webcom.loginfo("CreateRunJoblog for server %s..."%(name_server), gen_logfile)
 
@@ -103,6 +97,7 @@ def CreateRunJoblog(loop, isOldRstdirDeleted, g_params):#{{{
     # deleted jobs will not be included, there is a separate list started with
     # all_xxx which keeps also the historical jobs
     new_finished_list = []  # Finished or Failed
+    new_expiry_list = [] # (jobid, finish_date_str) of newly finished jobs
     new_submitted_list = []
 
     new_runjob_list = []    # Running
@@ -165,6 +160,7 @@ def CreateRunJoblog(loop, isOldRstdirDeleted, g_params):#{{{
 
             if status in ["Finished", "Failed"]:
                 new_finished_list.append(li)
+                new_expiry_list.append((jobid, finish_date_str))
 
             isValidSubmitDate = True
             try:
@@ -195,10 +191,10 @@ def CreateRunJoblog(loop, isOldRstdirDeleted, g_params):#{{{
     li_str = []
     for li in new_submitted_list:
         li_str.append(li[1])
+    content_submitted = ""
     if len(li_str)>0:
-        myfunc.WriteFile("\n".join(li_str)+"\n", submitjoblogfile, "w", True)
-    else:
-        myfunc.WriteFile("", submitjoblogfile, "w", True)
+        content_submitted = "\n".join(li_str)+"\n"
+    myfunc.WriteFile(content_submitted, submitjoblogfile, "w", True)
 
 # rewrite logs of finished jobs
     li_str = []
@@ -209,24 +205,12 @@ def CreateRunJoblog(loop, isOldRstdirDeleted, g_params):#{{{
         myfunc.WriteFile("\n".join(li_str)+"\n", finishedjoblogfile, "w", True)
     else:
         myfunc.WriteFile("", finishedjoblogfile, "w", True)
-# rewrite logs of finished jobs for each IP
-    new_finished_dict = {}
-    for li in new_finished_list:
-        ip = li[3]
-        if not ip in new_finished_dict:
-            new_finished_dict[ip] = []
-        new_finished_dict[ip].append(li)
-    for ip in new_finished_dict:
-        finished_list_for_this_ip = new_finished_dict[ip]
-        divide_finishedjoblogfile = "%s/divided/%s_finished_job.log"%(path_log, ip)
-        li_str = []
-        for li in finished_list_for_this_ip:
-            li = [str(x) for x in li]
-            li_str.append("\t".join(li))
-        if len(li_str)>0:
-            myfunc.WriteFile("\n".join(li_str)+"\n", divide_finishedjoblogfile, "w", True)
-        else:
-            myfunc.WriteFile("", divide_finishedjoblogfile, "w", True)
+# update the divided store, which serves the views of the jobs for each IP
+    webcom.UpdateDividedStore(path_log, new_submitted_list, new_finished_list,
+            len(content_submitted.encode('utf-8')))
+
+# add newly finished jobs to the index used by webcom.DeleteOldResult
+    webcom.AddJobToExpiryIndex(path_log, new_expiry_list)
 
 # update allfinished jobs
     allfinishedjoblogfile = "%s/all_finished_job.log"%(path_log)
@@ -260,6 +244,7 @@ def CreateRunJoblog(loop, isOldRstdirDeleted, g_params):#{{{
 # now append numseq_this_user and priority score to new_waitjob_list and
 # new_runjob_list
 
+    reconcile_job_list = []
     for joblist in [new_waitjob_list, new_runjob_list]:
         for li in joblist:
             jobid = li[0]
@@ -273,52 +258,8 @@ def CreateRunJoblog(loop, isOldRstdirDeleted, g_params):#{{{
             runjob_lockfile = "%s/%s.lock"%(rstdir, "runjob.lock")
             if 'DEBUG' in g_params and g_params['DEBUG'] and os.path.exists(runjob_lockfile):
                 webcom.loginfo("runjob_lockfile %s exists. "%(runjob_lockfile), gen_logfile)
-            if loop == 0 and os.path.exists(outpath_result) and not os.path.exists(runjob_lockfile):#{{{
-                finished_seq_file = "%s/finished_seqs.txt"%(outpath_result)
-                finished_idx_file = "%s/finished_seqindex.txt"%(rstdir)
-                finished_idx_set = set([])
-
-                finished_seqs_idlist = []
-                if os.path.exists(finished_seq_file):
-                    finished_seqs_idlist = myfunc.ReadIDList2(finished_seq_file, col=0, delim="\t")
-                finished_seqs_idset = set(finished_seqs_idlist)
-                finished_info_list = []
-                queryfile = "%s/query.fa"%(rstdir)
-                (seqIDList, seqAnnoList, seqList) = myfunc.ReadFasta(queryfile)
-                try:
-                    dirlist = os.listdir(outpath_result)
-                except Exception as e:
-                    webcom.loginfo("Failed to os.listdir(%s) with errmsg=%s"%(outpath_result, str(e)), gen_logfile)
-                for dd in dirlist:
-                    if dd.find("seq_") == 0:
-                        origIndex_str = dd.split("_")[1]
-                        finished_idx_set.add(origIndex_str)
-
-                    if dd.find("seq_") == 0 and dd not in finished_seqs_idset:
-                        origIndex = int(dd.split("_")[1])
-                        outpath_this_seq = "%s/%s"%(outpath_result, dd)
-                        timefile = "%s/time.txt"%(outpath_this_seq)
-                        runtime = webcom.ReadRuntimeFromFile(timefile, default_runtime=0.0)
-                        # get origIndex and then read description the description list
-                        try:
-                            description = seqAnnoList[origIndex].replace('\t', ' ')
-                        except:
-                            description = "seq_%d"%(origIndex)
-                        try:
-                            seq = seqList[origIndex]
-                        except:
-                            seq = ""
-                        info_finish = webcom.GetInfoFinish(name_server, outpath_this_seq,
-                                origIndex, len(seq), description,
-                                source_result="newrun", runtime=runtime)
-                        finished_info_list.append("\t".join(info_finish))
-                if len(finished_info_list)>0:
-                    myfunc.WriteFile("\n".join(finished_info_list)+"\n", finished_seq_file, "a", True)
-                if len(finished_idx_set) > 0:
-                    myfunc.WriteFile("\n".join(list(finished_idx_set))+"\n", finished_idx_file, "w", True)
-                else:
-                    myfunc.WriteFile("", finished_idx_file, "w", True)
-            #}}}
+            if loop == 0 and os.path.exists(outpath_result) and not os.path.exists(runjob_lockfile):
+                reconcile_job_list.append(jobid)
 
             try:
                 numseq = int(li[5])
@@ -346,9 +287,19 @@ def CreateRunJoblog(loop, isOldRstdirDeleted, g_params):#{{{
             li.append(numseq_this_user) # 12th field
             li.append(priority)         # 13th field
 
+    if len(reconcile_job_list) > 0:
+        ReconcileFinishedSeqsAllJobs(reconcile_job_list, g_params)
+
     # sort the new_waitjob_list in descending order by priority
     new_waitjob_list = sorted(new_waitjob_list, key=lambda x: x[12], reverse=True)
     new_runjob_list = sorted(new_runjob_list, key=lambda x: x[12], reverse=True)
+    # rotate the per-job logs of the running jobs if they are too big
+    webcom.RotateJobLogFile([os.path.join(path_result, li[0]) for li in
+        new_runjob_list], g_params)
+
+    trace.SetAttr(loop=loop, num_submitted=len(new_submitted_list),
+            num_finished=len(new_finished_list), num_run=len(new_runjob_list),
+            num_wait=len(new_waitjob_list))
 
     # write to runjoblogfile
     li_str = []
@@ -366,18 +317,154 @@ def CreateRunJoblog(loop, isOldRstdirDeleted, g_params):#{{{
 # }}}
 
 
+def GetReconcileManifest(rstdir, jobid):  # {{{
+    """Return the state of the result folder of a job that decides whether
+    finished_seqs.txt needs to be reconciled with the seq_* folders
+    """
+    outpath_result = "%s/%s"%(rstdir, jobid)
+    manifest = {}
+    for (key, path) in [
+            ('mtime_outpath_result', outpath_result),
+            ('size_finished_seq_file', "%s/finished_seqs.txt"%(outpath_result)),
+            ('size_finished_idx_file', "%s/finished_seqindex.txt"%(rstdir))]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            manifest[key] = -1
+            continue
+        if key.startswith('mtime'):
+            manifest[key] = st.st_mtime_ns
+        else:
+            manifest[key] = st.st_size
+    return manifest
+# }}}
+
+
+def ReconcileFinishedSeqs(rstdir, jobid, name_server):  # {{{
+    """Add the seq_* folders in the result folder which are not yet in
+    finished_seqs.txt and rewrite finished_seqindex.txt. The job is skipped
+    if the result folder is unchanged since the last reconciliation
+    according to the manifest file.
+    Return (jobid, number of added seqs, errmsg), the number is -1 if the
+    job is skipped
+    """
+    outpath_result = "%s/%s"%(rstdir, jobid)
+    manifestfile = "%s/finished_seqs.manifest.json"%(rstdir)
+    manifest = GetReconcileManifest(rstdir, jobid)
+    if manifest == webcom.LoadJsonFromFile(manifestfile):
+        return (jobid, -1, "")
+
+    finished_seq_file = "%s/finished_seqs.txt"%(outpath_result)
+    finished_idx_file = "%s/finished_seqindex.txt"%(rstdir)
+    try:
+        dirlist = os.listdir(outpath_result)
+    except Exception as e:
+        msg = "Failed to os.listdir(%s) with errmsg=%s"%(outpath_result, str(e))
+        return (jobid, 0, msg)
+
+    finished_seqs_idset = set([])
+    if os.path.exists(finished_seq_file):
+        finished_seqs_idset = set(myfunc.ReadIDList2(finished_seq_file, col=0, delim="\t"))
+    finishedIndexList = []
+    newIndexList = []
+    for dd in dirlist:
+        if dd.find("seq_") == 0:
+            try:
+                origIndex = int(dd.split("_")[1])
+            except ValueError:
+                continue
+            finishedIndexList.append(origIndex)
+            if dd not in finished_seqs_idset:
+                newIndexList.append(origIndex)
+    finished_idx_set = myfunc.RangeSet(finishedIndexList)
+
+    finished_info_list = []
+    if len(newIndexList) > 0:
+        # query.fa is read only when there are seqs to add
+        queryfile = "%s/query.fa"%(rstdir)
+        (seqIDList, seqAnnoList, seqList) = myfunc.ReadFasta(queryfile)
+        for origIndex in newIndexList:
+            outpath_this_seq = "%s/seq_%d"%(outpath_result, origIndex)
+            timefile = "%s/time.txt"%(outpath_this_seq)
+            runtime = webcom.ReadRuntimeFromFile(timefile, default_runtime=0.0)
+            # get origIndex and then read description the description list
+            try:
+                description = seqAnnoList[origIndex].replace('\t', ' ')
+            except:
+                description = "seq_%d"%(origIndex)
+            try:
+                seq = seqList[origIndex]
+            except:
+                seq = ""
+            info_finish = webcom.GetInfoFinish(name_server, outpath_this_seq,
+                    origIndex, len(seq), description,
+                    source_result="newrun", runtime=runtime)
+            finished_info_list.append("\t".join(info_finish))
+    if len(finished_info_list)>0:
+        webcom.WriteFinishedSeqInfo(finished_info_list, finished_seq_file)
+    if finished_idx_set != myfunc.ReadRangeSet(finished_idx_file):
+        myfunc.WriteRangeSet(finished_idx_set, finished_idx_file, "w")
+
+    content = json.dumps(GetReconcileManifest(rstdir, jobid))
+    myfunc.WriteFile(content, manifestfile, "w", True)
+    return (jobid, len(finished_info_list), "")
+# }}}
+
+
+@timeit
+def ReconcileFinishedSeqsAllJobs(jobidList, g_params):  # {{{
+    """Reconcile finished_seqs.txt for a list of jobs in a process pool with
+    g_params['NUM_PROCESS_RECONCILE'] processes (default 4)
+    """
+    gen_logfile = g_params['gen_logfile']
+    name_server = g_params['name_server']
+    path_result = os.path.join(g_params['path_static'], 'result')
+    num_process = g_params.get('NUM_PROCESS_RECONCILE', 4)
+    taskList = [(os.path.join(path_result, jobid), jobid, name_server)
+            for jobid in jobidList]
+    resultList = []
+    if num_process <= 1 or len(taskList) <= 1:
+        for task in taskList:
+            resultList.append(ReconcileFinishedSeqs(*task))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_process) as executor:
+            futureList = [executor.submit(ReconcileFinishedSeqs, *task)
+                    for task in taskList]
+            for i in range(len(futureList)):
+                try:
+                    resultList.append(futureList[i].result())
+                except Exception as e:
+                    resultList.append((taskList[i][1], 0, str(e)))
+
+    cnt_skip = 0
+    for (jobid, num_added, errmsg) in resultList:
+        if errmsg != "":
+            webcom.loginfo("Failed to reconcile finished_seqs.txt for %s with errmsg=%s"%(jobid, errmsg), gen_logfile)
+        elif num_added == -1:
+            cnt_skip += 1
+        elif 'DEBUG' in g_params and g_params['DEBUG']:
+            webcom.loginfo("Reconcile finished_seqs.txt for %s, %d seqs added"%(jobid, num_added), gen_logfile)
+    webcom.loginfo("Reconcile finished_seqs.txt for %d jobs, %d unchanged jobs skipped"%(
+        len(resultList), cnt_skip), gen_logfile)
+# }}}
+
+
 @timeit
 def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
     """Submit a job to the remote computational node
     """
+    from suds.client import Client
 # for each job rstdir, keep three log files,
 # 1.seqs finished, finished_seq log keeps all information, finished_index_log
-#   can be very compact to speed up reading, e.g.
-#   1-5 7-9 etc
+#   (and failed_index_log) are range-encoded, one range per line, e.g.
+#   1-5
+#   7-9
+#   read by myfunc.ReadRangeSet, appended ranges are merged when read
 # 2.seqs queued remotely , format:
 #       index node remote_jobid
 # 3. format of the torun_idx_file
-#    origIndex
+#    origIndex or origIndex range in the order to run, read by
+#    myfunc.ReadIndexList
     gen_logfile = g_params['gen_logfile']
     # gen_errfile = g_params['gen_errfile']
     name_server = g_params['name_server']
@@ -422,24 +509,15 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
     else:
         isForceRun = False
 
-    finished_idx_list = []
-    failed_idx_list = []    # [origIndex]
-    if os.path.exists(finished_idx_file):
-        finished_idx_list = list(set(myfunc.ReadIDList(finished_idx_file)))
-    if os.path.exists(failed_idx_file):
-        failed_idx_list = list(set(myfunc.ReadIDList(failed_idx_file)))
-
-    processed_idx_set = set(finished_idx_list) | set(failed_idx_list)
-
-    jobinfofile = "%s/jobinfo"%(rstdir)
-    jobinfo = ""
-    if os.path.exists(jobinfofile):
-        jobinfo = myfunc.ReadFile(jobinfofile).strip()
-    jobinfolist = jobinfo.split("\t")
+    finished_idx_set = myfunc.ReadRangeSet(finished_idx_file)
+    failed_idx_set = myfunc.ReadRangeSet(failed_idx_file)
+    processed_idx_set = finished_idx_set | failed_idx_set
+
+    summary = webcom.GetJobSummary(rstdir)
     email = ""
-    if len(jobinfolist) >= 8:
-        email = jobinfolist[6]
-        method_submission = jobinfolist[7]
+    if summary.isJobInfoValid:
+        email = summary.email
+        method_submission = summary.method_submission
 
     # the first time when the this jobid is processed, do the following
     # 1. generate a file with sorted seqindex
@@ -465,8 +543,6 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
             webcom.loginfo(msg, gen_logfile)
 
         if not isCacheProcessingFinished:
-            finished_idx_set = set(finished_idx_list)
-
             lastprocessed_idx = -1
             if os.path.exists(lastprocessed_cache_idx_file):
                 try:
@@ -475,6 +551,7 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
                     lastprocessed_idx = -1
 
             cnt_processed_cache = 0
+            li_cache_hit = [] # md5 of the cache hits, to refresh the access time
             for i in range(lastprocessed_idx+1, len(seqIDList)):
                 if i in finished_idx_set:
                     continue
@@ -486,6 +563,7 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
                 zipfile_cache = cachedir + ".zip"
 
                 if os.path.exists(cachedir) or os.path.exists(zipfile_cache):
+                    li_cache_hit.append(md5_key)
                     if os.path.exists(cachedir):
                         try:
                             shutil.copytree(cachedir, outpath_this_seq)
@@ -511,18 +589,22 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
 
                         info_finish = webcom.GetInfoFinish(name_server, outpath_this_seq,
                                 i, len(seqList[i]), seqAnnoList[i], source_result="cached", runtime=0.0)
-                        myfunc.WriteFile("\t".join(info_finish)+"\n",
-                                finished_seq_file, "a", isFlush=True)
+                        webcom.WriteFinishedSeqInfo(["\t".join(info_finish)],
+                                finished_seq_file)
                         myfunc.WriteFile("%d\n"%(i), finished_idx_file, "a", True)
 
                     if 'DEBUG' in g_params and g_params['DEBUG']:
                         webcom.loginfo("Get result from cache for seq_%d"%(i), gen_logfile)
                     if cnt_processed_cache+1 >= g_params['MAX_CACHE_PROCESS']:
                         myfunc.WriteFile(str(i), lastprocessed_cache_idx_file, "w", True)
+                        webcom.UpdateCacheAccessToDB(li_cache_hit, g_params['finished_date_db'])
+                        trace.SetAttr(numseq=len(seqIDList), cache_hit=len(li_cache_hit))
                         return 0
                     cnt_processed_cache += 1
 
+            webcom.UpdateCacheAccessToDB(li_cache_hit, g_params['finished_date_db'])
             webcom.WriteDateTimeTagFile(cache_process_finish_tagfile, runjob_logfile, runjob_errfile)
+            trace.SetAttr(numseq=len(seqIDList), cache_hit=len(li_cache_hit))
 
         # Regenerate toRunDict
         toRunDict = {}
@@ -538,16 +620,13 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
         if not os.path.exists(split_seq_dir):
             os.mkdir(split_seq_dir)
 
-        torun_index_str_list = [str(x[0]) for x in sortedlist]
-        if len(torun_index_str_list)>0:
-            myfunc.WriteFile("\n".join(torun_index_str_list)+"\n", torun_idx_file, "w", True)
-        else:
-            myfunc.WriteFile("", torun_idx_file, "w", True)
+        torun_index_list = [x[0] for x in sortedlist]
+        myfunc.WriteIndexList(torun_index_list, torun_idx_file, "w")
 
         # write cnttry file for each jobs to run
         cntTryDict = {}
-        for idx in torun_index_str_list:
-            cntTryDict[int(idx)] = 0
+        for idx in torun_index_list:
+            cntTryDict[idx] = 0
         json.dump(cntTryDict, open(cnttry_idx_file, "w"))
 
         for item in sortedlist:
@@ -564,13 +643,10 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
 
 
     # 3. try to submit the job 
-    toRunIndexList = [] # index in str
     processedIndexSet = set([]) #seq index set that are already processed
     submitted_loginfo_list = []
-    if os.path.exists(torun_idx_file):
-        toRunIndexList = myfunc.ReadIDList(torun_idx_file)
-        # unique the list but keep the order
-        toRunIndexList = myfunc.uniquelist(toRunIndexList)
+    # ordered and unique list of seq index in int
+    toRunIndexList = myfunc.ReadIndexList(torun_idx_file)
     if len(toRunIndexList) > 0:
         iToRun = 0
         numToRun = len(toRunIndexList)
@@ -589,7 +665,8 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
                 break
             wsdl_url = "http://%s/pred/api_submitseq/?wsdl"%(node)
             try:
-                myclient = Client(wsdl_url, cache=None, timeout=30)
+                with trace.Span("soap.Client", node=node):
+                    myclient = Client(wsdl_url, cache=None, timeout=30)
             except Exception as e:
                 webcom.loginfo(f"Failed to access {wsdl_url}, detailed error: {e}", gen_logfile)
                 cntSubmitJobDict[node][3] = "OFF"
@@ -600,7 +677,7 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
             [cnt, maxnum, queue_method, node_status] = cntSubmitJobDict[node]
             cnttry = 0
             while cnt < maxnum and iToRun < numToRun:
-                origIndex = int(toRunIndexList[iToRun])
+                origIndex = toRunIndexList[iToRun]
                 seqfile_this_seq = "%s/%s"%(split_seq_dir, "query_%d.fa"%(origIndex))
                 # ignore already existing query seq, this is an ugly solution,
                 # the generation of torunindexlist has a bug
@@ -647,10 +724,11 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
                     else:
                         useemail = email
                     try:
-                        myfunc.WriteFile("\tSubmitting seq %4d "%(origIndex),
-                                gen_logfile, "a", True)
-                        rtValue = myclient.service.submitjob_remote(fastaseq, para_str,
-                                jobname, useemail, str(numseq_this_user), str(isForceRun))
+                        webcom.logwrite("\tSubmitting seq %4d "%(origIndex),
+                                gen_logfile)
+                        with trace.Span("soap.submitjob_remote", node=node):
+                            rtValue = myclient.service.submitjob_remote(fastaseq, para_str,
+                                    jobname, useemail, str(numseq_this_user), str(isForceRun))
                     except Exception as e:
                         webcom.loginfo("Failed to run myclient.service.submitjob_remote with errmsg=%s"%(str(e)), gen_logfile)
                         rtValue = []
@@ -679,13 +757,13 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
 
                 if isSubmitSuccess:
                     cnt += 1
-                    myfunc.WriteFile(" succeeded on node %s\n"%(node), gen_logfile, "a", True)
+                    webcom.logwrite(" succeeded on node %s\n"%(node), gen_logfile)
                 else:
-                    myfunc.WriteFile(" failed on node %s\n"%(node), gen_logfile, "a", True)
+                    webcom.logwrite(" failed on node %s\n"%(node), gen_logfile)
 
                 if isSubmitSuccess or cnttry >= g_params['MAX_SUBMIT_TRY']:
                     iToRun += 1
-                    processedIndexSet.add(str(origIndex))
+                    processedIndexSet.add(origIndex)
                     if 'DEBUG' in g_params and g_params['DEBUG']:
                         webcom.loginfo(f"DEBUG: jobid {jobid} processedIndexSet.add({origIndex})", gen_logfile)
             # update cntSubmitJobDict for this node
@@ -696,18 +774,16 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
         webcom.loginfo(f"DEBUG: len(submitted_loginfo_list)={len(submitted_loginfo_list)}", gen_logfile)
     if len(submitted_loginfo_list)>0:
         myfunc.WriteFile("\n".join(submitted_loginfo_list)+"\n", remotequeue_idx_file, "a", True)
+    trace.SetAttr(numseq_submitted=len(submitted_loginfo_list))
     # update torun_idx_file
     newToRunIndexList = []
     for idx in toRunIndexList:
         if not idx in processedIndexSet:
             newToRunIndexList.append(idx)
     if 'DEBUG' in g_params and g_params['DEBUG']:
-        webcom.loginfo("DEBUG: jobid %s, newToRunIndexList="%(jobid) + " ".join( newToRunIndexList), gen_logfile)
+        webcom.loginfo("DEBUG: jobid %s, newToRunIndexList="%(jobid) + " ".join([str(x) for x in newToRunIndexList]), gen_logfile)
 
-    if len(newToRunIndexList)>0:
-        myfunc.WriteFile("\n".join(newToRunIndexList)+"\n", torun_idx_file, "w", True)
-    else:
-        myfunc.WriteFile("", torun_idx_file, "w", True)
+    myfunc.WriteIndexList(newToRunIndexList, torun_idx_file, "w")
 
     return 0
 # }}}
@@ -717,6 +793,7 @@ def SubmitJob(jobid, cntSubmitJobDict, numseq_this_user, g_params):  # {{{
 def GetResult(jobid, g_params):  # {{{
     """Get the result from the remote computational node for a job
     """
+    from suds.client import Client
     # retrieving result from the remote server for this job
     gen_logfile = g_params['gen_logfile']
     gen_errfile = g_params['gen_errfile']
@@ -765,6 +842,7 @@ def GetResult(jobid, g_params):  # {{{
     failed_idx_list = []    # [origIndex]
     resubmit_idx_list = []  # [origIndex]
     keep_queueline_list = []  # [line] still in queue
+    bytes_fetched = 0 # size of the fetched result zip files
 
     cntTryDict = {}
     if os.path.exists(cnttry_idx_file):
@@ -783,36 +861,26 @@ def GetResult(jobid, g_params):  # {{{
             pass
     if ((not os.path.exists(remotequeue_idx_file) or  # {{{
         os.path.getsize(remotequeue_idx_file) < 1)):
-        idlist1 = []
-        idlist2 = []
-        if os.path.exists(finished_idx_file):
-           idlist1 = myfunc.ReadIDList(finished_idx_file)
-        if os.path.exists(failed_idx_file):
-           idlist2 = myfunc.ReadIDList(failed_idx_file)
+        finished_idx_set = myfunc.ReadRangeSet(finished_idx_file)
+        failed_idx_set = myfunc.ReadRangeSet(failed_idx_file)
+        completed_idx_set = finished_idx_set | failed_idx_set
 
-        completed_idx_set = set(idlist1 + idlist2)
-
-        jobinfofile = os.path.join(rstdir, "jobinfo")
-        jobinfo = myfunc.ReadFile(jobinfofile).strip()
-        jobinfolist = jobinfo.split("\t")
-        if len(jobinfolist) >= 8:
-            numseq = int(jobinfolist[3])
+        numseq = webcom.GetJobSummary(rstdir).numseq
 
         if 'DEBUG' in g_params and g_params['DEBUG']:
-            webcom.loginfo(f"DEBUG: len(completed_idx_set)={len(idlist1)}+{len(idlist2)}={len(completed_idx_set)}, numseq={numseq}", gen_logfile)
+            webcom.loginfo(f"DEBUG: len(completed_idx_set)={len(finished_idx_set)}+{len(failed_idx_set)}>={len(completed_idx_set)}, numseq={numseq}", gen_logfile)
 
         if len(completed_idx_set) < numseq:
-            all_idx_list = [str(x) for x in range(numseq)]
-            torun_idx_str_list = list(set(all_idx_list)-completed_idx_set)
-            for idx in torun_idx_str_list:
+            torun_idx_set = myfunc.RangeSet.FromRange(numseq) - completed_idx_set
+            for idx in torun_idx_set:
                 try:
-                    cntTryDict[int(idx)] += 1
+                    cntTryDict[idx] += 1
                 except (ValueError, IndexError, KeyError):
-                    cntTryDict[int(idx)] = 1
-            myfunc.WriteFile("\n".join(torun_idx_str_list)+"\n", torun_idx_file, "w", True)
+                    cntTryDict[idx] = 1
+            myfunc.WriteRangeSet(torun_idx_set, torun_idx_file, "w")
 
             if 'DEBUG' in g_params and g_params['DEBUG']:
-                webcom.loginfo(f"recreate torun_idx_file: jobid = {jobid}, numseq={numseq}, len(completed_idx_set)={len(completed_idx_set)}, len(torun_idx_str_list)={len(torun_idx_str_list)}", gen_logfile)
+                webcom.loginfo(f"recreate torun_idx_file: jobid = {jobid}, numseq={numseq}, len(completed_idx_set)={len(completed_idx_set)}, len(torun_idx_set)={len(torun_idx_set)}", gen_logfile)
         else:
             myfunc.WriteFile("", torun_idx_file, "w", True)
     else:
@@ -842,7 +910,8 @@ def GetResult(jobid, g_params):  # {{{
     for node in nodeSet:
         wsdl_url = f"http://{node}/pred/api_submitseq/?wsdl"
         try:
-            myclient = Client(wsdl_url, cache=None, timeout=30)
+            with trace.Span("soap.Client", node=node):
+                myclient = Client(wsdl_url, cache=None, timeout=30)
             myclientDict[node] = myclient
         except Exception as e:
             webcom.loginfo(f"Failed to access {wsdl_url} with errmsg {e}", gen_logfile)
@@ -852,7 +921,7 @@ def GetResult(jobid, g_params):  # {{{
         line = lines[i]
 
         if 'DEBUG' in g_params and g_params['DEBUG']:
-            myfunc.WriteFile(f"Process {line}\n", gen_logfile, "a", True)
+            webcom.logwrite(f"Process {line}\n", gen_logfile)
         if not line or line[0] == "#":
             if 'DEBUG' in g_params and g_params['DEBUG']:
                 webcom.loginfo("DEBUG: line empty or line[0] = '#', ignore", gen_logfile)
@@ -879,7 +948,8 @@ def GetResult(jobid, g_params):  # {{{
             keep_queueline_list.append(line)
             continue
         try:
-            rtValue = myclient.service.checkjob(remote_jobid)
+            with trace.Span("soap.checkjob", node=node):
+                rtValue = myclient.service.checkjob(remote_jobid)
         except Exception as e:
             msg = "checkjob(%s) at node %s failed with errmsg %s"%(remote_jobid, node, str(e))
             webcom.loginfo(msg, gen_logfile)
@@ -906,15 +976,19 @@ def GetResult(jobid, g_params):  # {{{
                     isFinish_remote = True
                     outfile_zip = f"{tmpdir}/{remote_jobid}.zip"
                     isRetrieveSuccess = False
-                    myfunc.WriteFile("\tFetching result for %s/seq_%d from %s " % (
-                        jobid, origIndex, result_url), gen_logfile, "a", True)
+                    webcom.logwrite("\tFetching result for %s/seq_%d from %s " % (
+                        jobid, origIndex, result_url), gen_logfile)
                     if myfunc.IsURLExist(result_url, timeout=5):
                         try:
-                            myfunc.urlretrieve(result_url, outfile_zip, timeout=10)
+                            with trace.Span("fetch", node=node) as span:
+                                myfunc.urlretrieve(result_url, outfile_zip, timeout=10)
+                                size_zip_fetched = os.path.getsize(outfile_zip)
+                                span.SetAttr(bytes=size_zip_fetched)
+                            bytes_fetched += size_zip_fetched
                             isRetrieveSuccess = True
-                            myfunc.WriteFile(f" succeeded on node {node}\n", gen_logfile, "a", True)
+                            webcom.logwrite(f" succeeded on node {node}\n", gen_logfile)
                         except Exception as e:
-                            myfunc.WriteFile(" failed with %s\n"%(str(e)), gen_logfile, "a", True)
+                            webcom.logwrite(" failed with %s\n"%(str(e)), gen_logfile)
                             pass
                     if os.path.exists(outfile_zip) and isRetrieveSuccess:
                         cmd = ["unzip", outfile_zip, "-d", tmpdir]
@@ -956,7 +1030,8 @@ def GetResult(jobid, g_params):  # {{{
                             if isSuccess:
                                 # delete the data on the remote server
                                 try:
-                                    rtValue2 = myclient.service.deletejob(remote_jobid)
+                                    with trace.Span("soap.deletejob", node=node):
+                                        rtValue2 = myclient.service.deletejob(remote_jobid)
                                 except Exception as e:
                                     msg = (f"Failed to delete the job {remote_jobid} on node {node}"
                                            f" with error: {str(e)}")
@@ -1007,13 +1082,14 @@ def GetResult(jobid, g_params):  # {{{
                                 shutil.move("%s.zip"%(md5_key), "%s.zip"%(cachedir))
                                 shutil.rmtree(md5_key) # delete the temp folder named as md5 hash
                                 os.chdir(origpath)
+                                size_zip = webcom.GetCachedResultSize(md5_key, path_cache)[1]
 
                                 # Add the finished date to the database
                                 date_str = time.strftime(g_params['FORMAT_DATETIME'])
                                 MAX_TRY_INSERT_DB = 3
                                 cnttry = 0
                                 while cnttry < MAX_TRY_INSERT_DB:
-                                    t_rv = webcom.InsertFinishDateToDB(date_str, md5_key, seq, finished_date_db)
+                                    t_rv = webcom.InsertFinishDateToDB(date_str, md5_key, seq, finished_date_db, size_zip)
                                     if t_rv == 0:
                                         break
                                     cnttry += 1
@@ -1039,7 +1115,7 @@ def GetResult(jobid, g_params):  # {{{
                     origIndex, len(seq), description,
                     source_result="newrun", runtime=runtime)
             finished_info_list.append("\t".join(info_finish))
-            finished_idx_list.append(str(origIndex))
+            finished_idx_list.append(origIndex)
             # }}}
 
         # if the job is finished on the remote but the prediction is failed,
@@ -1052,10 +1128,10 @@ def GetResult(jobid, g_params):  # {{{
             except KeyError:
                 cnttry = 1
             if cnttry < g_params['MAX_RESUBMIT']:
-                resubmit_idx_list.append(str(origIndex))
+                resubmit_idx_list.append(origIndex)
                 cntTryDict[int(origIndex)] = cnttry+1
             else:
-                failed_idx_list.append(str(origIndex))
+                failed_idx_list.append(origIndex)
 
         if not isFinish_remote:
             time_in_remote_queue = time.time() - submit_time_epoch
@@ -1084,22 +1160,18 @@ def GetResult(jobid, g_params):  # {{{
                 keep_queueline_list.append(line)
 # }}}
     # Finally, write log files
-    finished_idx_list = list(set(finished_idx_list))
-    failed_idx_list = list(set(failed_idx_list))
-    resubmit_idx_list = list(set(resubmit_idx_list))
-
     if len(finished_info_list) > 0:
-        myfunc.WriteFile("\n".join(finished_info_list)+"\n", finished_seq_file,
-                         "a", True)
+        webcom.WriteFinishedSeqInfo(finished_info_list, finished_seq_file)
+    # index files are range-encoded, appended ranges are merged when read
     if len(finished_idx_list) > 0:
-        myfunc.WriteFile("\n".join(finished_idx_list)+"\n", finished_idx_file,
-                         "a", True)
+        myfunc.WriteRangeSet(myfunc.RangeSet(finished_idx_list),
+                             finished_idx_file, "a")
     if len(failed_idx_list) > 0:
-        myfunc.WriteFile("\n".join(failed_idx_list)+"\n", failed_idx_file, "a",
-                         True)
+        myfunc.WriteRangeSet(myfunc.RangeSet(failed_idx_list),
+                             failed_idx_file, "a")
     if len(resubmit_idx_list) > 0:
-        myfunc.WriteFile("\n".join(resubmit_idx_list)+"\n", torun_idx_file,
-                         "a", True)
+        myfunc.WriteIndexList(myfunc.uniquelist(resubmit_idx_list),
+                              torun_idx_file, "a")
 
     if len(keep_queueline_list) > 0:
         keep_queueline_list = list(set(keep_queueline_list))
@@ -1111,6 +1183,15 @@ def GetResult(jobid, g_params):  # {{{
     with open(cnttry_idx_file, 'w') as fpout:
         json.dump(cntTryDict, fpout)
 
+    # progress counters of the job for the views, see webcom.GetJobSummary
+    webcom.WriteJobProgress(rstdir,
+            len(myfunc.ReadRangeSet(finished_idx_file)),
+            len(myfunc.ReadRangeSet(failed_idx_file)))
+
+    trace.SetAttr(numseq_finished=len(finished_idx_list),
+            numseq_failed=len(failed_idx_list),
+            numseq_resubmit=len(resubmit_idx_list),
+            numseq_queued=len(keep_queueline_list), bytes_fetched=bytes_fetched)
     return 0
 # }}}
 
@@ -1135,42 +1216,28 @@ def CheckIfJobFinished(jobid, numseq, to_email, g_params):  # {{{
     finished_idx_file = "%s/finished_seqindex.txt"%(rstdir)
     failed_idx_file = "%s/failed_seqindex.txt"%(rstdir)
     py_scriptfile = os.path.join(binpath_script, f"{bsname}.py")
-    finished_idx_list = []
-    failed_idx_list = []
-    if os.path.exists(finished_idx_file):
-        finished_idx_list = list(set(myfunc.ReadIDList(finished_idx_file)))
-    if os.path.exists(failed_idx_file):
-        failed_idx_list = list(set(myfunc.ReadIDList(failed_idx_file)))
+    finished_idx_set = myfunc.ReadRangeSet(finished_idx_file)
+    failed_idx_set = myfunc.ReadRangeSet(failed_idx_file)
 
     lockname = f"{bsname}.lock"
     lock_file = os.path.join(g_params['path_result'], g_params['jobid'],
                              lockname)
 
-    num_processed = len(finished_idx_list)+len(failed_idx_list)
+    num_processed = len(finished_idx_set | failed_idx_set)
     if num_processed >= numseq:  # finished
+        # small jobs are processed in the daemon without starting a new
+        # process, large ones are submitted to slurm by default
         if ('THRESHOLD_NUMSEQ_CHECK_IF_JOB_FINISH' in g_params
                 and numseq <= g_params['THRESHOLD_NUMSEQ_CHECK_IF_JOB_FINISH']):
-            cmd = ["python", py_scriptfile, "-i", jsonfile]
-            (isSubmitSuccess, t_runtime) = webcom.RunCmd(cmd, gen_logfile, gen_errfile)
-        elif not os.path.exists(lock_file):
-            bash_scriptfile = f"{rstdir}/{bsname},{name_server},{jobid}.sh"
-            code_str_list = []
-            code_str_list.append("#!/bin/bash")
-            cmdline = f"python {py_scriptfile} -i {jsonfile}"
-            code_str_list.append(cmdline)
-            code = "\n".join(code_str_list)
-            myfunc.WriteFile(code, bash_scriptfile, mode="w", isFlush=True)
-            os.chmod(bash_scriptfile, 0o755)
-            os.chdir(rstdir)
-            cmd = ['sbatch', bash_scriptfile]
-            cmdline = " ".join(cmd)
-            verbose = False
-            if 'DEBUG' in g_params and g_params['DEBUG']:
-                verbose = True
-                webcom.loginfo("Run cmdline: %s"%(cmdline), gen_logfile)
-            (isSubmitSuccess, t_runtime) = webcom.RunCmd(cmd, gen_logfile, gen_errfile, verbose)
-            if 'DEBUG' in g_params and g_params['DEBUG']:
-                webcom.loginfo("isSubmitSuccess: %s"%(str(isSubmitSuccess)), gen_logfile)
+            backend = executor.GetBackend(g_params, f"{bsname}_small", "inline")
+        else:
+            backend = executor.GetBackend(g_params, bsname, "slurm")
+        argv = [py_scriptfile, "-i", jsonfile]
+        bash_scriptfile = f"{rstdir}/{bsname},{name_server},{jobid}.sh"
+        if not os.path.exists(lock_file) and not executor.IsTaskPending(jobid):
+            executor.RunScript(bsname, argv, backend, g_params, gen_logfile,
+                               gen_errfile, bash_scriptfile=bash_scriptfile,
+                               key=jobid)
 # }}}
 
 
@@ -1192,28 +1259,53 @@ def CleanCachedResult(g_params):  # {{{
     myfunc.WriteFile(json.dumps(g_params, sort_keys=True), jsonfile, "w")
     lockname = f"{bsname}.lock"
     lock_file = os.path.join(g_params['path_log'], lockname)
-    webcom.loginfo(f"Clean cached results older than {MAX_KEEP_DAYS_CACHE} days",
-                   gen_logfile)
-    cmd = ["python", py_scriptfile, "-i", jsonfile,
-           "-max-keep-day", f"{MAX_KEEP_DAYS_CACHE}"]
-    cmdline = " ".join(cmd)
+    # eviction policy: age, lru or lfu, see webcom.EvictCachedResult
+    if 'CACHE_EVICTION_POLICY' in g_params:
+        policy = g_params['CACHE_EVICTION_POLICY']
+    else:
+        policy = "age"
+    if 'MAX_SIZE_CACHE_IN_GB' in g_params:
+        max_size_cache_in_gb = g_params['MAX_SIZE_CACHE_IN_GB']
+    else:
+        max_size_cache_in_gb = 0.0
+    if policy == "age":
+        webcom.loginfo(f"Clean cached results older than {MAX_KEEP_DAYS_CACHE} days",
+                       gen_logfile)
+    elif max_size_cache_in_gb <= 0:
+        webcom.loginfo(f"MAX_SIZE_CACHE_IN_GB is not set for the cache eviction "
+                       f"policy {policy}, skip cleaning cached results", gen_errfile)
+        return
+    else:
+        webcom.loginfo(f"Clean cached results by policy {policy} with "
+                       f"budget {max_size_cache_in_gb} GB", gen_logfile)
+    if ('CACHE_EVICTION_ONLINE' in g_params
+            and g_params['CACHE_EVICTION_ONLINE']):
+        # evict in the daemon, limited number of results per call
+        if 'MAX_NUM_EVICT_PER_LOOP' in g_params:
+            max_num_evict = g_params['MAX_NUM_EVICT_PER_LOOP']
+        else:
+            max_num_evict = 10000
+        try:
+            (num_evicted, size_evicted) = webcom.EvictCachedResult(
+                    g_params['finished_date_db'], g_params['path_cache'],
+                    policy, gen_logfile, gen_errfile,
+                    max_keep_days=MAX_KEEP_DAYS_CACHE,
+                    max_size_in_byte=int(max_size_cache_in_gb*1024**3),
+                    max_num_evict=max_num_evict)
+        except Exception as e:
+            webcom.loginfo(f"Failed to evict cached results with errmsg {e}",
+                           gen_errfile)
+        return
+    argv = [py_scriptfile, "-i", jsonfile,
+            "-max-keep-day", f"{MAX_KEEP_DAYS_CACHE}", "-policy", policy,
+            "-max-size-gb", f"{max_size_cache_in_gb}"]
     if ('CLEAN_CACHED_RESULT_IN_QD' in g_params
             and g_params['CLEAN_CACHED_RESULT_IN_QD']):
-        webcom.RunCmd(cmd, gen_logfile, gen_errfile)
-    elif not os.path.exists(lock_file):
-        bash_scriptfile = f"{path_tmp}/{bsname}-{name_server}.sh"
-        code_str_list = []
-        code_str_list.append("#!/bin/bash")
-        code_str_list.append(cmdline)
-        code = "\n".join(code_str_list)
-        myfunc.WriteFile(code, bash_scriptfile, mode="w", isFlush=True)
-        os.chmod(bash_scriptfile, 0o755)
-        os.chdir(path_tmp)
-        cmd = ['sbatch', bash_scriptfile]
-        cmdline = " ".join(cmd)
-        verbose = False
-        if 'DEBUG' in g_params and g_params['DEBUG']:
-            verbose = True
-            webcom.loginfo(f"Run cmdline: {cmdline}", gen_logfile)
-        webcom.RunCmd(cmd, gen_logfile, gen_errfile, verbose)
+        backend = executor.GetBackend(g_params, bsname, "subprocess")
+    else:
+        backend = executor.GetBackend(g_params, bsname, "slurm")
+    bash_scriptfile = f"{path_tmp}/{bsname}-{name_server}.sh"
+    if backend in ["inline", "subprocess"] or not os.path.exists(lock_file):
+        executor.RunScript(bsname, argv, backend, g_params, gen_logfile,
+                           gen_errfile, bash_scriptfile=bash_scriptfile)
 # }}}
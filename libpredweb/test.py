@@ -1,8 +1,255 @@
 #!/usr/bin/env python
 import os
 import sys
+import re
+import io
+import time
 from libpredweb import webserver_common as webcom
 from libpredweb import myfunc
+
+def ValidateSeq_orig(rawseq, seqinfo, g_params):#{{{
+# the multi-pass ValidateSeq of the earlier versions, used as the reference
+# in the validateseq test
+# seq is the chunk of fasta file
+# seqinfo is a dictionary
+# return (filtered_seq)
+    rawseq = re.sub(r'[^\x00-\x7f]',r' ',rawseq) # remove non-ASCII characters
+    rawseq = re.sub(r'[\x00-\x09]',r' ',rawseq) # Filter non letter ASCII characters except CR (x13) LF (x10)
+    rawseq = re.sub(r'[\x11-\x12]',r' ',rawseq) # 
+    rawseq = re.sub(r'[\x13-\x1F]',r' ',rawseq) # 
+    filtered_seq = ""
+    # initialization
+    for item in ['errinfo_br', 'errinfo', 'errinfo_content', 'warninfo']:
+        if item not in seqinfo:
+            seqinfo[item] = ""
+
+    seqinfo['isValidSeq'] = True
+
+    seqRecordList = []
+    myfunc.ReadFastaFromBuffer(rawseq, seqRecordList, True, 0, 0)
+# filter empty sequences and any sequeces shorter than MIN_LEN_SEQ or longer
+# than MAX_LEN_SEQ
+    newSeqRecordList = []
+    li_warn_info = []
+    isHasEmptySeq = False
+    isHasShortSeq = False
+    isHasLongSeq = False
+    isHasDNASeq = False
+    cnt = 0
+    for rd in seqRecordList:
+        seq = rd[2].strip()
+        seqid = rd[0].strip()
+        if len(seq) == 0:
+            isHasEmptySeq = 1
+            msg = "Empty sequence %s (SeqNo. %d) is removed."%(seqid, cnt+1)
+            li_warn_info.append(msg)
+        elif len(seq) < g_params['MIN_LEN_SEQ']:
+            isHasShortSeq = 1
+            msg = "Sequence %s (SeqNo. %d) is removed since its length is < %d."%(seqid, cnt+1, g_params['MIN_LEN_SEQ'])
+            li_warn_info.append(msg)
+        elif len(seq) > g_params['MAX_LEN_SEQ']:
+            isHasLongSeq = True
+            msg = "Sequence %s (SeqNo. %d) is removed since its length is > %d."%(seqid, cnt+1, g_params['MAX_LEN_SEQ'])
+            li_warn_info.append(msg)
+        elif myfunc.IsDNASeq(seq):
+            isHasDNASeq = True
+            msg = "Sequence %s (SeqNo. %d) is removed since it looks like a DNA sequence."%(seqid, cnt+1)
+            li_warn_info.append(msg)
+        else:
+            newSeqRecordList.append(rd)
+        cnt += 1
+    seqRecordList = newSeqRecordList
+
+    numseq = len(seqRecordList)
+
+    if numseq < 1:
+        seqinfo['errinfo_br'] += "Number of input sequences is 0!\n"
+        t_rawseq = rawseq.lstrip()
+        if t_rawseq and t_rawseq[0] != '>':
+            seqinfo['errinfo_content'] += "Bad input format. The FASTA format should have an annotation line start with '>'.\n"
+        if len(li_warn_info) >0:
+            seqinfo['errinfo_content'] += "\n".join(li_warn_info) + "\n"
+        if not isHasShortSeq and not isHasEmptySeq and not isHasLongSeq and not isHasDNASeq:
+            seqinfo['errinfo_content'] += "Please input your sequence in FASTA format.\n"
+
+        seqinfo['isValidSeq'] = False
+    elif numseq > g_params['MAX_NUMSEQ_PER_JOB']:
+        seqinfo['errinfo_br'] += "Number of input sequences exceeds the maximum (%d)!\n"%(
+                g_params['MAX_NUMSEQ_PER_JOB'])
+        seqinfo['errinfo_content'] += "Your query has %d sequences. "%(numseq)
+        seqinfo['errinfo_content'] += "However, the maximal allowed sequences per job is %d. "%(
+                g_params['MAX_NUMSEQ_PER_JOB'])
+        seqinfo['errinfo_content'] += "Please split your query into smaller files and submit again.\n"
+        seqinfo['isValidSeq'] = False
+    else:
+        li_badseq_info = []
+        if 'isForceRun' in seqinfo and seqinfo['isForceRun'] and numseq > g_params['MAX_NUMSEQ_FOR_FORCE_RUN']:
+            seqinfo['errinfo_br'] += "Invalid input!"
+            seqinfo['errinfo_content'] += "You have chosen the \"Force Run\" mode. "\
+                    "The maximum allowable number of sequences of a job is %d. "\
+                    "However, your input has %d sequences."%(g_params['MAX_NUMSEQ_FOR_FORCE_RUN'], numseq)
+            seqinfo['isValidSeq'] = False
+
+
+# checking for bad sequences in the query
+
+    if seqinfo['isValidSeq']:
+        for i in range(numseq):
+            seq = seqRecordList[i][2].strip()
+            anno = seqRecordList[i][1].strip().replace('\t', ' ')
+            seqid = seqRecordList[i][0].strip()
+            seq = seq.upper()
+            seq = re.sub("[\s\n\r\t]", '', seq)
+            li1 = [m.start() for m in re.finditer("[^ABCDEFGHIKLMNPQRSTUVWYZX*-]", seq)]
+            if len(li1) > 0:
+                for j in range(len(li1)):
+                    msg = "Bad letter for amino acid in sequence %s (SeqNo. %d) "\
+                            "at position %d (letter: '%s')"%(seqid, i+1,
+                                    li1[j]+1, seq[li1[j]])
+                    li_badseq_info.append(msg)
+
+        if len(li_badseq_info) > 0:
+            seqinfo['errinfo_br'] += "There are bad letters for amino acids in your query!\n"
+            seqinfo['errinfo_content'] = "\n".join(li_badseq_info) + "\n"
+            seqinfo['isValidSeq'] = False
+
+# convert some non-classical letters to the standard amino acid symbols
+# Scheme:
+#    out of these 26 letters in the alphabet, 
+#    B, Z -> X
+#    U -> C
+#    *, - will be deleted
+    if seqinfo['isValidSeq']:
+        li_newseq = []
+        for i in range(numseq):
+            seq = seqRecordList[i][2].strip()
+            anno = seqRecordList[i][1].strip()
+            seqid = seqRecordList[i][0].strip()
+            seq = seq.upper()
+            seq = re.sub("[\s\n\r\t]", '', seq)
+            anno = anno.replace('\t', ' ') #replace tab by whitespace
+
+
+            li1 = [m.start() for m in re.finditer("[BZ]", seq)]
+            if len(li1) > 0:
+                for j in range(len(li1)):
+                    msg = "Amino acid in sequence %s (SeqNo. %d) at position %d "\
+                            "(letter: '%s') has been replaced by 'X'"%(seqid,
+                                    i+1, li1[j]+1, seq[li1[j]])
+                    li_warn_info.append(msg)
+                seq = re.sub("[BZ]", "X", seq)
+
+            li1 = [m.start() for m in re.finditer("[U]", seq)]
+            if len(li1) > 0:
+                for j in range(len(li1)):
+                    msg = "Amino acid in sequence %s (SeqNo. %d) at position %d "\
+                            "(letter: '%s') has been replaced by 'C'"%(seqid,
+                                    i+1, li1[j]+1, seq[li1[j]])
+                    li_warn_info.append(msg)
+                seq = re.sub("[U]", "C", seq)
+
+            li1 = [m.start() for m in re.finditer("[*]", seq)]
+            if len(li1) > 0:
+                for j in range(len(li1)):
+                    msg = "Translational stop in sequence %s (SeqNo. %d) at position %d "\
+                            "(letter: '%s') has been deleted"%(seqid,
+                                    i+1, li1[j]+1, seq[li1[j]])
+                    li_warn_info.append(msg)
+                seq = re.sub("[*]", "", seq)
+
+            li1 = [m.start() for m in re.finditer("[-]", seq)]
+            if len(li1) > 0:
+                for j in range(len(li1)):
+                    msg = "Gap in sequence %s (SeqNo. %d) at position %d "\
+                            "(letter: '%s') has been deleted"%(seqid,
+                                    i+1, li1[j]+1, seq[li1[j]])
+                    li_warn_info.append(msg)
+                seq = re.sub("[-]", "", seq)
+
+            # check the sequence length again after potential removal of
+            # translation stop
+            if len(seq) < g_params['MIN_LEN_SEQ']:
+                isHasShortSeq = 1
+                msg = "Sequence %s (SeqNo. %d) is removed since its length is < %d (after removal of translation stop)."%(seqid, i+1, g_params['MIN_LEN_SEQ'])
+                li_warn_info.append(msg)
+            else:
+                li_newseq.append(">%s\n%s"%(anno, seq))
+
+        filtered_seq = "\n".join(li_newseq) # seq content after validation
+        seqinfo['numseq'] = len(li_newseq)
+        seqinfo['warninfo'] = "\n".join(li_warn_info) + "\n"
+
+    seqinfo['errinfo'] = seqinfo['errinfo_br'] + seqinfo['errinfo_content']
+    return filtered_seq
+
+def GetTMPosition_ref(topo):#{{{
+    """The earlier implementation of myfunc.GetTMPosition, the reference for
+    the equivalence test"""
+    posTM=[]
+    lengthTopo=len(topo)
+    b=0
+    e=0
+    while 1:
+        b=topo.find('M',e)
+        if b != -1:
+            m = re.search('[io]', topo[b+1:])
+            if m != None:
+                e = m.start(0)+b+1
+            else:
+                e=lengthTopo
+            if topo[e-1] == myfunc.GAP:
+                e=topo[:e-1].rfind('M')+1
+            if b == e:
+                return []
+            posTM.append((b,e))
+        else:
+            break
+    return posTM
+#}}}
+def PosTM2Topo_ref(posTM, seqLength, NtermState):#{{{
+    """The earlier implementation of myfunc.PosTM2Topo"""
+    if NtermState == "":
+        return ""
+    topList = []
+    statelist = ["i", "o"]
+    idx = 0
+    if NtermState in ['i', "in", "IN", "I"]:
+        idx = 0
+    else:
+        idx = 1
+    state = statelist[idx]
+    if len(posTM) < 1:
+        topList += [state]*seqLength
+    else:
+        for j in range(len(posTM)):
+            state = statelist[idx%2]
+            if j == 0:
+                seglen = posTM[j][0]
+            else:
+                seglen = posTM[j][0] - posTM[j-1][1]
+            topList += [state]*seglen
+            topList += ['M'] * (posTM[j][1]-posTM[j][0])
+            idx += 1
+        if posTM[len(posTM)-1][1] < seqLength:
+            state = statelist[idx%2]
+            topList += [state] * (seqLength - posTM[len(posTM)-1][1])
+    return "".join(topList)
+#}}}
+def GetRandomTopologyList(numtopo, maxlength=2000, seed=1):#{{{
+    """Random topologies with gaps, signal peptides and edge cases"""
+    import random
+    rand = random.Random(seed)
+    topoList = ["", "M", "-", "i", "MMM", "M-", "-M-", "iMo", "MMo--", "i--MM--o",
+            "oMMM---", "SSSiMMMoS", "MiMoM", "M---i"]
+    for i in range(numtopo):
+        length = rand.randint(1, maxlength)
+        li = []
+        while len(li) < length:
+            li += [rand.choice("iioooMMMMM--S")]*rand.randint(1, 30)
+        topoList.append("".join(li[:length]))
+    return topoList
+#}}}
+
 if __name__ == '__main__':
     progname=os.path.basename(sys.argv[0])
     general_usage = """
@@ -34,3 +281,178 @@ if __name__ == '__main__':
         except Exception as e:
             print("retrieve %s failed with errmsg=%s"%(url, str(e)) )
 
+
+    if TESTMODE == "readlinebyblock":
+        # benchmark ReadLineByBlock against plain file iteration on a large
+        # log file, e.g. python test.py readlinebyblock 1GB.log
+        infile = sys.argv[2]
+        filesize = os.path.getsize(infile)
+        for BLOCK_SIZE in [100000, 1024*1024]:
+            for isReverse in [False, True]:
+                t0 = time.time()
+                cnt = 0
+                for line in myfunc.ReadLineByBlock(infile, BLOCK_SIZE, isReverse):
+                    cnt += 1
+                dt = time.time() - t0
+                print("ReadLineByBlock BLOCK_SIZE=%d isReverse=%s: %d lines in %.3f s (%.1f MB/s)"%(
+                    BLOCK_SIZE, isReverse, cnt, dt, filesize/1024/1024/max(dt, 1e-9)))
+        t0 = time.time()
+        cnt = 0
+        with open(infile, "r") as fpin:
+            for line in fpin:
+                cnt += 1
+        dt = time.time() - t0
+        print("plain file iteration: %d lines in %.3f s (%.1f MB/s)"%(
+            cnt, dt, filesize/1024/1024/max(dt, 1e-9)))
+
+    if TESTMODE == "validateseq":
+        # check that ValidateSeq and ValidateSeqFromFile give the same result
+        # as the original implementation and benchmark them, e.g.
+        # python test.py validateseq query.fa
+        infile = sys.argv[2]
+        g_params = {'MIN_LEN_SEQ': 10, 'MAX_LEN_SEQ': 100000,
+                'MAX_NUMSEQ_PER_JOB': 100000, 'MAX_NUMSEQ_FOR_FORCE_RUN': 100}
+        with open(infile, "rb") as fpin:
+            content = fpin.read()
+        rawseq = content.decode('utf-8')
+        li_result = []
+        for (name, func) in [("orig", ValidateSeq_orig),
+                ("ValidateSeq", webcom.ValidateSeq),
+                ("ValidateSeqFromFile", None)]:
+            seqinfo = {}
+            t0 = time.time()
+            if func is None:
+                rawseqList = []
+                filtered_seq = webcom.ValidateSeqFromFile(io.BytesIO(content),
+                        seqinfo, g_params, rawseqList, 64*1024)
+                if "".join(rawseqList) != rawseq:
+                    print("%s: rawseq differs"%(name))
+            else:
+                filtered_seq = func(rawseq, seqinfo, g_params)
+            dt = time.time() - t0
+            print("%s: %.3f s (%.1f MB/s)"%(name, dt,
+                len(content)/1024/1024/max(dt, 1e-9)))
+            li_result.append((filtered_seq, seqinfo))
+        for i in range(1, len(li_result)):
+            if li_result[i] != li_result[0]:
+                print("result %d differs from the original"%(i))
+
+    if TESTMODE == "importtime":
+        # check that importing the library does not load the heavy
+        # dependencies and stays within the startup budget, e.g.
+        # python test.py importtime [BUDGET_IN_MS]
+        import subprocess
+        budget_in_ms = 50.0
+        if numArgv > 2:
+            budget_in_ms = float(sys.argv[2])
+        heavy_module_list = ['requests', 'urllib3', 'dateutil', 'pytz',
+                'tabulate', 'sqlite3', 'geoip', 'pycountry', 'suds']
+        status = 0
+        for modname in ["libpredweb.myfunc", "libpredweb.webserver_common",
+                "libpredweb.qd_fe_common"]:
+            cmd = [sys.executable, "-X", "importtime", "-c", "import %s"%(modname)]
+            rmsg = subprocess.run(cmd, capture_output=True, text=True).stderr
+            loaded_set = set([])
+            cumtime_in_us = -1
+            for line in rmsg.split("\n"):
+                strs = line.split("|")
+                if not line.startswith("import time:") or len(strs) != 3:
+                    continue
+                name = strs[2].strip()
+                loaded_set.add(name.split(".")[0])
+                if name == modname:
+                    cumtime_in_us = int(strs[1])
+            if cumtime_in_us < 0:
+                print("%s: failed to import\n%s"%(modname, rmsg))
+                status = 1
+                continue
+            li_heavy = [x for x in heavy_module_list if x in loaded_set]
+            cumtime_in_ms = cumtime_in_us/1000.0
+            print("%s: %.1f ms (budget %.1f ms)"%(modname, cumtime_in_ms, budget_in_ms))
+            if len(li_heavy) > 0:
+                print("%s: FAILED, heavy modules imported: %s"%(modname, " ".join(li_heavy)))
+                status = 1
+            if cumtime_in_ms > budget_in_ms:
+                print("%s: FAILED, import time exceeds the budget"%(modname))
+                status = 1
+        sys.exit(status)
+
+    if TESTMODE == "metrics":
+        # overhead of the timeit decorator and the metrics exporters, e.g.
+        # python test.py metrics [NUM_CALL] [OUTPATH]
+        from libpredweb import metrics
+        from libpredweb.timeit import timeit
+        numcall = 100000
+        if numArgv > 2:
+            numcall = int(sys.argv[2])
+        outpath = "/tmp"
+        if numArgv > 3:
+            outpath = sys.argv[3]
+        def func_plain(jobid, x):
+            return x+1
+        func_timed = timeit(func_plain)
+        metrics.Configure(outpath, "json", flush_interval=3600,
+                profile_interval=0.01, server="test")
+        li_runtime = []
+        for func in [func_plain, func_timed]:
+            begin_time = time.perf_counter()
+            for i in range(numcall):
+                func("rst_%d"%(i%10), i)
+            li_runtime.append(time.perf_counter() - begin_time)
+        print("plain: %.3f s, timed: %.3f s, overhead per call: %.2f us"%(
+            li_runtime[0], li_runtime[1],
+            (li_runtime[1]-li_runtime[0])/numcall*1e6))
+        for (funcname, labels, d) in metrics.GetSnapshot():
+            print(funcname, labels, d['count'], "p50=%.2e p99=%.2e"%(d['p50'], d['p99']))
+        metrics.Flush()
+        metrics.g_config['format'] = "prom"
+        metrics.Flush()
+        for name in ["metrics.json", "metrics.prom", "metrics.profile.folded"]:
+            print("%s/%s: %d bytes"%(outpath, name, os.path.getsize("%s/%s"%(outpath, name))))
+
+    if TESTMODE == "topology":
+        # equivalence of GetTMPosition, CountTM and PosTM2Topo with the earlier
+        # implementations and their runtime, on random topologies and
+        # optionally on the topologies of a fasta file, e.g.
+        # python test.py topology [NUM_TOPO] [TOPOFILE]
+        numtopo = 2000
+        if numArgv > 2:
+            numtopo = int(sys.argv[2])
+        topoList = GetRandomTopologyList(numtopo)
+        if numArgv > 3:
+            (idList, annoList, seqList) = myfunc.ReadFasta(sys.argv[3])
+            topoList += seqList
+        status = 0
+        posTMList = myfunc.GetTMPositionList(topoList)
+        numTMList = myfunc.CountTMList(topoList)
+        gaplessTopoList = [topo.replace(myfunc.GAP, "") for topo in topoList]
+        for i in range(len(topoList)):
+            topo = topoList[i]
+            posTM_ref = GetTMPosition_ref(topo)
+            if (myfunc.GetTMPosition(topo) != posTM_ref or posTMList[i] != posTM_ref
+                    or myfunc.CountTM(topo) != len(posTM_ref) or numTMList[i] != len(posTM_ref)):
+                print("FAILED GetTMPosition/CountTM for topo %d: %s"%(i, topo[:80]))
+                status = 1
+            gapless = gaplessTopoList[i]
+            posTM = myfunc.GetTMPosition(gapless)
+            for NtermState in ["i", "out", ""]:
+                if (myfunc.PosTM2Topo(posTM, len(gapless), NtermState) !=
+                        PosTM2Topo_ref(posTM, len(gapless), NtermState)):
+                    print("FAILED PosTM2Topo for topo %d: %s"%(i, gapless[:80]))
+                    status = 1
+        print("%d topologies checked: %s"%(len(topoList), "FAILED" if status else "OK"))
+
+        li_posTM = [myfunc.GetTMPosition(x) for x in gaplessTopoList]
+        li_len = [len(x) for x in gaplessTopoList]
+        for (name, func) in [
+                ("GetTMPosition_ref", lambda: [GetTMPosition_ref(x) for x in topoList]),
+                ("GetTMPosition", lambda: [myfunc.GetTMPosition(x) for x in topoList]),
+                ("GetTMPositionList", lambda: myfunc.GetTMPositionList(topoList)),
+                ("CountTM_ref", lambda: [len(GetTMPosition_ref(x)) for x in topoList]),
+                ("CountTMList", lambda: myfunc.CountTMList(topoList)),
+                ("PosTM2Topo_ref", lambda: [PosTM2Topo_ref(x, y, "i") for (x, y) in zip(li_posTM, li_len)]),
+                ("PosTM2TopoList", lambda: myfunc.PosTM2TopoList(li_posTM, li_len, ["i"]*len(li_len)))]:
+            begin_time = time.perf_counter()
+            func()
+            print("%-18s %8.3f s"%(name, time.perf_counter() - begin_time))
+        sys.exit(status)
@@ -1,20 +1,34 @@
 import time
+import functools
+from . import metrics
+from . import trace
 def timeit(method):# {{{
     """Decorator to time a method
 inspired by https://www.zopyx.com/andreas-jung/contents/a-python-decorator-for-measuring-the-execution-time-of-methods
+    The call is traced as a span (see trace.py) and the runtime is added to
+    the histogram of the method in the metrics registry (see metrics.py),
+    labeled by the arguments jobid and node if the method has any
     """
-    def timed(*args, **kw):
-        ts = time.time()
-        result = method(*args, **kw)
-        te = time.time()
+    funcname = method.__name__
+    labelargs = metrics.GetLabelArgs(method)
 
+    @functools.wraps(method)
+    def timed(*args, **kw):
         if 'log_time' in kw:
+            ts = time.perf_counter()
+            result = method(*args, **kw)
+            te = time.perf_counter()
             name = kw.get('log_name', method.__name__.upper())
             kw['log_time'][name] = int((te - ts) * 1000)
-        else:
-            print ('Runtime for %r:  %2.2f ms' % \
-                  (method.__name__, (te - ts) * 1000))
-        return result
+            return result
+
+        labels = metrics.GetLabelsFromArgs(labelargs, args, kw)
+        with trace.Span(funcname, **labels):
+            ts = time.perf_counter()
+            try:
+                return method(*args, **kw)
+            finally:
+                metrics.Observe(funcname, time.perf_counter() - ts, **labels)
 
     return timed
 # }}}
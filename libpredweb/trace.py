@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Description:
+Trace of the loops of the web-server daemon (qd_fe.py)
+
+Each traced block of code is a span, with the name, the start time, the
+duration, the parent span and attributes such as jobid, node, numseq, bytes
+fetched and cache hits. Spans are nested by the order they are opened in each
+thread, e.g.
+
+    with trace.Span("soap.checkjob", node=node) as span:
+        rtValue = myclient.service.checkjob(remote_jobid)
+        span.SetAttr(status=status)
+
+The functions decorated with timeit.timeit are traced as spans as well.
+Finished spans are written to path_log, each one tagged with the loop number
+of the daemon (set by SetLoop), either as JSON lines (trace.jsonl) or as
+Chrome trace events (trace.json, can be loaded by chrome://tracing or
+Perfetto). The file is rotated by size. Summarize it with
+src/trace_summary.py
+
+Configuration, e.g. in the g_params of qd_fe.py
+    TRACE_FORMAT       : jsonl, chrome or none, (default: jsonl)
+    TRACE_MAX_BYTES    : size of the trace file to rotate, (default: 50 MB)
+    TRACE_BACKUP_COUNT : number of rotated trace files to keep, (default: 5)
+
+Author: Nanjiang Shu (nanjiang.shu@scilifelab.se)
+
+Address: Science for Life Laboratory Stockholm, Box 1031, 17121 Solna, Sweden
+"""
+
+import os
+import sys
+import time
+import json
+import atexit
+import itertools
+import threading
+
+FORMAT_LIST = ["jsonl", "chrome", "none"]
+MAX_BUFFER_SPAN = 1000 # number of finished spans to buffer before writing
+
+g_writer = None
+g_loop = -1 # loop number of the daemon
+g_local = threading.local() # stack of the open spans of each thread
+g_span_id = itertools.count(1)
+
+def GetTraceFile(path_log, fmt):#{{{
+    if fmt == "chrome":
+        return "%s/trace.json"%(path_log)
+    else:
+        return "%s/trace.jsonl"%(path_log)
+#}}}
+class TraceWriter(object):#{{{
+# Description:
+#   Buffer the finished spans and append them to the trace file, which is
+#   rotated to trace.jsonl.1, trace.jsonl.2 ... when it exceeds max_bytes
+    def __init__(self, path_log, fmt="jsonl", max_bytes=50*1024*1024,#{{{
+            backup_count=5):
+        self.tracefile = GetTraceFile(path_log, fmt)
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.pid = os.getpid()
+        self.buffer = []
+        self.lock = threading.Lock()
+#}}}
+    def Add(self, span):#{{{
+        if self.fmt == "chrome":
+            args = dict(span.attrs)
+            args['loop'] = span.loop
+            args['parent'] = span.parent_id
+            event = {'name': span.name, 'cat': "qd_fe", 'ph': "X",
+                    'ts': int(span.start_time*1e6), 'dur': int(span.duration*1e6),
+                    'pid': self.pid, 'tid': span.tid, 'args': args}
+            line = json.dumps(event, default=str) + ",\n"
+        else:
+            record = {'loop': span.loop, 'name': span.name, 'id': span.span_id,
+                    'parent': span.parent_id, 'ts': round(span.start_time, 6),
+                    'dur': round(span.duration, 6), 'pid': self.pid,
+                    'tid': span.tid, 'attrs': span.attrs}
+            line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            self.buffer.append(line)
+            isFlush = span.parent_id == 0 or len(self.buffer) >= MAX_BUFFER_SPAN
+        if isFlush:
+            self.Flush()
+#}}}
+    def Rotate(self):#{{{
+        for i in range(self.backup_count-1, 0, -1):
+            src = "%s.%d"%(self.tracefile, i)
+            if os.path.exists(src):
+                os.replace(src, "%s.%d"%(self.tracefile, i+1))
+        if self.backup_count > 0:
+            os.replace(self.tracefile, "%s.1"%(self.tracefile))
+        else:
+            os.remove(self.tracefile)
+#}}}
+    def Flush(self):#{{{
+        with self.lock:
+            if len(self.buffer) == 0:
+                return 0
+            content = "".join(self.buffer)
+            self.buffer = []
+            try:
+                if (os.path.exists(self.tracefile) and
+                        os.path.getsize(self.tracefile) > self.max_bytes):
+                    self.Rotate()
+                isNew = not os.path.exists(self.tracefile)
+                with open(self.tracefile, "a") as fpout:
+                    if isNew and self.fmt == "chrome":
+                        fpout.write("[\n")
+                    fpout.write(content)
+            except (IOError, OSError) as e:
+                print("Failed to write trace to %s. errmsg=%s"%(self.tracefile,
+                    str(e)), file=sys.stderr)
+                return 1
+        return 0
+#}}}
+#}}}
+class _Span(object):#{{{
+    def __init__(self, name, attrs):#{{{
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(g_span_id)
+        self.parent_id = 0
+        self.tid = threading.get_ident()
+        self.loop = g_loop
+        self.start_time = 0.0
+        self.duration = 0.0
+#}}}
+    def SetAttr(self, **attrs):#{{{
+        self.attrs.update(attrs)
+#}}}
+    def AddAttr(self, key, value=1):#{{{
+        self.attrs[key] = self.attrs.get(key, 0) + value
+#}}}
+    def __enter__(self):#{{{
+        try:
+            stack = g_local.stack
+        except AttributeError:
+            stack = g_local.stack = []
+        if len(stack) > 0:
+            self.parent_id = stack[-1].span_id
+        stack.append(self)
+        self.start_time = time.time()
+        self.ts = time.perf_counter()
+        return self
+#}}}
+    def __exit__(self, exc_type, exc_value, tb):#{{{
+        self.duration = time.perf_counter() - self.ts
+        if exc_type is not None:
+            self.attrs['error'] = "%s: %s"%(exc_type.__name__, str(exc_value))
+        g_local.stack.pop()
+        # the loop number may be set within the span, e.g. in CreateRunJoblog
+        self.loop = g_loop
+        writer = g_writer
+        if writer is not None:
+            writer.Add(self)
+        return False
+#}}}
+#}}}
+class _NullSpan(object):#{{{
+# the span returned when tracing is disabled
+    def SetAttr(self, **attrs):
+        pass
+    def AddAttr(self, key, value=1):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+#}}}
+g_null_span = _NullSpan()
+
+def Span(name, **attrs):#{{{
+    """Open a span as a context manager, attributes with the value None are
+    ignored"""
+    if g_writer is None:
+        return g_null_span
+    return _Span(name, dict((k, v) for (k, v) in attrs.items() if v is not None))
+#}}}
+def GetCurrentSpan():#{{{
+    """Return the innermost open span of the current thread"""
+    stack = getattr(g_local, 'stack', None)
+    if stack:
+        return stack[-1]
+    return g_null_span
+#}}}
+def SetAttr(**attrs):#{{{
+    """Set attributes of the innermost open span"""
+    GetCurrentSpan().SetAttr(**attrs)
+#}}}
+def AddAttr(key, value=1):#{{{
+    """Add value to the attribute key of the innermost open span"""
+    GetCurrentSpan().AddAttr(key, value)
+#}}}
+def SetLoop(loop):#{{{
+    """Set the loop number of the daemon, which tags the spans finished
+    afterwards"""
+    global g_loop
+    g_loop = loop
+#}}}
+def Flush():#{{{
+    if g_writer is not None:
+        return g_writer.Flush()
+    return 0
+#}}}
+def Configure(path_log, fmt="jsonl", max_bytes=50*1024*1024, backup_count=5):#{{{
+    """Write the spans to path_log, fmt: jsonl, chrome or none"""
+    global g_writer
+    if not fmt in FORMAT_LIST:
+        print("Unknown trace format %s, use jsonl"%(fmt), file=sys.stderr)
+        fmt = "jsonl"
+    if g_writer is not None:
+        g_writer.Flush()
+    if fmt == "none":
+        g_writer = None
+        return
+    isFirst = g_writer is None
+    g_writer = TraceWriter(path_log, fmt, max_bytes, backup_count)
+    if isFirst:
+        atexit.register(Flush)
+#}}}
+def ConfigureFromParams(g_params):#{{{
+    """Configure the trace from g_params of the daemon, only once in each
+    process"""
+    if g_writer is not None or not 'path_log' in g_params:
+        return
+    Configure(g_params['path_log'], g_params.get('TRACE_FORMAT', "jsonl"),
+            g_params.get('TRACE_MAX_BYTES', 50*1024*1024),
+            g_params.get('TRACE_BACKUP_COUNT', 5))
+#}}}
+def ResetAfterFork():#{{{
+    # the buffered spans are written by the parent process, the open spans
+    # of the parent are not continued in the child. The child writes no
+    # spans until it is configured itself
+    global g_writer, g_local
+    g_writer = None
+    g_local = threading.local()
+#}}}
+
+os.register_at_fork(after_in_child=ResetAfterFork)
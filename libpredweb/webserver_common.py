@@ -15,23 +15,50 @@ import re
 from . import myfunc
 import time
 from datetime import datetime
-from dateutil import parser as dtparser
-from pytz import timezone
-import tabulate
-import shutil
 import logging
 import subprocess
-import sqlite3
+import io
+import codecs
 import json
-from geoip import geolite2
-import pycountry
-import requests
+import collections
+import calendar
+import threading
+import concurrent.futures
 from enum import Enum
 from .timeit import timeit
+from . import metrics
+from . import logsink
+from . import logrotate
+# The heavy dependencies, i.e. requests, dateutil, pytz, tabulate, sqlite3,
+# geoip and pycountry, are imported in the functions using them, so that the
+# helper scripts importing this module start fast. Check with
+# python test.py importtime
 
 TZ = "Europe/Stockholm"
 FORMAT_DATETIME = "%Y-%m-%d %H:%M:%S %Z"
 ZB_SCORE_THRESHOLD = 0.45
+SUBMIT_WORKER_HEARTBEAT_TIMEOUT = 60 # seconds
+g_finish_date_db_set = set([]) # finish date databases initialized by this process
+g_expiry_index_set = set([]) # expiry indices initialized by this process
+g_expiry_retry_dict = {} # path_log -> [(jobid, epoch_finish)] failed to add to the expiry index
+g_old_result_deleter = None # OldResultDeleter used by DeleteOldResult
+g_log_rotator = None # LogRotator used by ArchiveLogFile
+g_divided_store_state = {} # dbfile -> rows of the divided store written by this process
+g_job_summary_cache = collections.OrderedDict() # rstdir -> (mtime_list, JobSummary)
+g_job_summary_lock = threading.Lock()
+MAX_JOB_SUMMARY_CACHE = 10000
+DIVIDED_FINISHED_EXTRA_COLUMNS = [("epoch_submit", "INTEGER"),
+        ("epoch_start", "INTEGER"), ("epoch_finish", "INTEGER"),
+        ("numseq", "INTEGER"), ("jobname", "TEXT")]
+# sort keys of the paged job lists -> expression of the table finished
+JOB_LIST_SORT_KEY_DICT = {
+        'submit': "epoch_submit",
+        'start': "epoch_start",
+        'finish': "epoch_finish",
+        'runtime': "epoch_finish - epoch_start",
+        'numseq': "numseq",
+        'jobname': "jobname"
+        }
 chde_table = {
         'C': 'CYS',
         'H': 'HIS',
@@ -94,7 +121,7 @@ def get_job_status(jobid, numseq, path_result):# {{{
     elif os.path.isfile(finishtagfile):
         status = JobStatus.FINISHED
     elif os.path.isfile(starttagfile):
-        num_torun = len(myfunc.ReadIDList(torun_idx_file))
+        num_torun = len(myfunc.ReadIndexList(torun_idx_file))
         status = JobStatus.RUNNING if num_torun < numseq else JobStatus.WAIT
 
     return status.value
@@ -102,6 +129,7 @@ def get_job_status(jobid, numseq, path_result):# {{{
 def get_external_ip(timeout=5):# {{{
     """Return external IP of the host
     """
+    import requests
     try:
         ip = requests.get('https://api.ipify.org', timeout=timeout).text
         ip = ip.strip()
@@ -247,50 +275,168 @@ def ResetToRunDictByScampiSingle(toRunDict, script_scampi, tmpdir, runjob_logfil
         RunCmd(cmd, runjob_logfile, runjob_errfile)
     if os.path.exists(topfile_scampiseq):
         (idlist_scampi, annolist_scampi, toplist_scampi) = myfunc.ReadFasta(topfile_scampiseq)
+        numTMList = myfunc.CountTMList(toplist_scampi)
         for jj in range(len(idlist_scampi)):
-            numTM = myfunc.CountTM(toplist_scampi[jj])
+            numTM = numTMList[jj]
             try:
                 toRunDict[int(idlist_scampi[jj])][1] = numTM
             except (KeyError, ValueError, TypeError):
                 pass
 # }}}
 
+class JobSummary(object):#{{{
+# Description:
+#   Typed summary of a job, i.e. the fields of the file jobinfo and the
+#   progress counters written by qd_fe_common.GetResult, see GetJobSummary
+    def __init__(self, jobid="", rstdir=""):#{{{
+        self.jobid = jobid
+        self.rstdir = rstdir
+        self.submit_date_str = ""
+        self.client_ip = ""
+        self.numseq = 1
+        self.length_rawseq = 0
+        self.jobname = ""
+        self.email = ""
+        self.method_submission = "web"
+        self.app_type = None
+        self.isJobInfoValid = False # jobinfo has at least 8 fields
+        self.counter = None # (num_finished, num_failed), read when first used
+#}}}
+    def GetCounter(self):#{{{
+        """Return (num_finished, num_failed), from the index files of the job
+        if not loaded from the progress file"""
+        if self.counter is None:
+            self.counter = (
+                    len(myfunc.ReadRangeSet("%s/finished_seqindex.txt"%(self.rstdir))),
+                    len(myfunc.ReadRangeSet("%s/failed_seqindex.txt"%(self.rstdir))))
+        return self.counter
+#}}}
+    @property
+    def num_finished(self):#{{{
+        return self.GetCounter()[0]
+#}}}
+    @property
+    def num_failed(self):#{{{
+        return self.GetCounter()[1]
+#}}}
+    @property
+    def num_remaining(self):#{{{
+        return max(0, self.numseq - self.num_finished - self.num_failed)
+#}}}
+    def ParseJobInfo(self, jobinfo):#{{{
+        """Parse the line of jobinfo, the tab separated fields
+        submit_date jobid ip numseq length_rawseq jobname email method [app_type]"""
+        jobinfolist = jobinfo.split("\t")
+        if len(jobinfolist) < 8:
+            return
+        self.isJobInfoValid = True
+        self.submit_date_str = jobinfolist[0]
+        self.jobid = jobinfolist[1]
+        self.client_ip = jobinfolist[2]
+        try:
+            self.numseq = int(jobinfolist[3])
+        except ValueError:
+            self.numseq = 1
+        try:
+            self.length_rawseq = int(jobinfolist[4])
+        except ValueError:
+            self.length_rawseq = 0
+        self.jobname = jobinfolist[5]
+        self.email = jobinfolist[6]
+        self.method_submission = jobinfolist[7]
+        if len(jobinfolist) >= 9:
+            self.app_type = jobinfolist[8]
+#}}}
+    def ToDict(self):#{{{
+        return {'submit_date_str': self.submit_date_str, 'jobid': self.jobid,
+                'client_ip': self.client_ip,
+                'length_rawseq': self.length_rawseq, 'numseq': self.numseq,
+                'jobname': self.jobname, 'email': self.email,
+                'method_submission': self.method_submission,
+                'app_type': self.app_type if self.app_type is not None else ""}
+#}}}
+#}}}
+def GetJobProgressFile(rstdir):#{{{
+    return "%s/job_progress.json"%(rstdir)
+#}}}
+def WriteJobProgress(rstdir, num_finished, num_failed):#{{{
+    """Write the progress counters of the job, read by GetJobSummary"""
+    progressfile = GetJobProgressFile(rstdir)
+    tmpfile = "%s.tmp.%d"%(progressfile, os.getpid())
+    try:
+        with open(tmpfile, "w") as fpout:
+            json.dump({'num_finished': num_finished, 'num_failed': num_failed},
+                    fpout)
+        os.replace(tmpfile, progressfile)
+    except (IOError, OSError) as e:
+        print("Failed to write %s. errmsg=%s"%(progressfile, str(e)), file=sys.stderr)
+        return 1
+    return 0
+#}}}
+def GetJobSummary(rstdir):#{{{
+    """Return the JobSummary of the job in the result folder rstdir
+    The summary is cached in the process by rstdir and reloaded when the mtime
+    of jobinfo or of the progress file changes, so that it is read once by
+    the views and the daemon. Without the progress file, e.g. for jobs not
+    yet processed by GetResult, the counters are read from the index files
+    when first used, and the summary is also reloaded when the mtime of the
+    index files changes
+    The returned object is shared, do not modify it
+    """
+    jobinfofile = "%s/jobinfo"%(rstdir)
+    progressfile = GetJobProgressFile(rstdir)
+    mtime_list = []
+    for infile in [jobinfofile, progressfile]:
+        try:
+            mtime_list.append(os.stat(infile).st_mtime_ns)
+        except OSError:
+            mtime_list.append(None)
+    if mtime_list[1] is None:
+        for infile in ["%s/finished_seqindex.txt"%(rstdir),
+                "%s/failed_seqindex.txt"%(rstdir)]:
+            try:
+                mtime_list.append(os.stat(infile).st_mtime_ns)
+            except OSError:
+                mtime_list.append(None)
+    with g_job_summary_lock:
+        item = g_job_summary_cache.get(rstdir)
+        if item is not None and item[0] == mtime_list:
+            g_job_summary_cache.move_to_end(rstdir)
+            return item[1]
+
+    summary = JobSummary(os.path.basename(rstdir), rstdir)
+    if mtime_list[0] is not None:
+        summary.ParseJobInfo(myfunc.ReadFile(jobinfofile).strip())
+    progress = {}
+    if mtime_list[1] is not None:
+        try:
+            with open(progressfile, "r") as fpin:
+                progress = json.load(fpin)
+        except (IOError, OSError, ValueError):
+            progress = {}
+    if 'num_finished' in progress and 'num_failed' in progress:
+        summary.counter = (progress['num_finished'], progress['num_failed'])
+
+    with g_job_summary_lock:
+        g_job_summary_cache[rstdir] = (mtime_list, summary)
+        g_job_summary_cache.move_to_end(rstdir)
+        while len(g_job_summary_cache) > MAX_JOB_SUMMARY_CACHE:
+            g_job_summary_cache.popitem(last=False)
+    return summary
+#}}}
 def ReadJobInfo(infile):# {{{
     """Read file jobinfo. return a dictionary
     """
-    jobinfo = myfunc.ReadFile(jobinfofile).strip()
-    dt = {}
-    dt['submit_date_str'] = ""
-    dt['jobid'] = ""
-    dt['client_ip'] = ""
-    dt['length_rawseq'] = 0
-    dt['numseq'] = 1
-    dt['jobname'] = ""
-    dt['email'] = ""
-    dt['method_submission'] = "web"
-    dt['app_type'] = ""
-    jobinfolist = jobinfo.split("\t")
-    if len(jobinfolist) >= 8:
-        dt['submit_date_str'] = jobinfolist[0]
-        dt['jobid'] = jobinfolist[1]
-        dt['client_ip'] = jobinfolist[2]
-        dt['numseq'] = int(jobinfolist[3])
-        dt['length_rawseq'] = int(jobinfolist[4])
-        dt['jobname'] = jobinfolist[5]
-        dt['email'] = jobinfolist[6]
-        dt['method_submission'] = jobinfolist[7]
-        if len(jobinfolist) == 9:
-            dt['app_type'] = jobinfolist[8]
-    return dt
+    summary = JobSummary()
+    summary.ParseJobInfo(myfunc.ReadFile(infile).strip())
+    return summary.ToDict()
 # }}}
 def GetScampiAppType(jobinfofile):# {{{
     """Determine the APP type of Scampi, i.e. Scampi_single or Scampi_MSA based
     on the record in the jobinfo file"""
-    jobinfo = myfunc.ReadFile(jobinfofile).strip()
-    jobinfolist = jobinfo.split("\t")
-    app_type = "None"
-    if len(jobinfolist) >= 9:
-        app_type = jobinfolist[8]
+    app_type = GetJobSummary(os.path.dirname(jobinfofile)).app_type
+    if app_type is None:
+        app_type = "None"
     return app_type
 # }}}
 def GetNameServerFromNameSoftware(name_software):  # {{{
@@ -320,71 +466,157 @@ def ReadRemoteQueueFile(infile):# {{{
     return dt
 # }}}
 
-def WriteDumpedTextResultFile(name_server, outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile=""):#{{{
-    """Write the prediction result to a single text file. This function does not work for proq3
+# Registry of the writers for the dumped text result file, keyed by
+# name_server. Each writer is a dict with
+#   'render'   : function (cnt, item, outpath_result) -> (text, statList),
+#                returns the text block of one item and its statistics
+#   'title'    : title of the header, no header is written if empty
+#   'statkeys' : names of the statistics in statList
+#   'statformat' : format of each line of the statfile
+#   'itemlist' : function (outpath_result, maplist) -> list of items,
+#                default is maplist
+#   'finalize' : function (outfile, outpath_result, itemList), run after the
+#                result file is written
+RESULT_WRITER_DICT = {}
+def RegisterResultWriter(name_server, render, title="", statkeys=None,#{{{
+        statformat="%s %d", itemlist=None, finalize=None):
+    """Register a writer for the dumped text result file of name_server"""
+    RESULT_WRITER_DICT[name_server.lower()] = {
+            'render': render,
+            'title': title,
+            'statkeys': statkeys if statkeys != None else [],
+            'statformat': statformat,
+            'itemlist': itemlist,
+            'finalize': finalize}
+#}}}
+def GetSeqItemHeaderText(cnt, line):#{{{
+    """Return the header text of a sequence in the dumped result file and the
+    subfoldername, line is a record of maplist
     """
-    name_server = name_server.lower()
-    if name_server == "topcons2":
-        WriteTOPCONSTextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
-    elif name_server == "subcons":
-        WriteSubconsTextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
-    elif name_server == "boctopus2":
-        WriteBoctopusTextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
-    elif name_server == "scampi2":
-        WriteSCAMPI2MSATextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
-    elif name_server == "pconsc3":
-        WritePconsC3TextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
-    elif name_server == "predzinc":
-        WritePredZincTextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
-    elif name_server == "frag1d":
-        WriteFrag1DTextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
-
+    strs = line.split('\t')
+    subfoldername = strs[0]
+    length = int(strs[1])
+    desp = strs[2]
+    seq = strs[3]
+    text = "Sequence number: %d\n"%(cnt+1) +\
+            "Sequence name: %s\n"%(desp) +\
+            "Sequence length: %d aa.\n"%(length) +\
+            "Sequence:\n%s\n\n\n"%(seq)
+    return (text, subfoldername)
 #}}}
-def WritePconsC3TextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile=""):#{{{
+@timeit
+def WriteResultFileByWriter(writer, outfile, outpath_result, maplist,#{{{
+        runtime_in_sec, base_www_url, statfile="", num_thread=8,
+        chunksize=256, bufsize=4*1024*1024):
+    """Write the dumped text result file with a registered writer
+
+    The render function of the writer is run by a pool of num_thread threads
+    which reads ahead at most 2*chunksize items. The rendered texts are
+    written in the order of the items through a buffered writer. After every
+    chunksize items, the number of written items, the size of outfile and the
+    statistics are saved to outfile.checkpoint, so that an interrupted dump
+    is resumed from the last checkpoint instead of from the beginning.
+    """
+    rstdir = os.path.realpath("%s/.."%(outpath_result))
+    runjob_logfile = "%s/%s"%(rstdir, "runjob.log")
+    runjob_errfile = "%s/%s"%(rstdir, "runjob.err")
+    finishtagfile = "%s/%s"%(rstdir, "write_result_finish.tag")
+    render = writer['render']
+    statkeys = writer['statkeys']
+    if writer['itemlist'] != None:
+        itemList = writer['itemlist'](outpath_result, maplist)
+    else:
+        itemList = maplist
+    checkpointfile = outfile + ".checkpoint"
+    numitem = len(itemList)
     try:
-        fpout = open(outfile, "w")
+        checkpoint = LoadJsonFromFile(checkpointfile)
+        if (checkpoint.get('numseq', -1) == numitem and os.path.exists(outfile)
+                and os.path.getsize(outfile) >= checkpoint.get('offset', -1) > 0):
+            # resume from the checkpoint, drop the text written after it
+            cnt = checkpoint['cnt']
+            statvalues = checkpoint['stat']
+            os.truncate(outfile, checkpoint['offset'])
+            fpout = open(outfile, "ab", buffering=bufsize)
+        else:
+            cnt = 0
+            statvalues = [0]*len(statkeys)
+            fpout = open(outfile, "wb", buffering=bufsize)
+            if writer['title'] != "":
+                date_str = time.strftime(FORMAT_DATETIME)
+                li = []
+                li.append("##############################################################################")
+                li.append(writer['title'])
+                li.append("Generated from %s at %s"%(base_www_url, date_str))
+                li.append("Total request time: %.1f seconds."%(runtime_in_sec))
+                li.append("##############################################################################")
+                fpout.write(("\n".join(li)+"\n").encode('utf-8'))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_thread) as executor:
+            pending = collections.deque()
+            idx_submit = cnt
+            while cnt < numitem:
+                # keep the pool busy reading ahead while writing in order
+                while idx_submit < numitem and len(pending) < 2*chunksize:
+                    pending.append(executor.submit(render, idx_submit,
+                        itemList[idx_submit], outpath_result))
+                    idx_submit += 1
+                (text, stat) = pending.popleft().result()
+                fpout.write(text.encode('utf-8'))
+                for i in range(len(statkeys)):
+                    statvalues[i] += stat[i]
+                cnt += 1
+                if cnt % chunksize == 0 and cnt < numitem:
+                    fpout.flush()
+                    content = json.dumps({'numseq': numitem, 'cnt': cnt,
+                        'offset': fpout.tell(), 'stat': statvalues})
+                    myfunc.WriteFile(content, checkpointfile + ".tmp", "w")
+                    os.replace(checkpointfile + ".tmp", checkpointfile)
 
-        fpstat = None
+        fpout.close()
+        if os.path.exists(checkpointfile):
+            os.remove(checkpointfile)
 
         if statfile != "":
-            fpstat = open(statfile, "w")
-
-        date_str = time.strftime(FORMAT_DATETIME)
-        print("##############################################################################", file=fpout)
-        print("PconsC3 result file", file=fpout)
-        print("Generated from %s at %s"%(base_www_url, date_str), file=fpout)
-        print("Total request time: %.1f seconds."%(runtime_in_sec), file=fpout)
-        print("##############################################################################", file=fpout)
+            out_str_list = []
+            for i in range(len(statkeys)):
+                out_str_list.append(writer['statformat']%(statkeys[i], statvalues[i]))
+            myfunc.WriteFile("%s"%("\n".join(out_str_list)), statfile, "w")
 
-        cnt = 0
-        for line in maplist:
-            strs = line.split('\t')
-            subfoldername = strs[0]
-            length = int(strs[1])
-            desp = strs[2]
-            seq = strs[3]
-            outpath_this_seq = "%s/%s"%(outpath_result, subfoldername)
-            predfile = "%s/query.fa.hhE0.pconsc3.out"%(outpath_this_seq)
-            print("Sequence number: %d"%(cnt+1), file=fpout)
-            print("Sequence name: %s"%(desp), file=fpout)
-            print("Sequence length: %d aa."%(length), file=fpout)
-            print("Sequence:\n%s\n\n"%(seq), file=fpout)
-            print("Predicted contacts:", file=fpout)
-            print("%-4s %4s %5s"%("Res1", "Res2", "Score"), file=fpout)
-
-            if os.path.exists(predfile):
-                content = myfunc.ReadFile(predfile)
-                fpout.write("%s\n"%(content))
-            else:
-                print("***Contact prediction failed***", file=fpout)
-            print("##############################################################################", file=fpout)
-            cnt += 1
+        if writer['finalize'] != None:
+            writer['finalize'](outfile, outpath_result, itemList)
 
-        fpout.close()
-        if fpstat:
-            fpstat.close()
+        WriteDateTimeTagFile(finishtagfile, runjob_logfile, runjob_errfile)
     except IOError:
-        print("Failed to write to file %s"%(outfile))
+        loginfo("Failed to write to file %s"%(outfile), runjob_errfile)
+#}}}
+def WriteDumpedTextResultFile(name_server, outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile=""):#{{{
+    """Write the prediction result to a single text file. This function does not work for proq3
+    """
+    name_server = name_server.lower()
+    if name_server in RESULT_WRITER_DICT:
+        WriteResultFileByWriter(RESULT_WRITER_DICT[name_server], outfile,
+                outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
+#}}}
+def RenderPconsC3SeqResult(cnt, line, outpath_result):#{{{
+    """Render the result of one sequence for PconsC3"""
+    (text, subfoldername) = GetSeqItemHeaderText(cnt, line)
+    li = [text]
+    outpath_this_seq = "%s/%s"%(outpath_result, subfoldername)
+    predfile = "%s/query.fa.hhE0.pconsc3.out"%(outpath_this_seq)
+    li.append("Predicted contacts:\n")
+    li.append("%-4s %4s %5s\n"%("Res1", "Res2", "Score"))
+    if os.path.exists(predfile):
+        content = myfunc.ReadFile(predfile)
+        li.append("%s\n"%(content))
+    else:
+        li.append("***Contact prediction failed***\n")
+    li.append("##############################################################################\n")
+    return ("".join(li), [])
+#}}}
+def WritePconsC3TextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile=""):#{{{
+    WriteResultFileByWriter(RESULT_WRITER_DICT['pconsc3'], outfile,
+            outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
 #}}}
 def WriteProQ3TextResultFile(outfile, query_para, modelFileList, #{{{
         runtime_in_sec, base_www_url, proq3opt, statfile=""):
@@ -466,95 +698,61 @@ def WriteProQ3TextResultFile(outfile, query_para, modelFileList, #{{{
     except IOError:
         print("Failed to write to file %s"%(outfile))
 #}}}
+def RenderBoctopusSeqResult(cnt, line, outpath_result):#{{{
+    """Render the result of one sequence for BOCTOPUS2"""
+    strs = line.split('\t')
+    subfoldername = strs[0]
+    desp = strs[2]
+    outpath_this_seq = "%s/%s"%(outpath_result, subfoldername)
+    predfile = "%s/query_topologies.txt"%(outpath_this_seq)
+    if not os.path.exists(predfile):
+        rstdir = os.path.realpath("%s/.."%(outpath_result))
+        runjob_errfile = "%s/%s"%(rstdir, "runjob.err")
+        loginfo("predfile %s does not exist\n"%(predfile), runjob_errfile)
+    (seqid, seqanno, top) = myfunc.ReadSingleFasta(predfile)
+    isTMPro = myfunc.CountTM(top) > 0
+    return (">%s\n%s\n"%(desp, top), [isTMPro])
+#}}}
 def WriteBoctopusTextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile=""):#{{{
-    rstdir = os.path.realpath("%s/.."%(outpath_result))
-    runjob_logfile = "%s/%s"%(rstdir, "runjob.log")
-    runjob_errfile = "%s/%s"%(rstdir, "runjob.err")
-    finishtagfile = "%s/%s"%(rstdir, "write_result_finish.tag")
-    try:
-        fpout = open(outfile, "w")
-        fpstat = None
-        numTMPro = 0
-
-        if statfile != "":
-            fpstat = open(statfile, "w")
-
-        cnt = 0
-        for line in maplist:
-            strs = line.split('\t')
-            subfoldername = strs[0]
-            length = int(strs[1])
-            desp = strs[2]
-            seq = strs[3]
-            isTMPro = False
-            outpath_this_seq = "%s/%s"%(outpath_result, subfoldername)
-            predfile = "%s/query_topologies.txt"%(outpath_this_seq)
-            loginfo("predfile =  %s.\n"%(predfile), runjob_logfile)
-            if not os.path.exists(predfile):
-                loginfo("predfile %s does not exist\n"%(predfile), runjob_errfile)
-            (seqid, seqanno, top) = myfunc.ReadSingleFasta(predfile)
-            fpout.write(">%s\n%s\n"%(desp, top))
-            numTM = myfunc.CountTM(top)
-            if numTM >0:
-                isTMPro = True
-                numTMPro += 1
-
-            cnt += 1
-
-        if fpstat:
-            out_str_list = ["numTMPro\t%d\n"%(numTMPro)]
-            fpstat.write("%s"%("\n".join(out_str_list)))
-            fpstat.close()
-        WriteDateTimeTagFile(finishtagfile, runjob_logfile, runjob_errfile)
-    except IOError:
-        loginfo( "Failed to write to file %s"%(outfile), runjob_errfile)
+    WriteResultFileByWriter(RESULT_WRITER_DICT['boctopus2'], outfile,
+            outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
 #}}}
-def WriteSCAMPI2MSATextResultFile(outfile, outpath_result, maplist, #{{{
-        runtime_in_sec, base_www_url, statfile=""):
+def GetSCAMPI2MSAItemList(outpath_result, maplist):#{{{
+    """For SCAMPI2 the result is dumped from the records in finished_seqs.txt
+    """
     finished_seq_file = "%s/finished_seqs.txt"%(outpath_result)
+    finish_info_lines = myfunc.ReadFile(finished_seq_file).split('\n')
+    return [x for x in finish_info_lines if len(x.split('\t')) >= 8]
+#}}}
+def RenderSCAMPI2MSASeqResult(cnt, line, outpath_result):#{{{
+    """Render the result of one record in finished_seqs.txt for SCAMPI2"""
+    strs = line.split('\t')
+    desp = strs[5]
+    top = strs[7]
+    isTMPro = myfunc.CountTM(top) > 0
+    return (">%s\n%s\n"%(desp, top), [isTMPro])
+#}}}
+def FinalizeSCAMPI2MSA(outfile, outpath_result, itemList):#{{{
+    """Write the list of TM and nonTM proteins for SCAMPI2"""
     TM_listfile = "%s/query.TM_list.txt"%(outpath_result)
     nonTM_listfile = "%s/query.nonTM_list.txt"%(outpath_result)
-    finish_info_lines = myfunc.ReadFile(finished_seq_file).split('\n')
     str_TMlist = []
     str_nonTMlist = []
-    try:
-        fpout = open(outfile, "w")
-
-        fpstat = None
-        numTMPro = 0
-
-        if statfile != "":
-            fpstat = open(statfile, "w")
-
-        cnt = 0
-        for line in finish_info_lines:
-            strs = line.split('\t')
-            if len(strs) >= 8:
-                numTM = int(strs[2])
-                isTMPro = False
-                desp = strs[5]
-                top = strs[7]
-                fpout.write(">%s\n%s\n"%(desp, top))
-                numTM = myfunc.CountTM(top)
-                if numTM >0:
-                    str_TMlist.append(desp)
-                    isTMPro = True
-                    numTMPro += 1
-                else:
-                    str_nonTMlist.append(desp)
-
-                cnt += 1
-
-        if fpstat:
-            out_str_list = ["numTMPro\t%d\n"%(numTMPro)]
-            fpstat.write("%s"%("\n".join(out_str_list)))
-            fpstat.close()
-
-        myfunc.WriteFile("\n".join(str_TMlist), TM_listfile, "w")
-        myfunc.WriteFile("\n".join(str_nonTMlist), nonTM_listfile, "w")
-
-    except IOError:
-        print("Failed to write to file %s"%(outfile))
+    for line in itemList:
+        strs = line.split('\t')
+        desp = strs[5]
+        top = strs[7]
+        if myfunc.CountTM(top) > 0:
+            str_TMlist.append(desp)
+        else:
+            str_nonTMlist.append(desp)
+    myfunc.WriteFile("\n".join(str_TMlist), TM_listfile, "w")
+    myfunc.WriteFile("\n".join(str_nonTMlist), nonTM_listfile, "w")
+#}}}
+def WriteSCAMPI2MSATextResultFile(outfile, outpath_result, maplist, #{{{
+        runtime_in_sec, base_www_url, statfile=""):
+    WriteResultFileByWriter(RESULT_WRITER_DICT['scampi2'], outfile,
+            outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
 #}}}
 def WriteNiceResultPredZinc(predfile, fpout, threshold=0.45):#{{{
     is_ZB = False
@@ -627,56 +825,20 @@ def WriteNiceResultPredZinc(predfile, fpout, threshold=0.45):#{{{
 
     return (is_ZB, is_has_homo)
 #}}}
+def RenderPredZincSeqResult(cnt, line, outpath_result):#{{{
+    """Render the result of one sequence for PredZinc"""
+    (text, subfoldername) = GetSeqItemHeaderText(cnt, line)
+    fpout = io.StringIO()
+    fpout.write(text)
+    outpath_this_seq = "%s/%s"%(outpath_result, subfoldername)
+    predfile = "%s/query.predzinc.predict"%(outpath_this_seq)
+    (is_ZB, is_has_homo) = WriteNiceResultPredZinc(predfile, fpout,
+            threshold=ZB_SCORE_THRESHOLD)
+    return (fpout.getvalue(), [is_ZB, is_has_homo])
+#}}}
 def WritePredZincTextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile=""):#{{{
-    try:
-        fpout = open(outfile, "w")
-
-        fpstat = None
-        num_ZB = 0
-        num_has_homo = 0
-
-        if statfile != "":
-            fpstat = open(statfile, "w")
-
-        date_str = time.strftime(FORMAT_DATETIME)
-        print("##############################################################################", file=fpout)
-        print("PredZinc result file", file=fpout)
-        print("Generated from %s at %s"%(base_www_url, date_str), file=fpout)
-        print("Total request time: %.1f seconds."%(runtime_in_sec), file=fpout)
-        print("##############################################################################", file=fpout)
-        cnt = 0
-        for line in maplist:
-            strs = line.split('\t')
-            subfoldername = strs[0]
-            length = int(strs[1])
-            desp = strs[2]
-            seq = strs[3]
-            print("Sequence number: %d"%(cnt+1), file=fpout)
-            print("Sequence name: %s"%(desp), file=fpout)
-            print("Sequence length: %d aa."%(length), file=fpout)
-            print("Sequence:\n%s\n\n"%(seq), file=fpout)
-
-            is_ZB = False
-            is_has_homo = False
-            outpath_this_seq = "%s/%s"%(outpath_result, subfoldername)
-            predfile = "%s/query.predzinc.predict"%(outpath_this_seq)
-            (is_ZB, is_has_homo ) = WriteNiceResultPredZinc(predfile, fpout,
-                    threshold=ZB_SCORE_THRESHOLD) 
-
-            if fpstat:
-                num_ZB += is_ZB
-                num_has_homo += is_has_homo
-
-            cnt += 1
-
-        if fpstat:
-            out_str_list = []
-            out_str_list.append("num_ZB %d"% num_ZB)
-            out_str_list.append("num_has_homo %d"% num_has_homo)
-            fpstat.write("%s"%("\n".join(out_str_list)))
-            fpstat.close()
-    except IOError:
-        print("Failed to write to file %s"%(outfile))
+    WriteResultFileByWriter(RESULT_WRITER_DICT['predzinc'], outfile,
+            outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
 #}}}
 def WriteNiceResultFrag1D(predfile, fpout):#{{{
     hdl = myfunc.ReadLineByBlock(predfile)
@@ -697,247 +859,156 @@ def WriteNiceResultFrag1D(predfile, fpout):#{{{
     else:
         pass
 #}}}
+def RenderFrag1DSeqResult(cnt, line, outpath_result):#{{{
+    """Render the result of one sequence for Frag1D"""
+    (text, subfoldername) = GetSeqItemHeaderText(cnt, line)
+    fpout = io.StringIO()
+    fpout.write(text)
+    outpath_this_seq = "%s/%s"%(outpath_result, subfoldername)
+    predfile = "%s/query.predfrag1d"%(outpath_this_seq)
+    WriteNiceResultFrag1D(predfile, fpout)
+    return (fpout.getvalue(), [])
+#}}}
 def WriteFrag1DTextResultFile(outfile, outpath_result, maplist, runtime_in_sec, base_www_url, statfile=""):#{{{
-    try:
-        fpout = open(outfile, "w")
-        fpstat = None
-        if statfile != "":
-            fpstat = open(statfile, "w")
-        date_str = time.strftime(FORMAT_DATETIME)
-        print("##############################################################################", file=fpout)
-        print("Frag1D result file", file=fpout)
-        print("Generated from %s at %s"%(base_www_url, date_str), file=fpout)
-        print("Total request time: %.1f seconds."%(runtime_in_sec), file=fpout)
-        print("##############################################################################", file=fpout)
-        cnt = 0
-        for line in maplist:
-            strs = line.split('\t')
-            subfoldername = strs[0]
-            length = int(strs[1])
-            desp = strs[2]
-            seq = strs[3]
-            print("Sequence number: %d"%(cnt+1), file=fpout)
-            print("Sequence name: %s"%(desp), file=fpout)
-            print("Sequence length: %d aa."%(length), file=fpout)
-            print("Sequence:\n%s\n\n"%(seq), file=fpout)
-
-            outpath_this_seq = "%s/%s"%(outpath_result, subfoldername)
-            predfile = "%s/query.predfrag1d"%(outpath_this_seq)
-            WriteNiceResultFrag1D(predfile, fpout)
-
-            cnt += 1
-
-        if fpstat:
-            out_str_list = []
-            fpstat.write("%s"%("\n".join(out_str_list)))
-            fpstat.close()
-    except IOError:
-        print("Failed to write to file %s"%(outfile))
+    WriteResultFileByWriter(RESULT_WRITER_DICT['frag1d'], outfile,
+            outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
+#}}}
+def RenderSubconsSeqResult(cnt, line, outpath_result):#{{{
+    """Render the result of one sequence for Subcons"""
+    (text, subfoldername) = GetSeqItemHeaderText(cnt, line)
+    rstfile = "%s/%s/%s/query_0.csv"%(outpath_result, subfoldername, "plot")
+    if os.path.exists(rstfile):
+        content = myfunc.ReadFile(rstfile).strip()
+        lines = content.split("\n")
+        if len(lines) >= 6:
+            header_line = lines[0].split("\t")
+            if header_line[0].strip() == "":
+                header_line[0] = "Method"
+                header_line = [x.strip() for x in header_line]
+
+            data_line = []
+            for i in range(1, len(lines)):
+                strs1 = lines[i].split("\t")
+                strs1 = [x.strip() for x in strs1]
+                data_line.append(strs1)
+
+            import tabulate
+            content = tabulate.tabulate(data_line, header_line, 'plain')
+    else:
+        content = ""
+    if content == "":
+        content = "***No prediction could be produced with this method***"
+    text += "Prediction results:\n\n%s\n\n\n"%(content)
+    text += "##############################################################################\n"
+    return (text, [])
 #}}}
-
-
-@timeit
 def WriteSubconsTextResultFile(outfile, outpath_result, maplist,#{{{
         runtime_in_sec, base_www_url, statfile=""):
-    try:
-        fpout = open(outfile, "w")
-        if statfile != "":
-            fpstat = open(statfile, "w")
-
-        date_str = time.strftime(FORMAT_DATETIME)
-        print("##############################################################################", file=fpout)
-        print("Subcons result file", file=fpout)
-        print("Generated from %s at %s"%(base_www_url, date_str), file=fpout)
-        print("Total request time: %.1f seconds."%(runtime_in_sec), file=fpout)
-        print("##############################################################################", file=fpout)
-        cnt = 0
-        for line in maplist:
-            strs = line.split('\t')
-            subfoldername = strs[0]
-            length = int(strs[1])
-            desp = strs[2]
-            seq = strs[3]
-            seqid = myfunc.GetSeqIDFromAnnotation(desp)
-            print("Sequence number: %d"%(cnt+1), file=fpout)
-            print("Sequence name: %s"%(desp), file=fpout)
-            print("Sequence length: %d aa."%(length), file=fpout)
-            print("Sequence:\n%s\n\n"%(seq), file=fpout)
-
-            rstfile = "%s/%s/%s/query_0.csv"%(outpath_result, subfoldername, "plot")
-
-            if os.path.exists(rstfile):
-                content = myfunc.ReadFile(rstfile).strip()
-                lines = content.split("\n")
-                if len(lines) >= 6:
-                    header_line = lines[0].split("\t")
-                    if header_line[0].strip() == "":
-                        header_line[0] = "Method"
-                        header_line = [x.strip() for x in header_line]
-
-                    data_line = []
-                    for i in range(1, len(lines)):
-                        strs1 = lines[i].split("\t")
-                        strs1 = [x.strip() for x in strs1]
-                        data_line.append(strs1)
-
-                    content = tabulate.tabulate(data_line, header_line, 'plain')
-            else:
-                content = ""
-            if content == "":
-                content = "***No prediction could be produced with this method***"
-
-            print("Prediction results:\n\n%s\n\n"%(content), file=fpout)
-
-            print("##############################################################################", file=fpout)
-            cnt += 1
-
-    except IOError:
-        print("Failed to write to file %s"%(outfile))
+    WriteResultFileByWriter(RESULT_WRITER_DICT['subcons'], outfile,
+            outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
+#}}}
+def RenderTOPCONSSeqResult(cnt, line, outpath_result):#{{{
+    """Read the result files of one sequence and return the text block of the
+    sequence in the dumped TOPCONS2 result file together with the statistics
+    (is_TM_cons, is_TM_any, is_nonTM_cons, is_nonTM_any, is_SP_cons, is_SP_any)
+    """
+    methodlist = ['TOPCONS', 'OCTOPUS', 'Philius', 'PolyPhobius', 'SCAMPI',
+            'SPOCTOPUS', 'Homology']
+    (text, subfoldername) = GetSeqItemHeaderText(cnt, line)
+    li = [text]
+
+    is_TM_cons = False
+    is_TM_any = False
+    is_nonTM_cons = True
+    is_nonTM_any = True
+    is_SP_cons = False
+    is_SP_any = False
+
+    for method in methodlist:
+        seqid = ""
+        seqanno = ""
+        top = ""
+        if method == "TOPCONS":
+            topfile = "%s/%s/%s/topcons.top"%(outpath_result, subfoldername, "Topcons")
+        elif method == "Philius":
+            topfile = "%s/%s/%s/query.top"%(outpath_result, subfoldername, "philius")
+        elif method == "SCAMPI":
+            topfile = "%s/%s/%s/query.top"%(outpath_result, subfoldername, method+"_MSA")
+        else:
+            topfile = "%s/%s/%s/query.top"%(outpath_result, subfoldername, method)
+        if os.path.exists(topfile):
+            (seqid, seqanno, top) = myfunc.ReadSingleFasta(topfile)
+        else:
+            top = ""
+        if top == "":
+            top = "***No topology could be produced with this method***"
+
+        if top.find('M') >= 0:
+            is_TM_any = True
+            is_nonTM_any = False
+            if method == "TOPCONS":
+                is_TM_cons = True
+                is_nonTM_cons = False
+        if top.find('S') >= 0:
+            is_SP_any = True
+            if method == "TOPCONS":
+                is_SP_cons = True
+
+        if method == "Homology":
+            showtext_homo = method
+            if seqid != "":
+                showtext_homo = seqid
+            li.append("%s:\n%s\n\n\n"%(showtext_homo, top))
+        else:
+            li.append("%s predicted topology:\n%s\n\n\n"%(method, top))
+
+    dgfile = "%s/%s/dg.txt"%(outpath_result, subfoldername)
+    dg_content = ""
+    if os.path.exists(dgfile):
+        dg_content = myfunc.ReadFile(dgfile)
+    dglines = [x for x in dg_content.split("\n") if x and x[0].isdigit()]
+    if len(dglines)>0:
+        li.append("\nPredicted Delta-G-values (kcal/mol) "\
+                "(left column=sequence position; right column=Delta-G)\n\n")
+        li.append("\n".join(dglines) + "\n")
+
+    reliability_file = "%s/%s/Topcons/reliability.txt"%(outpath_result, subfoldername)
+    reliability = ""
+    if os.path.exists(reliability_file):
+        reliability = myfunc.ReadFile(reliability_file)
+    if reliability != "":
+        li.append("\nPredicted TOPCONS reliability (left "\
+                "column=sequence position; right column=reliability)\n\n")
+        li.append(reliability + "\n")
+    li.append("##############################################################################\n")
+    stat = [is_TM_cons, is_TM_any, is_nonTM_cons, is_nonTM_any, is_SP_cons,
+            is_SP_any]
+    return ("".join(li), stat)
 #}}}
-
-
-@timeit
 def WriteTOPCONSTextResultFile(outfile, outpath_result, maplist,#{{{
         runtime_in_sec, base_www_url, statfile=""):
-    try:
-        methodlist = ['TOPCONS', 'OCTOPUS', 'Philius', 'PolyPhobius', 'SCAMPI',
-                'SPOCTOPUS', 'Homology']
-        fpout = open(outfile, "w")
-
-        fpstat = None
-        num_TMPro_cons = 0
-        num_TMPro_any = 0
-        num_nonTMPro_cons = 0
-        num_nonTMPro_any = 0
-        num_SPPro_cons = 0
-        num_SPPro_any = 0
-
-        if statfile != "":
-            fpstat = open(statfile, "w")
-
-        date_str = time.strftime(FORMAT_DATETIME)
-        print("##############################################################################", file=fpout)
-        print("TOPCONS2 result file", file=fpout)
-        print("Generated from %s at %s"%(base_www_url, date_str), file=fpout)
-        print("Total request time: %.1f seconds."%(runtime_in_sec), file=fpout)
-        print("##############################################################################", file=fpout)
-        cnt = 0
-        for line in maplist:
-            strs = line.split('\t')
-            subfoldername = strs[0]
-            length = int(strs[1])
-            desp = strs[2]
-            seq = strs[3]
-            print("Sequence number: %d"%(cnt+1), file=fpout)
-            print("Sequence name: %s"%(desp), file=fpout)
-            print("Sequence length: %d aa."%(length), file=fpout)
-            print("Sequence:\n%s\n\n"%(seq), file=fpout)
-
-            is_TM_cons = False
-            is_TM_any = False
-            is_nonTM_cons = True
-            is_nonTM_any = True
-            is_SP_cons = False
-            is_SP_any = False
-
-            for i in range(len(methodlist)):
-                method = methodlist[i]
-                seqid = ""
-                seqanno = ""
-                top = ""
-                if method == "TOPCONS":
-                    topfile = "%s/%s/%s/topcons.top"%(outpath_result, subfoldername, "Topcons")
-                elif method == "Philius":
-                    topfile = "%s/%s/%s/query.top"%(outpath_result, subfoldername, "philius")
-                elif method == "SCAMPI":
-                    topfile = "%s/%s/%s/query.top"%(outpath_result, subfoldername, method+"_MSA")
-                else:
-                    topfile = "%s/%s/%s/query.top"%(outpath_result, subfoldername, method)
-                if os.path.exists(topfile):
-                    (seqid, seqanno, top) = myfunc.ReadSingleFasta(topfile)
-                else:
-                    top = ""
-                if top == "":
-                    #top = "***No topology could be produced with this method topfile=%s***"%(topfile)
-                    top = "***No topology could be produced with this method***"
-
-                if fpstat != None:
-                    if top.find('M') >= 0:
-                        is_TM_any = True
-                        is_nonTM_any = False
-                        if method == "TOPCONS":
-                            is_TM_cons = True
-                            is_nonTM_cons = False
-                    if top.find('S') >= 0:
-                        is_SP_any = True
-                        if method == "TOPCONS":
-                            is_SP_cons = True
-
-                if method == "Homology":
-                    showtext_homo = method
-                    if seqid != "":
-                        showtext_homo = seqid
-                    print("%s:\n%s\n\n"%(showtext_homo, top), file=fpout)
-                else:
-                    print("%s predicted topology:\n%s\n\n"%(method, top), file=fpout)
-
-
-            if fpstat:
-                num_TMPro_cons += is_TM_cons
-                num_TMPro_any += is_TM_any
-                num_nonTMPro_cons += is_nonTM_cons
-                num_nonTMPro_any += is_nonTM_any
-                num_SPPro_cons += is_SP_cons
-                num_SPPro_any += is_SP_any
-
-            dgfile = "%s/%s/dg.txt"%(outpath_result, subfoldername)
-            dg_content = ""
-            if os.path.exists(dgfile):
-                dg_content = myfunc.ReadFile(dgfile)
-            lines = dg_content.split("\n")
-            dglines = []
-            for line in lines:
-                if line and line[0].isdigit():
-                    dglines.append(line)
-            if len(dglines)>0:
-                print("\nPredicted Delta-G-values (kcal/mol) "\
-                        "(left column=sequence position; right column=Delta-G)\n", file=fpout)
-                print("\n".join(dglines), file=fpout)
-
-            reliability_file = "%s/%s/Topcons/reliability.txt"%(outpath_result, subfoldername)
-            reliability = ""
-            if os.path.exists(reliability_file):
-                reliability = myfunc.ReadFile(reliability_file)
-            if reliability != "":
-                print("\nPredicted TOPCONS reliability (left "\
-                        "column=sequence position; right column=reliability)\n", file=fpout)
-                print(reliability, file=fpout)
-            print("##############################################################################", file=fpout)
-            cnt += 1
-
-        fpout.close()
-
-        if fpstat:
-            out_str_list = []
-            out_str_list.append("num_TMPro_cons %d"% num_TMPro_cons)
-            out_str_list.append("num_TMPro_any %d"% num_TMPro_any)
-            out_str_list.append("num_nonTMPro_cons %d"% num_nonTMPro_cons)
-            out_str_list.append("num_nonTMPro_any %d"% num_nonTMPro_any)
-            out_str_list.append("num_SPPro_cons %d"% num_SPPro_cons)
-            out_str_list.append("num_SPPro_any %d"% num_SPPro_any)
-            fpstat.write("%s"%("\n".join(out_str_list)))
-
-            fpstat.close()
-
-        rstdir = os.path.realpath("%s/.."%(outpath_result))
-        runjob_logfile = "%s/%s"%(rstdir, "runjob.log")
-        runjob_errfile = "%s/%s"%(rstdir, "runjob.err")
-        finishtagfile = "%s/%s"%(rstdir, "write_result_finish.tag")
-        WriteDateTimeTagFile(finishtagfile, runjob_logfile, runjob_errfile)
-    except IOError:
-        print("Failed to write to file %s"%(outfile))
+    WriteResultFileByWriter(RESULT_WRITER_DICT['topcons2'], outfile,
+            outpath_result, maplist, runtime_in_sec, base_www_url, statfile)
 #}}}
 
+RegisterResultWriter("topcons2", RenderTOPCONSSeqResult,
+        title="TOPCONS2 result file",
+        statkeys=["num_TMPro_cons", "num_TMPro_any", "num_nonTMPro_cons",
+            "num_nonTMPro_any", "num_SPPro_cons", "num_SPPro_any"])
+RegisterResultWriter("subcons", RenderSubconsSeqResult,
+        title="Subcons result file")
+RegisterResultWriter("boctopus2", RenderBoctopusSeqResult,
+        statkeys=["numTMPro"], statformat="%s\t%d\n")
+RegisterResultWriter("scampi2", RenderSCAMPI2MSASeqResult,
+        statkeys=["numTMPro"], statformat="%s\t%d\n",
+        itemlist=GetSCAMPI2MSAItemList, finalize=FinalizeSCAMPI2MSA)
+RegisterResultWriter("pconsc3", RenderPconsC3SeqResult,
+        title="PconsC3 result file")
+RegisterResultWriter("predzinc", RenderPredZincSeqResult,
+        title="PredZinc result file", statkeys=["num_ZB", "num_has_homo"])
+RegisterResultWriter("frag1d", RenderFrag1DSeqResult,
+        title="Frag1D result file")
+
 def WriteHTMLHeader(title, fpout):#{{{
     exturl = "https://topcons.net/static"
     print("<HTML>", file=fpout)
@@ -964,60 +1035,138 @@ def WriteHTMLTableContent_TOPCONS(tablename, tabletitle, index_table_header,#{{{
         index_table_content_list, fpout):
     """Write the content of the html table for TOPCONS
     """
-    print("<a name=\"%s\"></a><h4>%s</h4>"%(tablename,tabletitle), file=fpout)
-    print("<table class=\"sortable\" id=\"jobtable\" border=1>", file=fpout)
-    print("<thead>", file=fpout)
-    print("<tr>", file=fpout)
+    li = []
+    li.append("<a name=\"%s\"></a><h4>%s</h4>\n"%(tablename,tabletitle))
+    li.append("<table class=\"sortable\" id=\"jobtable\" border=1>\n")
+    li.append("<thead>\n<tr>\n")
     for item in index_table_header:
-        print("<th>", file=fpout)
-        print(item, file=fpout)
-        print("</th>", file=fpout)
-    print("</tr>", file=fpout)
-    print("</thead>", file=fpout)
-
-    print("<tbody>", file=fpout)
-
-    for record in index_table_content_list:
-        print("<tr>", file=fpout)
-        for i in range(6):
-            print("<td>%s</td>"%(record[i]), file=fpout)
-        print("<td>", file=fpout)
-        print("<a href=\"%s/Topcons/total_image.png\">Fig_all</a>"%(record[6]), file=fpout)
-        print("<a href=\"%s/Topcons/topcons.png\">Fig_topcons</a><br>"%(record[6]), file=fpout)
-        print("<a href=\"%s/query.result.txt\">Dumped prediction</a><br>"%(record[6]), file=fpout)
-        print("<a href=\"%s/dg.txt\">deltaG</a><br>"%(record[6]), file=fpout)
-        print("<a href=\"%s/nicetop.html\">Topology view</a><br>"%(record[6]), file=fpout)
-        print("</td>", file=fpout)
-        print("<td>%s</td>"%(record[7]), file=fpout)
-        print("</tr>", file=fpout)
-
-    print("</tbody>", file=fpout)
-    print("</table>", file=fpout)
+        li.append("<th>\n%s\n</th>\n"%(item))
+    li.append("</tr>\n</thead>\n<tbody>\n")
+    row_template = "<tr>\n" + "<td>%s</td>\n"*6 +\
+            "<td>\n"\
+            "<a href=\"%s/Topcons/total_image.png\">Fig_all</a>\n"\
+            "<a href=\"%s/Topcons/topcons.png\">Fig_topcons</a><br>\n"\
+            "<a href=\"%s/query.result.txt\">Dumped prediction</a><br>\n"\
+            "<a href=\"%s/dg.txt\">deltaG</a><br>\n"\
+            "<a href=\"%s/nicetop.html\">Topology view</a><br>\n"\
+            "</td>\n"\
+            "<td>%s</td>\n"\
+            "</tr>\n"
+    li.append("".join([row_template%(tuple(record[:6]) + (record[6],)*5 +
+        (record[7],)) for record in index_table_content_list]))
+    li.append("</tbody>\n</table>\n")
+    fpout.write("".join(li))
+#}}}
+def WriteHTMLPagedTableShell_TOPCONS(title, datadir_name, fpout):#{{{
+    """Write a light html page which loads the rows of the result table page
+    by page from the json files in datadir_name
+    """
+    exturl = "https://topcons.net/static"
+    li = []
+    li.append("<HTML>\n<head>\n<title>%s</title>\n"%(title))
+    li.append("<link rel=\"stylesheet\" href=\"%s/css/template_css.css\" type=\"text/css\" />\n"%(exturl))
+    li.append("</head>\n<BODY>\n<dir id=\"Content\">\n")
+    li.append("<div id=\"pager\">\n"
+            "<button id=\"prev\">&lt; Prev</button>\n"
+            "Page <input id=\"pageno\" size=\"5\" value=\"1\"/> of <span id=\"numpage\"></span>\n"
+            "<button id=\"next\">Next &gt;</button>\n"
+            "(<span id=\"numrow\"></span> sequences)\n"
+            "</div>\n")
+    li.append("<table id=\"jobtable\" border=1>\n<thead>\n<tr id=\"header\"></tr>\n</thead>\n"
+            "<tbody id=\"rows\"></tbody>\n</table>\n</dir>\n")
+    li.append("""<script>
+var datadir = "%s";
+var info = null;
+var page = 0;
+function cell(tr, text) {
+    var td = document.createElement("td");
+    td.textContent = text;
+    tr.appendChild(td);
+}
+function showPage(p) {
+    if (info === null || p < 0 || p >= info.numpage) { return; }
+    fetch(datadir + "/page_" + p + ".json").then(function(r) { return r.json(); }).then(function(rows) {
+        var tbody = document.getElementById("rows");
+        var frag = document.createDocumentFragment();
+        rows.forEach(function(record) {
+            var tr = document.createElement("tr");
+            for (var i = 0; i < 6; i++) { cell(tr, record[i]); }
+            var td = document.createElement("td");
+            var d = record[6];
+            td.innerHTML = "<a href=\\"" + d + "/Topcons/total_image.png\\">Fig_all</a> " +
+                "<a href=\\"" + d + "/Topcons/topcons.png\\">Fig_topcons</a><br>" +
+                "<a href=\\"" + d + "/query.result.txt\\">Dumped prediction</a><br>" +
+                "<a href=\\"" + d + "/dg.txt\\">deltaG</a><br>" +
+                "<a href=\\"" + d + "/nicetop.html\\">Topology view</a><br>";
+            tr.appendChild(td);
+            cell(tr, record[7]);
+            frag.appendChild(tr);
+        });
+        tbody.replaceChildren(frag);
+        page = p;
+        document.getElementById("pageno").value = p + 1;
+    });
+}
+fetch(datadir + "/index.json").then(function(r) { return r.json(); }).then(function(data) {
+    info = data;
+    var header = document.getElementById("header");
+    info.header.forEach(function(item) {
+        var th = document.createElement("th");
+        th.textContent = item;
+        header.appendChild(th);
+    });
+    document.getElementById("numpage").textContent = info.numpage;
+    document.getElementById("numrow").textContent = info.numrow;
+    showPage(0);
+});
+document.getElementById("prev").onclick = function() { showPage(page - 1); };
+document.getElementById("next").onclick = function() { showPage(page + 1); };
+document.getElementById("pageno").onchange = function() {
+    showPage(parseInt(this.value) - 1);
+};
+</script>
+"""%(datadir_name))
+    fpout.write("".join(li))
+    WriteHTMLTail(fpout)
+#}}}
+def WriteHTMLTablePagedData(datadir, index_table_header, #{{{
+        index_table_content_list, pagesize):
+    """Write the rows of the html table as json files with pagesize rows per
+    file, page_0.json, page_1.json, ..., and the index.json
+    """
+    if not os.path.exists(datadir):
+        os.makedirs(datadir)
+    numrow = len(index_table_content_list)
+    numpage = max(1, (numrow + pagesize - 1)//pagesize)
+    for i in range(numpage):
+        content = json.dumps(index_table_content_list[i*pagesize:(i+1)*pagesize],
+                separators=(',', ':'))
+        myfunc.WriteFile(content, "%s/page_%d.json"%(datadir, i), "w")
+    info = {'numrow': numrow, 'pagesize': pagesize, 'numpage': numpage,
+            'header': index_table_header}
+    myfunc.WriteFile(json.dumps(info), "%s/index.json"%(datadir), "w")
 #}}}
 
 
 @timeit
-def WriteHTMLResultTable_TOPCONS(outfile, finished_seq_file):#{{{
+def WriteHTMLResultTable_TOPCONS(outfile, finished_seq_file, pagesize=1000,#{{{
+        max_row_single_page=2000):
     """Write html table for the results
-    """
-    try:
-        fpout = open(outfile, "w")
-    except OSError:
-        print("Failed to write to file %s at%s"%(outfile,
-                sys._getframe().f_code.co_name ), file=sys.stderr)
-        return 1
 
+    When there are more than max_row_single_page rows, the rows are written
+    as json files with pagesize rows each in the folder <outfile>.data (with
+    the extension .html removed) and outfile is a light page loading the rows
+    page by page.
+    """
     title="TOPCONS2 predictions"
-    WriteHTMLHeader(title, fpout)
-    print("<dir id=\"Content\">", file=fpout)
     tablename = 'table1'
     tabletitle = ""
     index_table_header = ["No.", "Length", "numTM",
             "SignalPeptide", "RunTime(s)", "SequenceName", "Prediction", "Source" ]
     index_table_content_list = []
-    indexmap_content = myfunc.ReadFile(finished_seq_file).split("\n")
+    hdl = myfunc.ReadLineByBlock(finished_seq_file)
     cnt = 0
-    for line in indexmap_content:
+    for line in hdl:
         strs = line.split("\t")
         if len(strs)>=7:
             subfolder = strs[0]
@@ -1036,11 +1185,28 @@ def WriteHTMLResultTable_TOPCONS(outfile, finished_seq_file):#{{{
             index_table_content_list.append([rank, length_str, numTM_str,
                 isHasSP, runtime_in_sec_str, desp, subfolder, source])
             cnt += 1
-    WriteHTMLTableContent_TOPCONS(tablename, tabletitle, index_table_header,
-            index_table_content_list, fpout)
-    print("</dir>", file=fpout)
+    if not hdl.failure:
+        hdl.close()
 
-    WriteHTMLTail(fpout)
+    try:
+        fpout = open(outfile, "w")
+    except OSError:
+        print("Failed to write to file %s at%s"%(outfile,
+                sys._getframe().f_code.co_name ), file=sys.stderr)
+        return 1
+
+    if len(index_table_content_list) > max_row_single_page:
+        datadir = os.path.splitext(outfile)[0] + ".data"
+        WriteHTMLTablePagedData(datadir, index_table_header,
+                index_table_content_list, pagesize)
+        WriteHTMLPagedTableShell_TOPCONS(title, os.path.basename(datadir), fpout)
+    else:
+        WriteHTMLHeader(title, fpout)
+        print("<dir id=\"Content\">", file=fpout)
+        WriteHTMLTableContent_TOPCONS(tablename, tabletitle, index_table_header,
+                index_table_content_list, fpout)
+        print("</dir>", file=fpout)
+        WriteHTMLTail(fpout)
     fpout.close()
 
     rstdir = os.path.abspath(os.path.dirname(os.path.abspath(outfile))+'/../')
@@ -1137,6 +1303,7 @@ def datetime_str_to_epoch(date_str):# {{{
     The string of date_time may with or without the zone info
     return the epoch time of the current time when conversion failed
     """
+    from dateutil import parser as dtparser
     try:
         return dtparser.parse(date_str).strftime("%s")
     except:
@@ -1148,6 +1315,7 @@ def datetime_str_to_time(date_str, isSetDefault=True):# {{{
     return the the current time when conversion failed if isSetDefault is True
     otherwise return None when conversion failed
     """
+    from dateutil import parser as dtparser
     try:
         strs = date_str.split()
         if len(strs) == 2:
@@ -1158,6 +1326,7 @@ def datetime_str_to_time(date_str, isSetDefault=True):# {{{
         return dt
     except:
         if isSetDefault:
+            from pytz import timezone
             return datetime.now(timezone(TZ))
         else:
             return None
@@ -1181,39 +1350,99 @@ def IsFrontEndNode(base_www_url):#{{{
         else:
             return True
 #}}}
+def GetNewRunTimeSidecarFile(finished_seq_file):#{{{
+    """Get the name of the file keeping the runtimes of the last newrun tasks
+    for finished_seq_file
+    """
+    return os.path.splitext(finished_seq_file)[0] + ".newruntime.json"
+#}}}
+def ReadLastNewRunTime(finished_seq_file, window=100):#{{{
+    """Read the runtimes of the last x number of newrun tasks from
+    finished_seq_file by reading the file from the end. The runtimes are
+    returned in the order of the file.
+    """
+    logger = logging.getLogger(__name__)
+    runtimeList = []
+    hdl = myfunc.ReadLineByBlock(finished_seq_file, isReverse=True)
+    if hdl.failure:
+        return runtimeList
+    for line in hdl:
+        strs = line.split("\t")
+        if len(strs)>=7 and strs[4] == "newrun":
+            try:
+                runtimeList.append(float(strs[5]))
+            except ValueError:
+                logger.debug("bad format in finished_seq_file (%s) with line \"%s\""%(finished_seq_file, line))
+                continue
+            if len(runtimeList) >= window:
+                break
+    hdl.close()
+    runtimeList.reverse()
+    return runtimeList
+#}}}
+def WriteNewRunTimeSidecar(finished_seq_file, runtimeList, window=100):#{{{
+    """Write the runtimes of the last newrun tasks together with the current
+    size of finished_seq_file, so that the estimate can be read without
+    scanning finished_seq_file
+    """
+    sidecarfile = GetNewRunTimeSidecarFile(finished_seq_file)
+    try:
+        filesize = os.path.getsize(finished_seq_file)
+    except OSError:
+        return 1
+    content = json.dumps({'filesize': filesize, 'window': window,
+        'runtime': runtimeList[-window:]})
+    tmpfile = "%s.tmp%d"%(sidecarfile, os.getpid())
+    if myfunc.WriteFile(content, tmpfile, "w") != "":
+        return 1
+    os.replace(tmpfile, sidecarfile)
+    return 0
+#}}}
+def WriteFinishedSeqInfo(finished_info_list, finished_seq_file, window=100):#{{{
+    """Append the info lines of finished sequences to finished_seq_file and
+    update the sidecar file with the runtimes of the last newrun tasks
+    """
+    if len(finished_info_list) == 0:
+        return 0
+    try:
+        size_before = os.path.getsize(finished_seq_file)
+    except OSError:
+        size_before = 0
+    if myfunc.WriteFile("\n".join(finished_info_list)+"\n",
+            finished_seq_file, "a", True) != "":
+        return 1
+    sidecar = LoadJsonFromFile(GetNewRunTimeSidecarFile(finished_seq_file))
+    if (size_before > 0 and (sidecar.get('filesize', -1) != size_before
+            or sidecar.get('window', -1) < window)):
+        # the sidecar file is missing or out of date, rebuild it
+        runtimeList = ReadLastNewRunTime(finished_seq_file, window)
+    else:
+        runtimeList = sidecar.get('runtime', [])
+        for line in finished_info_list:
+            strs = line.split("\t")
+            if len(strs)>=7 and strs[4] == "newrun":
+                try:
+                    runtimeList.append(float(strs[5]))
+                except ValueError:
+                    pass
+    return WriteNewRunTimeSidecar(finished_seq_file, runtimeList, window)
+#}}}
 def GetAverageNewRunTime(finished_seq_file, window=100):#{{{
     """Get average running time of the newrun tasks for the last x number of
 sequences
     """
-    logger = logging.getLogger(__name__)
     avg_newrun_time = -1.0
     if not os.path.exists(finished_seq_file):
         return avg_newrun_time
+    sidecar = LoadJsonFromFile(GetNewRunTimeSidecarFile(finished_seq_file))
+    if (sidecar.get('filesize', -1) == os.path.getsize(finished_seq_file)
+            and sidecar.get('window', -1) >= window):
+        runtimeList = sidecar['runtime'][-window:]
     else:
-        indexmap_content = myfunc.ReadFile(finished_seq_file).split("\n")
-        indexmap_content = indexmap_content[::-1]
-        cnt = 0
-        sum_run_time = 0.0
-        for line in indexmap_content:
-            strs = line.split("\t")
-            if len(strs)>=7:
-                source = strs[4]
-                if source == "newrun":
-                    try:
-                        sum_run_time += float(strs[5])
-                        cnt += 1
-                    except:
-                        logger.debug("bad format in finished_seq_file (%s) with line \"%s\""%(finished_seq_file, line))
-                        pass
-
-                if cnt >= window:
-                    break
-
-        if cnt > 0:
-            avg_newrun_time = sum_run_time/float(cnt)
-        return avg_newrun_time
-
-
+        runtimeList = ReadLastNewRunTime(finished_seq_file, window)
+    if len(runtimeList) > 0:
+        avg_newrun_time = sum(runtimeList)/float(len(runtimeList))
+    return avg_newrun_time
 #}}}
 def GetRunTimeFromTimeFile(timefile, keyword=""):# {{{
     runtime = 0.0
@@ -1309,124 +1538,129 @@ def ValidateQuery(request, query, g_params):#{{{
                 return False
 
             fp.seek(0,0)
-            content = fp.read()
         except KeyError:
             query['errinfo_br'] += ""
             query['errinfo_content'] += """
             Failed to read uploaded file \"%s\"
             """%(query['seqfile'])
             return False
-        query['rawseq'] = content.decode('utf-8')
-
-    query['filtered_seq'] = ValidateSeq(query['rawseq'], query, g_params)
+        # validate while reading the uploaded file so that the content is not
+        # kept in memory in both bytes and str
+        rawseqList = []
+        query['filtered_seq'] = ValidateSeqFromFile(fp, query, g_params,
+                rawseqList)
+        query['rawseq'] = "".join(rawseqList)
+        del rawseqList
+    else:
+        query['filtered_seq'] = ValidateSeq(query['rawseq'], query, g_params)
     if 'variants' in query:
         query['filtered_variants'] = ValidateVariants(query['variants'], query, g_params)
     is_valid = query['isValidSeq']
     return is_valid
 #}}}
-def ValidateSeq(rawseq, seqinfo, g_params):#{{{
-# seq is the chunk of fasta file
-# seqinfo is a dictionary
-# return (filtered_seq)
-    rawseq = re.sub(r'[^\x00-\x7f]',r' ',rawseq) # remove non-ASCII characters
-    rawseq = re.sub(r'[\x00-\x09]',r' ',rawseq) # Filter non letter ASCII characters except CR (x13) LF (x10)
-    rawseq = re.sub(r'[\x11-\x12]',r' ',rawseq) # 
-    rawseq = re.sub(r'[\x13-\x1F]',r' ',rawseq) # 
-    filtered_seq = ""
-    # initialization
-    for item in ['errinfo_br', 'errinfo', 'errinfo_content', 'warninfo']:
-        if item not in seqinfo:
-            seqinfo[item] = ""
-
-    seqinfo['isValidSeq'] = True
-
-    seqRecordList = []
-    myfunc.ReadFastaFromBuffer(rawseq, seqRecordList, True, 0, 0)
-# filter empty sequences and any sequeces shorter than MIN_LEN_SEQ or longer
-# than MAX_LEN_SEQ
-    newSeqRecordList = []
-    li_warn_info = []
-    isHasEmptySeq = False
-    isHasShortSeq = False
-    isHasLongSeq = False
-    isHasDNASeq = False
-    cnt = 0
-    for rd in seqRecordList:
-        seq = rd[2].strip()
-        seqid = rd[0].strip()
-        if len(seq) == 0:
-            isHasEmptySeq = 1
-            msg = "Empty sequence %s (SeqNo. %d) is removed."%(seqid, cnt+1)
-            li_warn_info.append(msg)
-        elif len(seq) < g_params['MIN_LEN_SEQ']:
-            isHasShortSeq = 1
-            msg = "Sequence %s (SeqNo. %d) is removed since its length is < %d."%(seqid, cnt+1, g_params['MIN_LEN_SEQ'])
-            li_warn_info.append(msg)
-        elif len(seq) > g_params['MAX_LEN_SEQ']:
-            isHasLongSeq = True
-            msg = "Sequence %s (SeqNo. %d) is removed since its length is > %d."%(seqid, cnt+1, g_params['MAX_LEN_SEQ'])
-            li_warn_info.append(msg)
-        elif myfunc.IsDNASeq(seq):
-            isHasDNASeq = True
-            msg = "Sequence %s (SeqNo. %d) is removed since it looks like a DNA sequence."%(seqid, cnt+1)
-            li_warn_info.append(msg)
+# Characters kept in the query: LF (x0a) to x10 and the printable ASCII, all
+# others, including non-ASCII characters, are replaced by whitespace
+SEQ_FILTER_PATTERN = re.compile(r'[^\x0a-\x10\x20-\x7f]')
+SEQ_ALLOWED_BYTES = bytes(range(0x0a, 0x11)) + bytes(range(0x20, 0x80))
+AA_LETTERS = b"ABCDEFGHIKLMNPQRSTUVWYZX*-"
+AA_LETTERS_STANDARD = b"ACDEFGHIKLMNPQRSTVWYX"
+BAD_AA_PATTERN = re.compile(r'[^ABCDEFGHIKLMNPQRSTUVWYZX*-]')
+NONSTANDARD_AA_PATTERN = re.compile(r'[BZU*-]')
+NONSTANDARD_AA_TRANS_TABLE = str.maketrans({'B':'X', 'Z':'X', 'U':'C',
+    '*':None, '-':None})
+class SeqValidator(object):#{{{
+# Description:
+#   Validate the query sequences record by record in a single pass, so that
+#   the query can be validated while it is being read. The warning and error
+#   messages are the same as those of the multi-pass ValidateSeq in the
+#   earlier versions
+#
+# Usage:
+#     validator = SeqValidator(g_params)
+#     validator.AddRecordList(seqRecordList) # as many times as needed
+#     filtered_seq = validator.Finish(seqinfo)
+    def __init__(self, g_params):#{{{
+        self.g_params = g_params
+        self.li_remove_info = [] # warnings for removed sequences
+        self.li_convert_info = [] # warnings for converted letters
+        self.li_badseq_info = []
+        self.li_newseq = []
+        self.cnt = 0 # number of records read
+        self.numseq = 0 # number of sequences after filtering
+        self.isHasEmptySeq = False
+        self.isHasShortSeq = False
+        self.isHasLongSeq = False
+        self.isHasDNASeq = False
+        self.firstchar = None # the first non-whitespace character of the query
+#}}}
+    def AddText(self, text):#{{{
+        """Register the filtered text of the query, only the beginning is
+        checked for the FASTA format"""
+        if self.firstchar is None:
+            t_text = text.lstrip()
+            if t_text:
+                self.firstchar = t_text[0]
+#}}}
+    def IsDNASeq(self, bseq):#{{{
+        """Same as myfunc.IsDNASeq but for the upper case sequence in bytes"""
+        numgap = bseq.count(b'-')
+        sumACGTU = len(bseq) - len(bseq.translate(None, b"ACGTU"))
+        if (myfunc.FloatDivision(sumACGTU, len(bseq)-numgap) > 0.75 and
+                65 in bseq and 67 in bseq and 84 in bseq and 71 in bseq): # A C T G
+            return True
         else:
-            newSeqRecordList.append(rd)
-        cnt += 1
-    seqRecordList = newSeqRecordList
-
-    numseq = len(seqRecordList)
-
-    if numseq < 1:
-        seqinfo['errinfo_br'] += "Number of input sequences is 0!\n"
-        t_rawseq = rawseq.lstrip()
-        if t_rawseq and t_rawseq[0] != '>':
-            seqinfo['errinfo_content'] += "Bad input format. The FASTA format should have an annotation line start with '>'.\n"
-        if len(li_warn_info) >0:
-            seqinfo['errinfo_content'] += "\n".join(li_warn_info) + "\n"
-        if not isHasShortSeq and not isHasEmptySeq and not isHasLongSeq and not isHasDNASeq:
-            seqinfo['errinfo_content'] += "Please input your sequence in FASTA format.\n"
-
-        seqinfo['isValidSeq'] = False
-    elif numseq > g_params['MAX_NUMSEQ_PER_JOB']:
-        seqinfo['errinfo_br'] += "Number of input sequences exceeds the maximum (%d)!\n"%(
-                g_params['MAX_NUMSEQ_PER_JOB'])
-        seqinfo['errinfo_content'] += "Your query has %d sequences. "%(numseq)
-        seqinfo['errinfo_content'] += "However, the maximal allowed sequences per job is %d. "%(
-                g_params['MAX_NUMSEQ_PER_JOB'])
-        seqinfo['errinfo_content'] += "Please split your query into smaller files and submit again.\n"
-        seqinfo['isValidSeq'] = False
-    else:
-        li_badseq_info = []
-        if 'isForceRun' in seqinfo and seqinfo['isForceRun'] and numseq > g_params['MAX_NUMSEQ_FOR_FORCE_RUN']:
-            seqinfo['errinfo_br'] += "Invalid input!"
-            seqinfo['errinfo_content'] += "You have chosen the \"Force Run\" mode. "\
-                    "The maximum allowable number of sequences of a job is %d. "\
-                    "However, your input has %d sequences."%(g_params['MAX_NUMSEQ_FOR_FORCE_RUN'], numseq)
-            seqinfo['isValidSeq'] = False
-
+            return False
+#}}}
+    def AddRecordList(self, seqRecordList):#{{{
+        """Validate records read by myfunc.ReadFastaFromBuffer. Whitespaces
+        have already been removed from the sequence by the reader"""
+        MIN_LEN_SEQ = self.g_params['MIN_LEN_SEQ']
+        MAX_LEN_SEQ = self.g_params['MAX_LEN_SEQ']
+        MAX_NUMSEQ_PER_JOB = self.g_params['MAX_NUMSEQ_PER_JOB']
+        for rd in seqRecordList:
+            seq = rd[2]
+            seqid = rd[0].strip()
+            self.cnt += 1
+            if len(seq) == 0:
+                self.isHasEmptySeq = 1
+                msg = "Empty sequence %s (SeqNo. %d) is removed."%(seqid, self.cnt)
+                self.li_remove_info.append(msg)
+                continue
+            elif len(seq) < MIN_LEN_SEQ:
+                self.isHasShortSeq = 1
+                msg = "Sequence %s (SeqNo. %d) is removed since its length is < %d."%(seqid, self.cnt, MIN_LEN_SEQ)
+                self.li_remove_info.append(msg)
+                continue
+            elif len(seq) > MAX_LEN_SEQ:
+                self.isHasLongSeq = True
+                msg = "Sequence %s (SeqNo. %d) is removed since its length is > %d."%(seqid, self.cnt, MAX_LEN_SEQ)
+                self.li_remove_info.append(msg)
+                continue
+            seq = seq.upper()
+            bseq = seq.encode('ascii')
+            if self.IsDNASeq(bseq):
+                self.isHasDNASeq = True
+                msg = "Sequence %s (SeqNo. %d) is removed since it looks like a DNA sequence."%(seqid, self.cnt)
+                self.li_remove_info.append(msg)
+                continue
 
-# checking for bad sequences in the query
+            self.numseq += 1
+            i = self.numseq
+            if i > MAX_NUMSEQ_PER_JOB:
+                # the query will be rejected anyway, only the number of
+                # sequences is needed
+                continue
 
-    if seqinfo['isValidSeq']:
-        for i in range(numseq):
-            seq = seqRecordList[i][2].strip()
-            anno = seqRecordList[i][1].strip().replace('\t', ' ')
-            seqid = seqRecordList[i][0].strip()
-            seq = seq.upper()
-            seq = re.sub("[\s\n\r\t]", '', seq)
-            li1 = [m.start() for m in re.finditer("[^ABCDEFGHIKLMNPQRSTUVWYZX*-]", seq)]
-            if len(li1) > 0:
-                for j in range(len(li1)):
+            if bseq.translate(None, AA_LETTERS):
+                for m in BAD_AA_PATTERN.finditer(seq):
                     msg = "Bad letter for amino acid in sequence %s (SeqNo. %d) "\
-                            "at position %d (letter: '%s')"%(seqid, i+1,
-                                    li1[j]+1, seq[li1[j]])
-                    li_badseq_info.append(msg)
-
-        if len(li_badseq_info) > 0:
-            seqinfo['errinfo_br'] += "There are bad letters for amino acids in your query!\n"
-            seqinfo['errinfo_content'] = "\n".join(li_badseq_info) + "\n"
-            seqinfo['isValidSeq'] = False
+                            "at position %d (letter: '%s')"%(seqid, i,
+                                    m.start()+1, m.group())
+                    self.li_badseq_info.append(msg)
+                continue
+            if self.li_badseq_info:
+                # the query is invalid, skip the conversion
+                continue
 
 # convert some non-classical letters to the standard amino acid symbols
 # Scheme:
@@ -1434,68 +1668,150 @@ def ValidateSeq(rawseq, seqinfo, g_params):#{{{
 #    B, Z -> X
 #    U -> C
 #    *, - will be deleted
-    if seqinfo['isValidSeq']:
-        li_newseq = []
-        for i in range(numseq):
-            seq = seqRecordList[i][2].strip()
-            anno = seqRecordList[i][1].strip()
-            seqid = seqRecordList[i][0].strip()
-            seq = seq.upper()
-            seq = re.sub("[\s\n\r\t]", '', seq)
-            anno = anno.replace('\t', ' ') #replace tab by whitespace
-
-
-            li1 = [m.start() for m in re.finditer("[BZ]", seq)]
-            if len(li1) > 0:
-                for j in range(len(li1)):
-                    msg = "Amino acid in sequence %s (SeqNo. %d) at position %d "\
-                            "(letter: '%s') has been replaced by 'X'"%(seqid,
-                                    i+1, li1[j]+1, seq[li1[j]])
-                    li_warn_info.append(msg)
-                seq = re.sub("[BZ]", "X", seq)
-
-            li1 = [m.start() for m in re.finditer("[U]", seq)]
-            if len(li1) > 0:
-                for j in range(len(li1)):
-                    msg = "Amino acid in sequence %s (SeqNo. %d) at position %d "\
-                            "(letter: '%s') has been replaced by 'C'"%(seqid,
-                                    i+1, li1[j]+1, seq[li1[j]])
-                    li_warn_info.append(msg)
-                seq = re.sub("[U]", "C", seq)
-
-            li1 = [m.start() for m in re.finditer("[*]", seq)]
-            if len(li1) > 0:
-                for j in range(len(li1)):
-                    msg = "Translational stop in sequence %s (SeqNo. %d) at position %d "\
-                            "(letter: '%s') has been deleted"%(seqid,
-                                    i+1, li1[j]+1, seq[li1[j]])
-                    li_warn_info.append(msg)
-                seq = re.sub("[*]", "", seq)
-
-            li1 = [m.start() for m in re.finditer("[-]", seq)]
-            if len(li1) > 0:
-                for j in range(len(li1)):
-                    msg = "Gap in sequence %s (SeqNo. %d) at position %d "\
-                            "(letter: '%s') has been deleted"%(seqid,
-                                    i+1, li1[j]+1, seq[li1[j]])
-                    li_warn_info.append(msg)
-                seq = re.sub("[-]", "", seq)
+# positions of gaps are reported after the deletion of translational stops
+            if bseq.translate(None, AA_LETTERS_STANDARD):
+                li_bz = []
+                li_u = []
+                li_stop = []
+                li_gap = []
+                numstop = 0
+                for m in NONSTANDARD_AA_PATTERN.finditer(seq):
+                    pos = m.start()
+                    letter = m.group()
+                    if letter == '-':
+                        msg = "Gap in sequence %s (SeqNo. %d) at position %d "\
+                                "(letter: '%s') has been deleted"%(seqid,
+                                        i, pos-numstop+1, letter)
+                        li_gap.append(msg)
+                    elif letter == '*':
+                        msg = "Translational stop in sequence %s (SeqNo. %d) at position %d "\
+                                "(letter: '%s') has been deleted"%(seqid,
+                                        i, pos+1, letter)
+                        li_stop.append(msg)
+                        numstop += 1
+                    elif letter == 'U':
+                        msg = "Amino acid in sequence %s (SeqNo. %d) at position %d "\
+                                "(letter: '%s') has been replaced by 'C'"%(seqid,
+                                        i, pos+1, letter)
+                        li_u.append(msg)
+                    else:
+                        msg = "Amino acid in sequence %s (SeqNo. %d) at position %d "\
+                                "(letter: '%s') has been replaced by 'X'"%(seqid,
+                                        i, pos+1, letter)
+                        li_bz.append(msg)
+                self.li_convert_info += li_bz + li_u + li_stop + li_gap
+                seq = seq.translate(NONSTANDARD_AA_TRANS_TABLE)
 
             # check the sequence length again after potential removal of
             # translation stop
-            if len(seq) < g_params['MIN_LEN_SEQ']:
-                isHasShortSeq = 1
-                msg = "Sequence %s (SeqNo. %d) is removed since its length is < %d (after removal of translation stop)."%(seqid, i+1, g_params['MIN_LEN_SEQ'])
-                li_warn_info.append(msg)
+            if len(seq) < MIN_LEN_SEQ:
+                self.isHasShortSeq = 1
+                msg = "Sequence %s (SeqNo. %d) is removed since its length is < %d (after removal of translation stop)."%(seqid, i, MIN_LEN_SEQ)
+                self.li_convert_info.append(msg)
             else:
-                li_newseq.append(">%s\n%s"%(anno, seq))
+                anno = rd[1].strip().replace('\t', ' ') #replace tab by whitespace
+                self.li_newseq.append(">%s\n%s"%(anno, seq))
+#}}}
+    def Finish(self, seqinfo):#{{{
+        """Write the validation result to seqinfo
+        Return (filtered_seq)
+        """
+        g_params = self.g_params
+        filtered_seq = ""
+        # initialization
+        for item in ['errinfo_br', 'errinfo', 'errinfo_content', 'warninfo']:
+            if item not in seqinfo:
+                seqinfo[item] = ""
+
+        seqinfo['isValidSeq'] = True
+        numseq = self.numseq
+
+        if numseq < 1:
+            seqinfo['errinfo_br'] += "Number of input sequences is 0!\n"
+            if self.firstchar is not None and self.firstchar != '>':
+                seqinfo['errinfo_content'] += "Bad input format. The FASTA format should have an annotation line start with '>'.\n"
+            if len(self.li_remove_info) >0:
+                seqinfo['errinfo_content'] += "\n".join(self.li_remove_info) + "\n"
+            if (not self.isHasShortSeq and not self.isHasEmptySeq and
+                    not self.isHasLongSeq and not self.isHasDNASeq):
+                seqinfo['errinfo_content'] += "Please input your sequence in FASTA format.\n"
 
-        filtered_seq = "\n".join(li_newseq) # seq content after validation
-        seqinfo['numseq'] = len(li_newseq)
-        seqinfo['warninfo'] = "\n".join(li_warn_info) + "\n"
+            seqinfo['isValidSeq'] = False
+        elif numseq > g_params['MAX_NUMSEQ_PER_JOB']:
+            seqinfo['errinfo_br'] += "Number of input sequences exceeds the maximum (%d)!\n"%(
+                    g_params['MAX_NUMSEQ_PER_JOB'])
+            seqinfo['errinfo_content'] += "Your query has %d sequences. "%(numseq)
+            seqinfo['errinfo_content'] += "However, the maximal allowed sequences per job is %d. "%(
+                    g_params['MAX_NUMSEQ_PER_JOB'])
+            seqinfo['errinfo_content'] += "Please split your query into smaller files and submit again.\n"
+            seqinfo['isValidSeq'] = False
+        elif ('isForceRun' in seqinfo and seqinfo['isForceRun'] and
+                numseq > g_params['MAX_NUMSEQ_FOR_FORCE_RUN']):
+            seqinfo['errinfo_br'] += "Invalid input!"
+            seqinfo['errinfo_content'] += "You have chosen the \"Force Run\" mode. "\
+                    "The maximum allowable number of sequences of a job is %d. "\
+                    "However, your input has %d sequences."%(g_params['MAX_NUMSEQ_FOR_FORCE_RUN'], numseq)
+            seqinfo['isValidSeq'] = False
+        elif len(self.li_badseq_info) > 0:
+            seqinfo['errinfo_br'] += "There are bad letters for amino acids in your query!\n"
+            seqinfo['errinfo_content'] = "\n".join(self.li_badseq_info) + "\n"
+            seqinfo['isValidSeq'] = False
+        else:
+            filtered_seq = "\n".join(self.li_newseq) # seq content after validation
+            seqinfo['numseq'] = len(self.li_newseq)
+            seqinfo['warninfo'] = "\n".join(self.li_remove_info +
+                    self.li_convert_info) + "\n"
 
-    seqinfo['errinfo'] = seqinfo['errinfo_br'] + seqinfo['errinfo_content']
-    return filtered_seq
+        seqinfo['errinfo'] = seqinfo['errinfo_br'] + seqinfo['errinfo_content']
+        return filtered_seq
+#}}}
+#}}}
+def FilterQueryText(text):#{{{
+    """Replace the characters not allowed in the query by whitespace"""
+    # bytes.translate is much faster than re, so check first whether there is
+    # anything to replace
+    if text.isascii() and not text.encode('ascii').translate(None,
+            SEQ_ALLOWED_BYTES):
+        return text
+    return SEQ_FILTER_PATTERN.sub(' ', text)
+#}}}
+def ValidateSeq(rawseq, seqinfo, g_params):#{{{
+# seq is the chunk of fasta file
+# seqinfo is a dictionary
+# return (filtered_seq)
+    rawseq = FilterQueryText(rawseq)
+    validator = SeqValidator(g_params)
+    validator.AddText(rawseq)
+    seqRecordList = []
+    myfunc.ReadFastaFromBuffer(rawseq, seqRecordList, True, 0, 0)
+    del rawseq
+    validator.AddRecordList(seqRecordList)
+    return validator.Finish(seqinfo)
+#}}}
+def ValidateSeqFromFile(fpin, seqinfo, g_params, rawseqList=None, #{{{
+        BLOCK_SIZE=1024*1024):
+    """Validate the query sequences while reading the file object fpin (in
+    binary mode, e.g. the uploaded file) block by block.
+    If rawseqList is a list, the decoded raw text is appended to it
+    return (filtered_seq)
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    validator = SeqValidator(g_params)
+    unprocessedBuffer = ""
+    isEOFreached = False
+    while not isEOFreached:
+        data = fpin.read(BLOCK_SIZE)
+        isEOFreached = not data
+        text = decoder.decode(data, final=isEOFreached)
+        if rawseqList is not None:
+            rawseqList.append(text)
+        text = FilterQueryText(text)
+        validator.AddText(text)
+        seqRecordList = []
+        unprocessedBuffer = myfunc.ReadFastaFromBuffer(unprocessedBuffer+text,
+                seqRecordList, isEOFreached, 0, 0)
+        validator.AddRecordList(seqRecordList)
+    return validator.Finish(seqinfo)
 #}}}
 def ValidateVariants(rawvariants, seqinfo, g_params):#{{{
     # rawvariants is raw input from variants form
@@ -1541,32 +1857,275 @@ def ValidateVariants(rawvariants, seqinfo, g_params):#{{{
     seqinfo['errinfo'] = seqinfo['errinfo_br'] + seqinfo['errinfo_content']
     return filtered_variants
 #}}}
-def InsertFinishDateToDB(date_str, md5_key, seq, outdb):# {{{
+def FinishDateToEpoch(date_str):# {{{
+    """Convert the finish date in FORMAT_DATETIME to the epoch time
+    Dates in UTC are converted without dateutil, dates without zone info are
+    taken as UTC
+    return the current epoch time when conversion failed
+    """
+    strs = date_str.split()
+    if len(strs) == 2 or (len(strs) == 3 and strs[2] in ["UTC", "GMT", "U"]):
+        try:
+            dt = datetime.strptime("%s %s"%(strs[0], strs[1]), "%Y-%m-%d %H:%M:%S")
+            return calendar.timegm(dt.timetuple())
+        except ValueError:
+            pass
+    dt = datetime_str_to_time(date_str)
+    if dt.tzinfo is None:
+        return calendar.timegm(dt.timetuple())
+    else:
+        return int(dt.timestamp())
+# }}}
+def InitFinishDateDB(con, tbname="data"):# {{{
+    """Create the table of the cached results if not exists.
+    Columns
+        md5, seq, date_finish : as in the earlier versions
+        epoch_finish          : finish date in epoch time
+        epoch_access          : time of the last cache hit in epoch time
+        num_access            : number of cache hits
+        size                  : size of the zipped result in bytes
+    The columns and indices missing in the databases created by the earlier
+    versions are added, the values are filled by FillFinishDateDB
+    """
+    cur = con.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS %s
+        (
+            md5 TEXT PRIMARY KEY,
+            seq TEXT,
+            date_finish TEXT,
+            epoch_finish INTEGER,
+            epoch_access INTEGER,
+            num_access INTEGER,
+            size INTEGER
+        )"""%(tbname))
+    columnlist = [row[1] for row in cur.execute("PRAGMA table_info(%s)"%(tbname))]
+    for colname in ["epoch_finish", "epoch_access", "num_access", "size"]:
+        if not colname in columnlist:
+            cur.execute("ALTER TABLE %s ADD COLUMN %s INTEGER"%(tbname, colname))
+    for (idxname, idxcols) in [("epoch_finish", "epoch_finish"),
+            ("epoch_access", "epoch_access"),
+            ("num_access", "num_access, epoch_access")]:
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_%s_%s ON %s(%s)"%(
+            tbname, idxname, tbname, idxcols))
+    # partial index of the records with size not filled yet, so that
+    # FillFinishDateDB finds them without a full table scan
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_%s_size_null ON %s(md5) "
+            "WHERE size IS NULL"%(tbname, tbname))
+    con.commit()
+# }}}
+def ConnectFinishDateDB(outdb, tbname="data", timeout=10):# {{{
+    """Connect to the database of cached results, the table is initialized
+    at the first connection of this process"""
+    import sqlite3
+    con = sqlite3.connect(outdb, timeout=timeout)
+    if not outdb in g_finish_date_db_set:
+        InitFinishDateDB(con, tbname)
+        g_finish_date_db_set.add(outdb)
+    return con
+# }}}
+def InsertFinishDateToDB(date_str, md5_key, seq, outdb, size=None):# {{{
     """ Insert the finish date to the sqlite3 database
+    size is the size of the zipped result in bytes
     """
     tbname_content = "data"
     try:
-        con = sqlite3.connect(outdb)
+        con = ConnectFinishDateDB(outdb, tbname_content)
     except Exception as e:
-        print(("Failed to connect to the database outdb %s"%(outdb)))
+        print("Failed to connect to the database outdb %s. errmsg=%s"%(outdb, str(e)), file=sys.stderr)
+        return 1
     with con:
         cur = con.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS %s
-            (
-                md5 TEXT PRIMARY KEY,
-                seq TEXT,
-                date_finish TEXT
-            )"""%(tbname_content))
-        cmd =  "INSERT OR REPLACE INTO %s(md5,  seq, date_finish) VALUES('%s', '%s','%s')"%(tbname_content, md5_key, seq, date_str)
+        epoch = FinishDateToEpoch(date_str)
+        cmd =  "INSERT OR REPLACE INTO %s(md5, seq, date_finish, epoch_finish, epoch_access, num_access, size) VALUES(?, ?, ?, ?, ?, 0, ?)"%(tbname_content)
         try:
-            cur.execute(cmd)
+            cur.execute(cmd, (md5_key, seq, date_str, epoch, epoch, size))
             return 0
         except Exception as e:
             print("Exception %s"%(str(e)), file=sys.stderr)
             return 1
 
 # }}}
+def UpdateCacheAccessToDB(md5_list, outdb):# {{{
+    """Record the cache hits of md5_list, the last access time is set to now
+    and the access count is increased by one
+    """
+    if len(md5_list) == 0:
+        return 0
+    tbname_content = "data"
+    now = int(time.time())
+    try:
+        con = ConnectFinishDateDB(outdb, tbname_content)
+        with con:
+            con.executemany("UPDATE %s SET epoch_access = ?, "
+                    "num_access = IFNULL(num_access, 0) + 1 WHERE md5 = ?"%(tbname_content),
+                    [(now, md5_key) for md5_key in md5_list])
+        con.close()
+    except Exception as e:
+        print("Failed to update cache access to %s. errmsg=%s"%(outdb, str(e)), file=sys.stderr)
+        return 1
+    return 0
+# }}}
+def GetCachedResultZipFile(path_cache, md5_key):# {{{
+    return "%s/%s/%s.zip"%(path_cache, md5_key[:2], md5_key)
+# }}}
+def GetCachedResultSize(md5_key, path_cache):# {{{
+    """Return (md5_key, size) of the zipped cached result, 0 if not exist"""
+    try:
+        return (md5_key, os.path.getsize(GetCachedResultZipFile(path_cache, md5_key)))
+    except OSError:
+        return (md5_key, 0)
+# }}}
+def DeleteCachedResultZipFile(md5_key, path_cache):# {{{
+    """Delete the zipped cached result
+    Return (md5_key, isDeleted, errmsg), isDeleted is also True if the
+    zipfile does not exist
+    """
+    zipfile_cache = GetCachedResultZipFile(path_cache, md5_key)
+    try:
+        os.remove(zipfile_cache)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        return (md5_key, False, "Failed to delete %s with errmsg %s"%(zipfile_cache, str(e)))
+    return (md5_key, True, "")
+# }}}
+def FillFinishDateDB(con, path_cache, logfile, tbname="data", num_thread=16,#{{{
+        chunk_size=10000):
+    """Fill the columns of the records inserted by the earlier versions, i.e.
+    epoch_finish, epoch_access, num_access and size
+    """
+    cur = con.cursor()
+    cnt = 0
+    while True:
+        rows = cur.execute("SELECT md5, date_finish FROM %s "
+                "WHERE epoch_finish IS NULL LIMIT %d"%(tbname, chunk_size)).fetchall()
+        if not rows:
+            break
+        cur.executemany("UPDATE %s SET epoch_finish = ? WHERE md5 = ?"%(tbname),
+                [(FinishDateToEpoch(str(row[1])), row[0]) for row in rows])
+        con.commit()
+        cnt += len(rows)
+    cur.execute("UPDATE %s SET epoch_access = epoch_finish WHERE epoch_access IS NULL"%(tbname))
+    cur.execute("UPDATE %s SET num_access = 0 WHERE num_access IS NULL"%(tbname))
+    con.commit()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_thread) as executor:
+        while True:
+            rows = cur.execute("SELECT md5 FROM %s WHERE size IS NULL LIMIT %d"%(
+                tbname, chunk_size)).fetchall()
+            if not rows:
+                break
+            cur.executemany("UPDATE %s SET size = ? WHERE md5 = ?"%(tbname),
+                    [(size, md5_key) for (md5_key, size) in executor.map(
+                        GetCachedResultSize, [row[0] for row in rows],
+                        [path_cache]*len(rows))])
+            con.commit()
+            cnt += len(rows)
+    if cnt > 0:
+        loginfo("Filled missing columns of %d records in the cache db"%(cnt), logfile)
+# }}}
+def EvictCachedResult(outdb, path_cache, policy, logfile, errfile,#{{{
+        max_keep_days=480, max_size_in_byte=0, max_num_evict=0,
+        num_thread=16, chunk_size=10000, isFill=True):
+    """Evict cached results by the policy
+        age : results finished more than max_keep_days days ago
+        lru : least recently used results, until the total size of the cache
+              is within max_size_in_byte
+        lfu : least frequently used results, the least recently used first
+              for the same frequency, until the total size of the cache is
+              within max_size_in_byte
+    lru and lfu require max_size_in_byte > 0, nothing is evicted otherwise
+    The candidates are selected by the index of the policy in pages, the
+    zipfiles are deleted by a pool of threads and the records are deleted in
+    batches with one transaction per batch.
+    max_num_evict: stop after evicting this number of results, 0 for no limit
+    Return (num_evicted, size_evicted_in_byte)
+    """
+    tbname = "data"
+    if policy == "age":
+        # results finished more than max_keep_days days ago, counted in
+        # whole days
+        epoch_threshold = int(time.time()) - (max_keep_days+1)*86400
+        keycols = ["epoch_finish", "md5"]
+        where = "epoch_finish <= %d"%(epoch_threshold)
+    elif policy in ["lru", "lfu"] and max_size_in_byte <= 0:
+        # without a budget the whole cache would be evicted
+        loginfo("No size budget (max_size_in_byte=%d) for the cache "
+                "eviction policy %s, skip"%(max_size_in_byte, policy), errfile)
+        return (0, 0)
+    elif policy == "lru":
+        keycols = ["epoch_access", "md5"]
+        where = "1"
+    elif policy == "lfu":
+        keycols = ["num_access", "epoch_access", "md5"]
+        where = "1"
+    else:
+        loginfo("Unknown cache eviction policy %s"%(policy), errfile)
+        return (0, 0)
+
+    con = ConnectFinishDateDB(outdb, tbname, timeout=60)
+    cur = con.cursor()
+    if isFill:
+        FillFinishDateDB(con, path_cache, logfile, tbname, num_thread, chunk_size)
+
+    size_to_evict = -1 # no limit on size for the policy age
+    if policy in ["lru", "lfu"]:
+        total_size = cur.execute("SELECT IFNULL(SUM(size), 0) FROM %s"%(tbname)).fetchone()[0]
+        size_to_evict = total_size - max_size_in_byte
+        loginfo("Size of the cache: %d bytes, budget: %d bytes"%(total_size,
+            max_size_in_byte), logfile)
+        if size_to_evict <= 0:
+            con.close()
+            return (0, 0)
+
+    keystr = ", ".join(keycols)
+    sql_first = "SELECT %s, size FROM %s WHERE %s ORDER BY %s LIMIT ?"%(
+            keystr, tbname, where, keystr)
+    sql_next = "SELECT %s, size FROM %s WHERE %s AND (%s) > (%s) ORDER BY %s LIMIT ?"%(
+            keystr, tbname, where, keystr, ", ".join(["?"]*len(keycols)), keystr)
+    num_evicted = 0
+    size_evicted = 0
+    lastkey = None
+    isStop = False
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_thread) as executor:
+        while not isStop:
+            # keyset paging, records failed to delete are not selected again
+            if lastkey is None:
+                rows = cur.execute(sql_first, (chunk_size,)).fetchall()
+            else:
+                rows = cur.execute(sql_next, lastkey + (chunk_size,)).fetchall()
+            if not rows:
+                break
+            lastkey = tuple(rows[-1][:len(keycols)])
+            sizedict = {}
+            size_page = 0
+            for row in rows:
+                md5_key = row[len(keycols)-1]
+                sizedict[md5_key] = row[-1] or 0
+                size_page += sizedict[md5_key]
+                if size_to_evict >= 0 and size_evicted + size_page >= size_to_evict:
+                    isStop = True
+                    break
+                if max_num_evict > 0 and num_evicted + len(sizedict) >= max_num_evict:
+                    isStop = True
+                    break
+            li_deleted = []
+            for (md5_key, isDeleted, errmsg) in executor.map(
+                    DeleteCachedResultZipFile, list(sizedict.keys()),
+                    [path_cache]*len(sizedict)):
+                if isDeleted:
+                    li_deleted.append((md5_key,))
+                    size_evicted += sizedict[md5_key]
+                else:
+                    loginfo(errmsg, errfile)
+            cur.executemany("DELETE FROM %s WHERE md5 = ?"%(tbname), li_deleted)
+            con.commit()
+            num_evicted += len(li_deleted)
+            loginfo("Evicted %d cached results (%d bytes) by policy %s"%(
+                num_evicted, size_evicted, policy), logfile)
+    con.close()
+    return (num_evicted, size_evicted)
+# }}}
 
 def GetInfoFinish(name_server, outpath_this_seq, origIndex, seqLength, seqAnno, source_result="", runtime=0.0):# {{{
     """Get the list info_finish for finished prediction"""
@@ -1739,10 +2298,10 @@ def WriteDateTimeTagFile(outfile, logfile, errfile):# {{{
         try:
             myfunc.WriteFile(date_str, outfile)
             msg = "Write tag file %s succeeded"%(outfile)
-            myfunc.WriteFile("[%s] %s\n"%(date_str, msg),  logfile, "a", True)
+            logwrite("[%s] %s\n"%(date_str, msg), logfile)
         except Exception as e:
             msg = "Failed to write to file %s with message: \"%s\""%(outfile, str(e))
-            myfunc.WriteFile("[%s] %s\n"%(date_str, msg),  errfile, "a", True)
+            logwrite("[%s] %s\n"%(date_str, msg), errfile)
 # }}}
 def RunCmd(cmd, logfile, errfile, verbose=False):# {{{
     """Input cmd in list
@@ -1758,11 +2317,11 @@ def RunCmd(cmd, logfile, errfile, verbose=False):# {{{
         rmsg = subprocess.check_output(cmd, encoding='UTF-8')
         if verbose:
             msg = "workflow: %s returned rmsg \"%s\""%(cmdline, rmsg)
-            myfunc.WriteFile("[%s] %s\n"%(date_str, msg),  logfile, "a", True)
+            logwrite("[%s] %s\n"%(date_str, msg), logfile)
         isCmdSuccess = True
     except subprocess.CalledProcessError as e:
         msg = "cmdline: %s\nFailed with message \"%s\""%(cmdline, str(e))
-        myfunc.WriteFile("[%s] %s\n"%(date_str, msg),  errfile, "a", True)
+        logwrite("[%s] %s\n"%(date_str, msg), errfile)
         isCmdSuccess = False
         pass
 
@@ -1812,24 +2371,77 @@ Attached below is the error message:
 
     date_str = time.strftime(FORMAT_DATETIME)
     msg =  "Sendmail %s -> %s, %s"%(from_email, to_email, subject)
-    myfunc.WriteFile("[%s] %s\n"% (date_str, msg), logfile, "a", True)
+    logwrite("[%s] %s\n"% (date_str, msg), logfile)
     rtValue = myfunc.Sendmail(from_email, to_email, subject, bodytext)
     if rtValue != 0:
         msg =  "Sendmail to {} failed with status {}".format(to_email, rtValue)
-        myfunc.WriteFile("[%s] %s\n"%(date_str, msg), errfile, "a", True)
+        logwrite("[%s] %s\n"%(date_str, msg), errfile)
         return 1
     else:
         return 0
 # }}}
 
+class JobTagResolver(object):#{{{
+# Description:
+#   Resolve the status of job folders from their tag files. Each folder is
+#   listed once by os.scandir instead of calling os.path.exists for each tag
+#   file, and the result is kept for the lifetime of the resolver, i.e. one
+#   request of the web views, see GetTagResolver
+    TAG_FILE_SET = set(["runjob.start", "runjob.finish", "runjob.failed"])
+    def __init__(self, path_result):#{{{
+        self.path_result = path_result
+        self.tag_dict = {} # jobid -> frozenset of tag files, None if no folder
+#}}}
+    def GetTagSet(self, jobid):#{{{
+        """Return the tag files in the folder of jobid, None if the folder
+        does not exist"""
+        try:
+            return self.tag_dict[jobid]
+        except KeyError:
+            pass
+        rstdir = "%s/%s"%(self.path_result, jobid)
+        try:
+            with os.scandir(rstdir) as it:
+                tagset = frozenset([entry.name for entry in it
+                    if entry.name in self.TAG_FILE_SET])
+        except OSError:
+            tagset = None
+        self.tag_dict[jobid] = tagset
+        return tagset
+#}}}
+    def HasTag(self, jobid, tagfile):#{{{
+        tagset = self.GetTagSet(jobid)
+        return tagset is not None and tagfile in tagset
+#}}}
+    def GetStatus(self, jobid):#{{{
+        """Return Failed, Finished, Running or Queued, in the order of the
+        precedence of the tag files, None if the folder does not exist"""
+        tagset = self.GetTagSet(jobid)
+        if tagset is None:
+            return None
+        elif "runjob.failed" in tagset:
+            return "Failed"
+        elif "runjob.finish" in tagset:
+            return "Finished"
+        elif "runjob.start" in tagset:
+            return "Running"
+        else:
+            return "Queued"
+#}}}
+#}}}
+def GetTagResolver(info):#{{{
+    """Return the JobTagResolver of the request, shared by the view and
+    GetJobCounter"""
+    if not 'tag_resolver' in info:
+        info['tag_resolver'] = JobTagResolver(info['path_result'])
+    return info['tag_resolver']
+#}}}
 @timeit
 def GetJobCounter(info): #{{{
 # get job counter for the client_ip
 # get the table from runlog, 
 # for queued or running jobs, if source=web and numseq=1, check again the tag file in
 # each individual folder, since they are queued locally
-    logfile_query = info['divided_logfile_query']
-    logfile_finished_jobid = info['divided_logfile_finished_jobid']
     isSuperUser = info['isSuperUser']
     client_ip = info['client_ip']
     maxdaystoshow = info['MAX_DAYS_TO_SHOW']
@@ -1849,11 +2461,11 @@ def GetJobCounter(info): #{{{
     jobcounter['failed_idlist'] = []
     jobcounter['nojobfolder_idlist'] = []
 
-    hdl = myfunc.ReadLineByBlock(logfile_query)
+    hdl = OpenJobQuery(info)
     if hdl.failure:
         return jobcounter
     else:
-        finished_job_dict = myfunc.ReadFinishedJobLog(logfile_finished_jobid)
+        finished_job_dict = ReadFinishedJobForView(info)
         finished_jobid_set = set([])
         failed_jobid_set = set([])
         for jobid in finished_job_dict:
@@ -1888,7 +2500,6 @@ def GetJobCounter(info): #{{{
                 if diff_date.days > maxdaystoshow:
                     continue
                 jobid = strs[1]
-                rstdir = "%s/%s"%(path_result, jobid)
 
                 if jobid in finished_jobid_set:
                     jobcounter['finished'] += 1
@@ -1897,19 +2508,17 @@ def GetJobCounter(info): #{{{
                     jobcounter['failed'] += 1
                     jobcounter['failed_idlist'].append(jobid)
                 else:
-                    finishtagfile = "%s/%s"%(rstdir, "runjob.finish")
-                    failtagfile = "%s/%s"%(rstdir, "runjob.failed")
-                    starttagfile = "%s/%s"%(rstdir, "runjob.start")
-                    if not os.path.exists(rstdir):
+                    status = GetTagResolver(info).GetStatus(jobid)
+                    if status is None:
                         jobcounter['nojobfolder'] += 1
                         jobcounter['nojobfolder_idlist'].append(jobid)
-                    elif os.path.exists(failtagfile):
+                    elif status == "Failed":
                         jobcounter['failed'] += 1
                         jobcounter['failed_idlist'].append(jobid)
-                    elif os.path.exists(finishtagfile):
+                    elif status == "Finished":
                         jobcounter['finished'] += 1
                         jobcounter['finished_idlist'].append(jobid)
-                    elif os.path.exists(starttagfile):
+                    elif status == "Running":
                         jobcounter['running'] += 1
                         jobcounter['running_idlist'].append(jobid)
                     else:
@@ -2031,46 +2640,658 @@ def CleanJobFolder_basic(rstdir):# {{{
                 pass
 # }}}
 
-def DeleteOldResult(path_result, path_log, logfile, MAX_KEEP_DAYS=180):#{{{
+def GetJobExpiryIndexFile(path_log):#{{{
+    return "%s/finished_job_expiry.sqlite3"%(path_log)
+#}}}
+def InitJobExpiryIndex(con, path_log):#{{{
+    """Create the tables of the expiry index if not exists, the index is
+    built from finished_job.log if it has not been built
+    """
+    cur = con.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS expiry
+        (
+            jobid TEXT PRIMARY KEY,
+            epoch_finish INTEGER
+        )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_expiry_epoch_finish ON expiry(epoch_finish)")
+    cur.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    if cur.execute("SELECT value FROM meta WHERE key = 'built'").fetchone() is None:
+        finished_job_dict = myfunc.ReadFinishedJobLog("%s/finished_job.log"%(path_log))
+        li = []
+        for jobid in finished_job_dict:
+            try:
+                finish_date_str = finished_job_dict[jobid][8]
+            except IndexError:
+                finish_date_str = ""
+            if finish_date_str != "":
+                li.append((jobid, FinishDateToEpoch(finish_date_str)))
+        cur.executemany("INSERT OR REPLACE INTO expiry(jobid, epoch_finish) VALUES(?, ?)", li)
+        cur.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('built', ?)",
+                (time.strftime(FORMAT_DATETIME),))
+    con.commit()
+#}}}
+def ConnectJobExpiryIndex(path_log):#{{{
+    """Connect to the expiry index of finished jobs, a sqlite3 database
+    with the table expiry(jobid, epoch_finish) indexed by epoch_finish.
+    The index is initialized at the first connection of this process
+    """
+    import sqlite3
+    indexfile = GetJobExpiryIndexFile(path_log)
+    con = sqlite3.connect(indexfile, timeout=30)
+    if not indexfile in g_expiry_index_set:
+        InitJobExpiryIndex(con, path_log)
+        g_expiry_index_set.add(indexfile)
+    return con
+#}}}
+def AddJobToExpiryIndex(path_log, jobFinishDateList):#{{{
+    """Add finished jobs to the expiry index
+    jobFinishDateList: a list of (jobid, finish_date_str)
+    The jobs failed to add, e.g. when the database is locked, are added
+    again at the next call, since they are not passed again by
+    CreateRunJoblog
+    """
+    li = g_expiry_retry_dict.pop(path_log, [])
+    li += [(jobid, FinishDateToEpoch(finish_date_str))
+            for (jobid, finish_date_str) in jobFinishDateList
+            if finish_date_str != ""]
+    if len(li) == 0:
+        return 0
+    try:
+        con = ConnectJobExpiryIndex(path_log)
+        try:
+            with con:
+                con.executemany("INSERT OR REPLACE INTO expiry(jobid, epoch_finish) VALUES(?, ?)", li)
+        finally:
+            con.close()
+    except Exception as e:
+        print("Failed to add %d jobs to the expiry index, retry at the next call. "
+                "errmsg=%s"%(len(li), str(e)), file=sys.stderr)
+        g_expiry_retry_dict[path_log] = li
+        return 1
+    return 0
+#}}}
+class OldResultDeleter(object):#{{{
+# Description:
+#   Delete the result folders of expired jobs in a pool of background
+#   threads, the removal of files is limited to max_unlink_per_sec in total,
+#   so that deleting thousands of folders does not saturate the file system.
+#   Deleted jobs are collected and removed from the expiry index by the
+#   caller, since sqlite3 connections are not shared by threads
+    def __init__(self, num_thread=4, max_unlink_per_sec=1000):#{{{
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=num_thread)
+        self.limiter = myfunc.RateLimiter(max_unlink_per_sec)
+        self.lock = threading.Lock()
+        self.pending_set = set([])
+        self.done_list = []
+#}}}
+    def Submit(self, jobid, rstdir, logfile):#{{{
+        """Submit the deletion of jobid, return False if it is pending"""
+        with self.lock:
+            if jobid in self.pending_set:
+                return False
+            self.pending_set.add(jobid)
+        self.executor.submit(self.Delete, jobid, rstdir, logfile)
+        return True
+#}}}
+    def Delete(self, jobid, rstdir, logfile):#{{{
+        isDeleted = True
+        if os.path.exists(rstdir):
+            if myfunc.RemoveTree(rstdir, self.limiter) > 0:
+                isDeleted = False
+                msg = "failed to delete rstdir %s"%(rstdir)
+                loginfo(msg, logfile)
+        with self.lock:
+            self.pending_set.discard(jobid)
+            if isDeleted:
+                self.done_list.append(jobid)
+#}}}
+    def PopDone(self):#{{{
+        """Return the jobids deleted since the last call"""
+        with self.lock:
+            li = self.done_list
+            self.done_list = []
+            return li
+#}}}
+    def NumPending(self):#{{{
+        with self.lock:
+            return len(self.pending_set)
+#}}}
+#}}}
+def DeleteOldResult(path_result, path_log, logfile, MAX_KEEP_DAYS=180,#{{{
+        num_thread=4, max_unlink_per_sec=1000):
     """Delete jobdirs that are finished > MAX_KEEP_DAYS
-    return True if therer is at least one result folder been deleted
+    Expired jobs are selected from the expiry index (see
+    ConnectJobExpiryIndex) and deleted in the background by OldResultDeleter
+    return True if there is at least one result folder deleted since the last
+    call or being deleted
+    """
+    global g_old_result_deleter
+    if g_old_result_deleter is None:
+        g_old_result_deleter = OldResultDeleter(num_thread, max_unlink_per_sec)
+    deleter = g_old_result_deleter
+
+    try:
+        con = ConnectJobExpiryIndex(path_log)
+    except Exception as e:
+        loginfo("Failed to open the expiry index. errmsg=%s"%(str(e)), logfile)
+        return deleter.NumPending() > 0
+
+    done_list = deleter.PopDone()
+    isOldRstdirDeleted = len(done_list) > 0
+    with con:
+        con.executemany("DELETE FROM expiry WHERE jobid = ?",
+                [(jobid,) for jobid in done_list])
+
+    # finished more than MAX_KEEP_DAYS days ago, counted in whole days
+    now = time.time()
+    epoch_threshold = int(now) - (MAX_KEEP_DAYS+1)*86400
+    rows = con.execute("SELECT jobid, epoch_finish FROM expiry "
+            "WHERE epoch_finish <= ? ORDER BY epoch_finish", (epoch_threshold,)).fetchall()
+    con.close()
+    for (jobid, epoch_finish) in rows:
+        rstdir = "%s/%s"%(path_result, jobid)
+        # jobs still being deleted since the earlier calls are not logged again
+        if deleter.Submit(jobid, rstdir, logfile):
+            msg = "\tjobid = %s finished %d days ago (>%d days), delete."%(jobid,
+                    int((now - epoch_finish)/86400), MAX_KEEP_DAYS)
+            loginfo(msg, logfile)
+    return isOldRstdirDeleted or deleter.NumPending() > 0
+#}}}
+def GetDividedStoreFile(path_log):#{{{
+    return "%s/divided_job.sqlite3"%(path_log)
+#}}}
+def ConnectDividedStore(dbfile, timeout=30):#{{{
+    """Connect to the divided store, a sqlite3 database with the lines of
+    submitted_seq.log and finished_job.log, indexed by the ip of the user
+        submitted(jobid, ip, line)
+        finished(jobid, ip, status, line)
+    It replaces the files divided/<ip>_submitted_seq.log and
+    divided/<ip>_finished_job.log
+    """
+    import sqlite3
+    con = sqlite3.connect(dbfile, timeout=timeout)
+    con.execute("PRAGMA journal_mode=WAL")
+    cur = con.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS submitted
+        (
+            jobid TEXT PRIMARY KEY,
+            ip TEXT,
+            line TEXT
+        )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_submitted_ip ON submitted(ip)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS finished
+        (
+            jobid TEXT PRIMARY KEY,
+            ip TEXT,
+            status TEXT,
+            line TEXT,
+            epoch_submit INTEGER,
+            epoch_start INTEGER,
+            epoch_finish INTEGER,
+            numseq INTEGER,
+            jobname TEXT
+        )""")
+    column_set = set([x[1] for x in cur.execute("PRAGMA table_info(finished)")])
+    if not 'epoch_submit' in column_set:
+        # store created without the columns used by the paged views
+        for (column, coltype) in DIVIDED_FINISHED_EXTRA_COLUMNS:
+            cur.execute("ALTER TABLE finished ADD COLUMN %s %s"%(column, coltype))
+        rows = [GetDividedFinishedRow(line.split("\t"))
+                for (line,) in cur.execute("SELECT line FROM finished").fetchall()]
+        cur.executemany("UPDATE finished SET epoch_submit = ?, epoch_start = ?, "
+                "epoch_finish = ?, numseq = ?, jobname = ? WHERE jobid = ?",
+                [x[4:] + x[:1] for x in rows])
+    cur.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_finished_ip ON finished(ip)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_finished_status_submit ON finished(status, epoch_submit)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_finished_ip_status_submit ON finished(ip, status, epoch_submit)")
+    con.commit()
+    return con
+#}}}
+def ConnectDividedStoreReadOnly(dbfile, timeout=30):#{{{
+    """Connect to the divided store for reading by the views, the tables are
+    created and migrated by ConnectDividedStore in the daemon, so no DDL or
+    PRAGMA is run here"""
+    import sqlite3
+    import urllib.parse
+    return sqlite3.connect("file:%s?mode=ro"%(urllib.parse.quote(dbfile)),
+            uri=True, timeout=timeout)
+#}}}
+def DateStrToEpoch(date_str):#{{{
+    """Return the epoch time of date_str, None if date_str is empty"""
+    if date_str.strip() == "":
+        return None
+    return FinishDateToEpoch(date_str.strip())
+#}}}
+def GetDividedFinishedRow(li):#{{{
+    """Return the row of the table finished of the divided store for the
+    items of a line of finished_job.log"""
+    li = [str(x) for x in li]
+    try:
+        numseq = int(li[5])
+    except (ValueError, IndexError):
+        numseq = 1
+    li += [""]*(10-len(li))
+    return (li[0], li[3], li[1], "\t".join(li), DateStrToEpoch(li[7]),
+            DateStrToEpoch(li[8]), DateStrToEpoch(li[9]), numseq, li[2])
+#}}}
+def UpdateDividedStore(path_log, submitted_list, finished_list,#{{{
+        submitted_log_size=None):
+    """Update the divided store with the current submitted and finished jobs
+    submitted_list: [(jobid, line)], line of submitted_seq.log
+    finished_list: [li], items of the line of finished_job.log
+    submitted_log_size: size in bytes of submitted_seq.log rewritten with
+    submitted_list, the lines appended after it are read by the views, see
+    ReadNewSubmittedLines
+    Only the changed rows are written, compared with the rows written by
+    the last call, which are loaded from the store at the first call
+    """
+    dbfile = GetDividedStoreFile(path_log)
+    try:
+        con = ConnectDividedStore(dbfile)
+    except Exception as e:
+        print("Failed to open the divided store %s. errmsg=%s"%(dbfile, str(e)), file=sys.stderr)
+        return 1
+    if not dbfile in g_divided_store_state:
+        g_divided_store_state[dbfile] = {
+                'submitted': dict(con.execute("SELECT jobid, line FROM submitted")),
+                'finished': dict(con.execute("SELECT jobid, line FROM finished"))}
+    state = g_divided_store_state[dbfile]
+
+    new_submitted_dict = {}
+    for (jobid, line) in submitted_list:
+        new_submitted_dict[jobid] = line
+    new_finished_dict = {}
+    finished_list_dict = {}
+    for li in finished_list:
+        line = "\t".join([str(x) for x in li])
+        new_finished_dict[li[0]] = line
+        finished_list_dict[li[0]] = li
+
+    try:
+        with con:
+            con.executemany("DELETE FROM submitted WHERE jobid = ?",
+                    [(jobid,) for jobid in state['submitted']
+                        if not jobid in new_submitted_dict])
+            li = []
+            for (jobid, line) in new_submitted_dict.items():
+                if state['submitted'].get(jobid) != line:
+                    strs = line.split("\t")
+                    ip = strs[2] if len(strs) > 2 else ""
+                    li.append((jobid, ip, line))
+            con.executemany("INSERT OR REPLACE INTO submitted(jobid, ip, line) VALUES(?, ?, ?)", li)
+            con.executemany("DELETE FROM finished WHERE jobid = ?",
+                    [(jobid,) for jobid in state['finished']
+                        if not jobid in new_finished_dict])
+            con.executemany("INSERT OR REPLACE INTO finished(jobid, ip, status, "
+                    "line, epoch_submit, epoch_start, epoch_finish, numseq, jobname) "
+                    "VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [GetDividedFinishedRow(finished_list_dict[jobid])
+                        for (jobid, line) in new_finished_dict.items()
+                        if state['finished'].get(jobid) != line])
+            if submitted_log_size is not None:
+                con.execute("INSERT OR REPLACE INTO meta(key, value) "
+                        "VALUES('submitted_log_size', ?)", (str(submitted_log_size),))
+    except Exception as e:
+        print("Failed to update the divided store %s. errmsg=%s"%(dbfile, str(e)), file=sys.stderr)
+        g_divided_store_state.pop(dbfile, None)
+        con.close()
+        return 1
+    con.close()
+    state['submitted'] = new_submitted_dict
+    state['finished'] = new_finished_dict
+    return 0
+#}}}
+def ReadDividedSubmittedLines(dbfile, ip):#{{{
+    """Return the lines of submitted_seq.log submitted from ip, or all lines
+    if ip is None, in the order of submission"""
+    con = ConnectDividedStoreReadOnly(dbfile)
+    if ip is None:
+        rows = con.execute("SELECT line FROM submitted ORDER BY rowid")
+    else:
+        rows = con.execute("SELECT line FROM submitted WHERE ip = ? ORDER BY rowid", (ip,))
+    lines = [x[0] for x in rows]
+    con.close()
+    return lines
+#}}}
+def ReadDividedFinishedJob(dbfile, ip, status=""):#{{{
+    """Return the finished jobs submitted from ip, or all finished jobs if ip
+    is None, as a dictionary in the format of myfunc.ReadFinishedJobLog"""
+    con = ConnectDividedStoreReadOnly(dbfile)
+    sql = "SELECT line FROM finished WHERE 1"
+    para = []
+    if ip is not None:
+        sql += " AND ip = ?"
+        para.append(ip)
+    if status != "":
+        sql += " AND status = ?"
+        para.append(status)
+    rows = con.execute(sql, para)
+    dt = {}
+    for (line,) in rows:
+        (jobid, record) = myfunc.ParseFinishedJobLogLine(line, dbfile)
+        if jobid is not None:
+            dt[jobid] = record
+    con.close()
+    return dt
+#}}}
+def ReadNewSubmittedLines(dbfile, con, ip):#{{{
+    """Return the lines of submitted_seq.log submitted from ip, or all lines
+    if ip is None, which are appended after the last update of the divided
+    store and not in the store.
+    UpdateDividedStore records the size of submitted_seq.log rewritten by the
+    daemon, only the part after it is read
+    con: connection to the divided store dbfile
     """
-    finishedjoblogfile = "%s/finished_job.log"%(path_log)
-    finished_job_dict = myfunc.ReadFinishedJobLog(finishedjoblogfile)
-    isOldRstdirDeleted = False
-    for jobid in finished_job_dict:
-        li = finished_job_dict[jobid]
+    lines = []
+    try:
+        row = con.execute("SELECT value FROM meta WHERE key = 'submitted_log_size'").fetchone()
+    except Exception:
+        # store written by a daemon without the meta table
+        row = None
+    if row is None:
+        return lines
+    offset = int(row[0])
+    logfile = "%s/submitted_seq.log"%(os.path.dirname(dbfile))
+    try:
+        with open(logfile, "rb") as fpin:
+            if offset > 0:
+                fpin.seek(offset-1)
+                if fpin.read(1) != b"\n":
+                    # submitted_seq.log is rewritten but the store is not
+                    # updated yet
+                    return lines
+            content = fpin.read().decode('utf-8', 'replace')
+    except IOError:
+        return lines
+    # the last line may be partially written
+    for line in content.split("\n")[:-1]:
+        strs = line.split("\t")
+        if len(strs) < 3:
+            continue
+        if ip is None or strs[2] == ip:
+            lines.append(line)
+    jobidList = [line.split("\t")[1] for line in lines]
+    jobid_in_store_set = set([])
+    chunksize = 500
+    for i in range(0, len(jobidList), chunksize):
+        li = jobidList[i:i+chunksize]
+        jobid_in_store_set.update([x[0] for x in con.execute(
+            "SELECT jobid FROM submitted WHERE jobid IN (%s)"%(
+                ", ".join(["?"]*len(li))), li)])
+    return [line for line in lines
+            if not line.split("\t")[1] in jobid_in_store_set]
+#}}}
+def GetDividedStoreIP(info):#{{{
+    """The ip to select the rows of the divided store, None for superusers"""
+    if info['isSuperUser']:
+        return None
+    return info['client_ip']
+#}}}
+def OpenJobQuery(info):#{{{
+    """Return a reader of the submitted jobs for the views, from the divided
+    store if set in info by set_basic_config, otherwise from
+    info['divided_logfile_query'], with the interface of
+    myfunc.ReadLineByBlock
+    The jobs submitted after the last update of the store are added from
+    submitted_seq.log, see ReadNewSubmittedLines"""
+    if 'divided_db' in info:
         try:
-            finish_date_str = li[8]
-        except IndexError:
-            finish_date_str = ""
-            pass
-        if finish_date_str != "":
-            isValidFinishDate = True
+            ip = GetDividedStoreIP(info)
+            lines = ReadDividedSubmittedLines(info['divided_db'], ip)
+            con = ConnectDividedStoreReadOnly(info['divided_db'])
+            lines += ReadNewSubmittedLines(info['divided_db'], con, ip)
+            con.close()
+            return myfunc.LineListReader(lines)
+        except Exception as e:
+            print("Failed to read the divided store. errmsg=%s"%(str(e)), file=sys.stderr)
+            hdl = myfunc.LineListReader([])
+            hdl.failure = True
+            return hdl
+    return myfunc.ReadLineByBlock(info['divided_logfile_query'])
+#}}}
+def ReadFinishedJobForView(info):#{{{
+    """Return the finished jobs for the views, see OpenJobQuery"""
+    if 'divided_db' in info:
+        try:
+            return ReadDividedFinishedJob(info['divided_db'], GetDividedStoreIP(info))
+        except Exception as e:
+            print("Failed to read the divided store. errmsg=%s"%(str(e)), file=sys.stderr)
+            return {}
+    return myfunc.ReadFinishedJobLog(info['divided_logfile_finished_jobid'])
+#}}}
+def GetJobListPage(request, g_params={}):#{{{
+    """Read the page of the job list from the query string of the request
+        offset    : index of the first job to show, (default: 0)
+        limit     : number of jobs to show, 0 for all, (default:
+                    g_params['JOB_LIST_PAGE_SIZE'] or 0)
+        sort      : submit, start, finish, runtime, numseq or jobname,
+                    (default: submit)
+        order     : asc or desc, (default: asc)
+        date_from : show jobs submitted on or after the date, YYYY-MM-DD
+        date_to   : show jobs submitted on or before the date, YYYY-MM-DD
+    Return a dictionary with these keys, epoch_from, epoch_to and total, the
+    number of jobs in all pages, set when the job list is read
+    """
+    query = getattr(request, 'GET', {})
+    page = {}
+    try:
+        page['offset'] = max(0, int(query.get('offset', 0)))
+    except ValueError:
+        page['offset'] = 0
+    try:
+        page['limit'] = max(0, int(query.get('limit',
+            g_params.get('JOB_LIST_PAGE_SIZE', 0))))
+    except ValueError:
+        page['limit'] = 0
+    page['sort'] = query.get('sort', "submit")
+    if not page['sort'] in JOB_LIST_SORT_KEY_DICT:
+        page['sort'] = "submit"
+    page['order'] = query.get('order', "asc")
+    if not page['order'] in ["asc", "desc"]:
+        page['order'] = "asc"
+    page['date_from'] = page['date_to'] = ""
+    page['epoch_from'] = page['epoch_to'] = None
+    for (key, epoch_key, shift) in [('date_from', 'epoch_from', 0),
+            ('date_to', 'epoch_to', 86400)]:
+        date_str = query.get(key, "")
+        try:
+            dt = datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            continue
+        page[key] = date_str
+        page[epoch_key] = calendar.timegm(dt.timetuple()) + shift
+    page['total'] = 0
+    return page
+#}}}
+def ReadRecentFinishedJob(info, status, con, epoch_from, epoch_to):#{{{
+    """Return the jobids, in the order of submission, of the jobs with status
+    which are submitted after the last update of the divided store by the
+    daemon, see ReadNewSubmittedLines, e.g. the jobs finished immediately by
+    the cached results. The status is resolved from the tag files by
+    JobTagResolver.
+    The jobs submitted before the last update are listed from the table
+    finished after the next loop of the daemon.
+    The jobs are submitted on or after epoch_from and before epoch_to, if
+    not None
+    """
+    lines = ReadNewSubmittedLines(info['divided_db'], con,
+            GetDividedStoreIP(info))
+    jobRecordList = []
+    for line in lines:
+        strs = line.split("\t")
+        try:
+            epoch_submit = DateStrToEpoch(strs[0])
+        except ValueError:
+            continue
+        if (epoch_submit is None or epoch_submit < epoch_from
+                or (epoch_to is not None and epoch_submit >= epoch_to)):
+            continue
+        if GetTagResolver(info).GetStatus(strs[1]) == status:
+            jobRecordList.append(strs[1])
+    return jobRecordList
+#}}}
+def QueryFinishedJobPage(info, status, page):#{{{
+    """Select the page of the finished jobs with status from the divided
+    store, the filtering, sorting and paging are done by sqlite3
+    The jobs submitted and finished after the last update of the store, see
+    ReadRecentFinishedJob, are not sorted by page['sort'] but listed as the
+    most recent ones, i.e. at the end of the list in the ascending order and
+    at the beginning in the descending order. Their records are not in
+    finished_job_dict.
+    Return (jobRecordList, finished_job_dict) for the jobs of the page, or
+    (None, None) on failure
+    """
+    sql_where = " WHERE status = ?"
+    para = [status]
+    ip = GetDividedStoreIP(info)
+    if ip is not None:
+        sql_where += " AND ip = ?"
+        para.append(ip)
+    # submitted at most MAX_DAYS_TO_SHOW days ago, counted in whole days
+    epoch_min = max(0, int(time.time()) - (info['MAX_DAYS_TO_SHOW']+1)*86400)
+    sql_where += " AND epoch_submit > ?"
+    para.append(epoch_min)
+    epoch_from = epoch_min + 1
+    if page['epoch_from'] is not None:
+        # submitted on or after date_from
+        sql_where += " AND epoch_submit >= ?"
+        para.append(page['epoch_from'])
+        epoch_from = max(epoch_from, page['epoch_from'])
+    if page['epoch_to'] is not None:
+        sql_where += " AND epoch_submit < ?"
+        para.append(page['epoch_to'])
+    sql_order = " ORDER BY %s %s, rowid %s"%(JOB_LIST_SORT_KEY_DICT[page['sort']],
+            page['order'].upper(), page['order'].upper())
+    try:
+        con = ConnectDividedStoreReadOnly(info['divided_db'])
+        recentList = ReadRecentFinishedJob(info, status, con, epoch_from,
+                page['epoch_to'])
+        total_db = con.execute("SELECT COUNT(*) FROM finished" + sql_where,
+                para).fetchone()[0]
+        # split the page into the part of the recent jobs and the part
+        # selected by sqlite3
+        offset_db = page['offset']
+        limit_db = page['limit']
+        if page['order'] == "desc":
+            recentList.reverse()
+            if page['limit'] > 0:
+                recentPart = recentList[page['offset']:page['offset']+page['limit']]
+                limit_db = page['limit'] - len(recentPart)
+            else:
+                recentPart = recentList[page['offset']:]
+            offset_db = max(0, page['offset'] - len(recentList))
+        rows = []
+        if page['limit'] == 0 or limit_db > 0:
+            sql_limit = ""
+            if limit_db > 0:
+                sql_limit = " LIMIT %d OFFSET %d"%(limit_db, offset_db)
+            elif offset_db > 0:
+                sql_limit = " LIMIT -1 OFFSET %d"%(offset_db)
+            rows = con.execute("SELECT line FROM finished" + sql_where + sql_order
+                    + sql_limit, para).fetchall()
+        con.close()
+    except Exception as e:
+        print("Failed to query the divided store. errmsg=%s"%(str(e)), file=sys.stderr)
+        return (None, None)
+    if page['order'] == "asc":
+        begin = max(0, page['offset'] - total_db)
+        if page['limit'] > 0:
+            recentPart = recentList[begin:begin+page['limit']-len(rows)]
+        else:
+            recentPart = recentList[begin:]
+    page['total'] = total_db + len(recentList)
+    jobRecordList = []
+    finished_job_dict = {}
+    for (line,) in rows:
+        (jobid, record) = myfunc.ParseFinishedJobLogLine(line, info['divided_db'])
+        if jobid is not None:
+            jobRecordList.append(jobid)
+            finished_job_dict[jobid] = record
+    if page['order'] == "desc":
+        jobRecordList = recentPart + jobRecordList
+    else:
+        jobRecordList += recentPart
+    return (jobRecordList, finished_job_dict)
+#}}}
+def ReadFinishedJobPageFromLog(info, status, page):#{{{
+    """Select the page of the finished jobs with status from the log files,
+    by scanning all submitted jobs. Only sorting by the submit date is
+    supported
+    Return (jobRecordList, finished_job_dict), or (None, None) on failure
+    """
+    hdl = OpenJobQuery(info)
+    if hdl.failure:
+        return (None, None)
+    finished_job_dict = ReadFinishedJobForView(info)
+    jobRecordList = []
+    lines = hdl.readlines()
+    while lines != None:
+        for line in lines:
+            strs = line.split("\t")
+            if len(strs) < 7:
+                continue
+            ip = strs[2]
+            if not info['isSuperUser'] and ip != info['client_ip']:
+                continue
+
+            submit_date_str = strs[0]
+            isValidSubmitDate = True
             try:
-                finish_date = datetime_str_to_time(finish_date_str)
+                submit_date = datetime_str_to_time(submit_date_str)
             except ValueError:
-                isValidFinishDate = False
+                isValidSubmitDate = False
+            if not isValidSubmitDate:
+                continue
 
-            if isValidFinishDate:
-                current_time = datetime.now(finish_date.tzinfo)
-                timeDiff = current_time - finish_date
-                if timeDiff.days > MAX_KEEP_DAYS:
-                    rstdir = "%s/%s"%(path_result, jobid)
-                    msg = "\tjobid = %s finished %d days ago (>%d days), delete."%(jobid, timeDiff.days, MAX_KEEP_DAYS)
-                    loginfo(msg, logfile)
-                    try:
-                        shutil.rmtree(rstdir)
-                        isOldRstdirDeleted = True
-                    except:
-                        msg = "failed to delete rstdir %s"%(rstdir)
-                        loginfo(msg, logfile)
-    return isOldRstdirDeleted
+            current_time = datetime.now(submit_date.tzinfo)
+            diff_date = current_time - submit_date
+            if diff_date.days > info['MAX_DAYS_TO_SHOW']:
+                continue
+            if page['epoch_from'] is not None or page['epoch_to'] is not None:
+                epoch_submit = FinishDateToEpoch(submit_date_str)
+                if ((page['epoch_from'] is not None and epoch_submit < page['epoch_from'])
+                        or (page['epoch_to'] is not None and epoch_submit >= page['epoch_to'])):
+                    continue
+            jobid = strs[1]
+            if jobid in finished_job_dict:
+                if finished_job_dict[jobid][0] == status:
+                    jobRecordList.append(jobid)
+            elif GetTagResolver(info).GetStatus(jobid) == status:
+                jobRecordList.append(jobid)
+        lines = hdl.readlines()
+    hdl.close()
+
+    page['total'] = len(jobRecordList)
+    if page['order'] == "desc":
+        jobRecordList.reverse()
+    if page['limit'] > 0:
+        jobRecordList = jobRecordList[page['offset']:page['offset']+page['limit']]
+    else:
+        jobRecordList = jobRecordList[page['offset']:]
+    return (jobRecordList, finished_job_dict)
+#}}}
+def ReadFinishedJobPage(info, status, page):#{{{
+    """Return (jobRecordList, finished_job_dict) for the page of the
+    finished jobs with status, "Finished" or "Failed", from the divided store
+    if set in info by set_basic_config, otherwise from the log files"""
+    if 'divided_db' in info:
+        return QueryFinishedJobPage(info, status, page)
+    return ReadFinishedJobPageFromLog(info, status, page)
 #}}}
 def loginfo(msg, outfile):# {{{
     """Write loginfo to outfile, appending current time"""
     date_str = time.strftime(FORMAT_DATETIME)
-    myfunc.WriteFile("[%s] %s\n"%(date_str, msg), outfile, "a", True)
+    logsink.Write("[%s] %s\n"%(date_str, msg), outfile)
+# }}}
+def logwrite(text, outfile):# {{{
+    """Append text to the log file outfile as it is, text can be a partial
+    line, which is completed by the following calls"""
+    logsink.Write(text, outfile)
 # }}}
 @timeit
 def CleanServerFile(path_static, logfile, errfile):#{{{
@@ -2128,27 +3349,67 @@ def ReadRuntimeFromFile(timefile, default_runtime=0.0):# {{{
         runtime = default_runtime
     return runtime
 # }}}
+def GetLogRotator(path_log, threshold_logfilesize=20*1024*1024, g_params={}):# {{{
+    """Get the log rotator of the web-server, the logs in path_log are
+    registered at the first call
+    Options in g_params
+        LOG_KEEP_COUNT       : number of archives to keep for each log, (default: 1)
+        LOG_KEEP_DAYS        : max age of the archives in days, 0 for no limit, (default: 0)
+        LOG_ROTATE_METHOD    : rename or copytruncate, (default: rename)
+        LOG_COMPRESS_LEVEL   : gzip level of the archives, (default: 6)
+        DIVIDED_LOG_MAX_SIZE : rotate also the logs in divided/ larger than
+                               this size in bytes, these are read by the
+                               views, 0 to disable, (default: 0)
+    """
+    global g_log_rotator
+    if g_log_rotator is None:
+        keep_count = g_params.get('LOG_KEEP_COUNT', 1)
+        keep_days = g_params.get('LOG_KEEP_DAYS', 0)
+        method = g_params.get('LOG_ROTATE_METHOD', "rename")
+        g_log_rotator = logrotate.LogRotator(g_params.get('LOG_COMPRESS_LEVEL', 6))
+        for name in ["qd_fe.py.log", "qd_fe.py.err", "restart_qd_fe.cgi.log",
+                "debug.log", "clean_cached_result.py.log",
+                "submit_job_worker.py.log"]:
+            g_log_rotator.Register("%s/%s"%(path_log, name),
+                    threshold_logfilesize, keep_count, keep_days, method)
+        divided_max_size = g_params.get('DIVIDED_LOG_MAX_SIZE', 0)
+        if divided_max_size > 0:
+            g_log_rotator.Register("%s/divided/*.log"%(path_log),
+                    divided_max_size, keep_count, keep_days, method)
+    return g_log_rotator
+# }}}
 def ArchiveLogFile(path_log, threshold_logfilesize=20*1024*1024, g_params={}):# {{{
-    """Archive some of the log files if they are too big"""
+    """Archive some of the log files if they are too big
+    The logs are rotated by the log rotator (see GetLogRotator) and
+    compressed in the background
+    """
     gen_logfile = "%s/qd_fe.py.log"%(path_log)
     if 'DEBUG_ARCHIVE' in g_params and g_params['DEBUG_ARCHIVE']:
         loginfo("Entering ArchiveLogFile", gen_logfile)
-    gen_errfile = "%s/qd_fe.py.err"%(path_log)
-    flist = [gen_logfile, gen_errfile,
-            "%s/restart_qd_fe.cgi.log"%(path_log),
-            "%s/debug.log"%(path_log),
-            "%s/clean_cached_result.py.log"%(path_log)
-            ]
-
-    for f in flist:
-        if os.path.exists(f):
-            if 'DEBUG_ARCHIVE' in g_params and g_params['DEBUG_ARCHIVE']:
-                filesize = os.path.getsize(f)
-                if filesize > threshold_logfilesize:
-                    loginfo("filesize(%s) = %d > %d, archive it"%(f, filesize, threshold_logfilesize), gen_logfile)
-                else:
-                    loginfo("filesize(%s) = %d, threshold_logfilesize=%d"%(f, filesize, threshold_logfilesize), gen_logfile)
-            myfunc.ArchiveFile(f, threshold_logfilesize)
+    # write the buffered logs before they are rotated
+    logsink.Flush()
+    rotator = GetLogRotator(path_log, threshold_logfilesize, g_params)
+    numrotated = rotator.CheckAll()
+    if 'DEBUG_ARCHIVE' in g_params and g_params['DEBUG_ARCHIVE']:
+        loginfo("ArchiveLogFile: %d logs rotated"%(numrotated), gen_logfile)
+# }}}
+def RotateJobLogFile(rstdirList, g_params={}):# {{{
+    """Rotate runjob.log and runjob.err of the jobs if they are larger than
+    g_params['JOB_LOG_MAX_SIZE'] (default: 20 MB)"""
+    if len(rstdirList) == 0:
+        return 0
+    rotator = GetLogRotator("%s/log"%(g_params['path_static']), g_params=g_params)
+    rule = logrotate.LogRotateRule("runjob.log",
+            g_params.get('JOB_LOG_MAX_SIZE', 20*1024*1024),
+            g_params.get('JOB_LOG_KEEP_COUNT', 2), 0,
+            g_params.get('LOG_ROTATE_METHOD', "rename"))
+    filelist = []
+    for rstdir in rstdirList:
+        for name in ["runjob.log", "runjob.err"]:
+            logfile = "%s/%s"%(rstdir, name)
+            if os.path.exists(logfile):
+                filelist.append(logfile)
+    return rotator.Check(filelist, rule, isTrackDir=False)
 # }}}
 
 def get_default_server_url(name_server):# {{{
@@ -2293,14 +3554,9 @@ def get_queue_method_name():# {{{
 
 
 # functions for views.py
-def SubmitQueryToLocalQueue(query, tmpdir, rstdir, g_params, isOnlyGetCache=False):#{{{
+def GetSubmitJobCmd(query, tmpdir, rstdir, g_params, isOnlyGetCache=False):#{{{
+    """Get the command line of submit_job_to_queue.py for the query"""
     scriptfile = "%s/app/submit_job_to_queue.py"%(g_params['SITE_ROOT'])
-    rstdir = "%s/%s"%(g_params['path_result'], query['jobid'])
-    runjob_logfile = "%s/runjob.log"%(rstdir)
-    runjob_errfile = "%s/runjob.err"%(rstdir)
-    failedtagfile = "%s/%s"%(rstdir, "submit_job_to_queue.py.failed")
-    debugfile = "%s/debug.log"%(rstdir) #this log file is only for debugging
-
     cmd = ["python", scriptfile, "-nseq", "%d"%query['numseq'], "-nseq-this-user",
             "%d"%query['numseq_this_user'], "-jobid", query['jobid'],
             "-outpath", rstdir, "-datapath", tmpdir, "-baseurl",
@@ -2315,7 +3571,74 @@ def SubmitQueryToLocalQueue(query, tmpdir, rstdir, g_params, isOnlyGetCache=Fals
         cmd += ["-force"]
     if isOnlyGetCache:
         cmd += ["-only-get-cache"]
+    return cmd
+#}}}
+def GetSubmitSpoolDir(g_params):#{{{
+    """Get the spool directory served by submit_job_worker.py"""
+    if 'path_submit_spool' in g_params and g_params['path_submit_spool'] != "":
+        return g_params['path_submit_spool']
+    else:
+        return "%s/submit_spool"%(g_params['path_static'])
+#}}}
+def IsSubmitWorkerAlive(spooldir):#{{{
+    """Check whether submit_job_worker.py is serving the spooldir, the
+    worker touches the heartbeat file every few seconds"""
+    heartbeatfile = "%s/worker.heartbeat"%(spooldir)
+    try:
+        age = time.time() - os.path.getmtime(heartbeatfile)
+    except OSError:
+        return False
+    return age < SUBMIT_WORKER_HEARTBEAT_TIMEOUT
+#}}}
+def SpoolQuery(query, tmpdir, rstdir, g_params, isOnlyGetCache=False):#{{{
+    """Add the query to the spool directory, which is picked up by
+    submit_job_worker.py
+    The spool directory is organized as
+        tmp/ : spool files being written
+        new/ : spool files waiting to be submitted
+        cur/ : spool files being submitted by the worker
+    Return the path of the spool file or "" on failure
+    """
+    spooldir = GetSubmitSpoolDir(g_params)
+    item = {}
+    for key in ['jobid', 'numseq', 'numseq_this_user', 'base_www_url',
+            'email', 'client_ip', 'app_type', 'isForceRun']:
+        if key in query:
+            item[key] = query[key]
+    item['tmpdir'] = tmpdir
+    item['rstdir'] = rstdir
+    item['isOnlyGetCache'] = isOnlyGetCache
+    item['submit_time'] = time.time()
+    # file names are sorted by the submission time
+    filename = "%.6f_%s.json"%(item['submit_time'], query['jobid'])
+    tmpfile = "%s/tmp/%s"%(spooldir, filename)
+    spoolfile = "%s/new/%s"%(spooldir, filename)
+    try:
+        with open(tmpfile, "w") as fpout:
+            json.dump(item, fpout)
+        os.replace(tmpfile, spoolfile)
+    except (OSError, TypeError) as e:
+        print("Failed to write spool file %s. errmsg=%s"%(spoolfile, str(e)), file=sys.stderr)
+        return ""
+    return spoolfile
+#}}}
+def SubmitQueryToLocalQueue(query, tmpdir, rstdir, g_params, isOnlyGetCache=False):#{{{
+    """Submit the query by submit_job_to_queue.py
+    When g_params['isSubmitAsync'] is set and submit_job_worker.py is running,
+    the query is only added to the spool directory and the function returns
+    immediately, otherwise submit_job_to_queue.py is run in a subprocess
+    """
+    rstdir = "%s/%s"%(g_params['path_result'], query['jobid'])
+    runjob_logfile = "%s/runjob.log"%(rstdir)
+    runjob_errfile = "%s/runjob.err"%(rstdir)
+    failedtagfile = "%s/%s"%(rstdir, "submit_job_to_queue.py.failed")
+
+    if ('isSubmitAsync' in g_params and g_params['isSubmitAsync'] and
+            IsSubmitWorkerAlive(GetSubmitSpoolDir(g_params))):
+        if SpoolQuery(query, tmpdir, rstdir, g_params, isOnlyGetCache) != "":
+            return 0
 
+    cmd = GetSubmitJobCmd(query, tmpdir, rstdir, g_params, isOnlyGetCache)
     (isSuccess, t_runtime) = RunCmd(cmd, runjob_logfile, runjob_errfile)
     if not isSuccess:
         WriteDateTimeTagFile(failedtagfile, runjob_logfile, runjob_errfile)
@@ -2330,6 +3653,8 @@ def set_basic_config(request, info, g_params):# {{{
     path_static = g_params['path_static']
     path_log = "%s/log"%(path_static)
     path_result = "%s/result"%(path_static)
+    if 'METRICS_WEB' in g_params and g_params['METRICS_WEB']:
+        metrics.ConfigureFromParams(g_params, name="metrics_web.%d"%(os.getpid()))
     if username in g_params['SUPER_USER_LIST']:
         isSuperUser = True
         divided_logfile_query =  "%s/%s"%(path_log, "submitted_seq.log")
@@ -2338,6 +3663,9 @@ def set_basic_config(request, info, g_params):# {{{
         isSuperUser = False
         divided_logfile_query =  "%s/%s/%s"%(path_log, "divided", "%s_submitted_seq.log"%(client_ip))
         divided_logfile_finished_jobid =  "%s/%s/%s"%(path_log, "divided", "%s_failed_job.log"%(client_ip))
+    divided_db = GetDividedStoreFile(path_log)
+    if os.path.exists(divided_db):
+        info['divided_db'] = divided_db
 
     if isSuperUser:
         info['MAX_DAYS_TO_SHOW'] = g_params['BIG_NUMBER']
@@ -2378,13 +3706,15 @@ def get_queue(request, g_params):#{{{
     if info['isSuperUser']:
         info['header'].insert(5, "Host")
 
-    hdl = myfunc.ReadLineByBlock(info['divided_logfile_query'])
+    hdl = OpenJobQuery(info)
     if hdl.failure:
         info['errmsg'] = ""
         pass
     else:
         finished_jobid_list = []
-        if os.path.exists(info['divided_logfile_finished_jobid']):
+        if 'divided_db' in info:
+            finished_jobid_list = list(ReadFinishedJobForView(info).keys())
+        elif os.path.exists(info['divided_logfile_finished_jobid']):
             finished_jobid_list = myfunc.ReadIDList2(info['divided_logfile_finished_jobid'], 0, None)
         finished_jobid_set = set(finished_jobid_list)
         jobRecordList = []
@@ -2401,14 +3731,7 @@ def get_queue(request, g_params):#{{{
                 if jobid in finished_jobid_set:
                     continue
 
-                rstdir = "%s/%s"%(path_result, jobid)
-                starttagfile = "%s/%s"%(rstdir, "runjob.start")
-                failedtagfile = "%s/%s"%(rstdir, "runjob.failed")
-                finishtagfile = "%s/%s"%(rstdir, "runjob.finish")
-                if (os.path.exists(rstdir) and 
-                        not os.path.exists(starttagfile) and
-                        not os.path.exists(failedtagfile) and
-                        not os.path.exists(finishtagfile)):
+                if GetTagResolver(info).GetStatus(jobid) == "Queued":
                     jobRecordList.append(jobid)
             lines = hdl.readlines()
         hdl.close()
@@ -2428,18 +3751,15 @@ def get_queue(request, g_params):#{{{
             finish_date_str = ""
             start_date_str = ""
 
-            jobinfofile = "%s/jobinfo"%(rstdir)
-            jobinfo = myfunc.ReadFile(jobinfofile).strip()
-            jobinfolist = jobinfo.split("\t")
-            if len(jobinfolist) >= 8:
-                submit_date_str = jobinfolist[0]
-                ip = jobinfolist[2]
-                numseq = int(jobinfolist[3])
-                jobname = jobinfolist[5]
-                email = jobinfolist[6]
-                method_submission = jobinfolist[7]
+            summary = GetJobSummary(rstdir)
+            if summary.isJobInfoValid:
+                submit_date_str = summary.submit_date_str
+                ip = summary.client_ip
+                numseq = summary.numseq
+                jobname = summary.jobname
+                email = summary.email
+                method_submission = summary.method_submission
 
-            starttagfile = "%s/runjob.start"%(rstdir)
             queuetime = ""
             runtime = ""
             isValidSubmitDate = True
@@ -2479,13 +3799,15 @@ def get_running(request, g_params):#{{{
     if info['isSuperUser']:
         info['header'].insert(6, "Host")
 
-    hdl = myfunc.ReadLineByBlock(info['divided_logfile_query'])
+    hdl = OpenJobQuery(info)
     if hdl.failure:
         info['errmsg'] = ""
         pass
     else:
         finished_jobid_list = []
-        if os.path.exists(info['divided_logfile_finished_jobid']):
+        if 'divided_db' in info:
+            finished_jobid_list = list(ReadFinishedJobForView(info).keys())
+        elif os.path.exists(info['divided_logfile_finished_jobid']):
             finished_jobid_list = myfunc.ReadIDList2(info['divided_logfile_finished_jobid'], 0, None)
         finished_jobid_set = set(finished_jobid_list)
         jobRecordList = []
@@ -2501,13 +3823,7 @@ def get_running(request, g_params):#{{{
                 jobid = strs[1]
                 if jobid in finished_jobid_set:
                     continue
-                rstdir = "%s/%s"%(path_result, jobid)
-                starttagfile = "%s/%s"%(rstdir, "runjob.start")
-                finishtagfile = "%s/%s"%(rstdir, "runjob.finish")
-                failedtagfile = "%s/%s"%(rstdir, "runjob.failed")
-                if (os.path.exists(rstdir) and os.path.exists(starttagfile) and (not
-                    os.path.exists(finishtagfile) and not
-                    os.path.exists(failedtagfile))):
+                if GetTagResolver(info).GetStatus(jobid) == "Running":
                     jobRecordList.append(jobid)
             lines = hdl.readlines()
         hdl.close()
@@ -2527,22 +3843,16 @@ def get_running(request, g_params):#{{{
             finish_date_str = ""
             start_date_str = ""
 
-            jobinfofile = "%s/jobinfo"%(rstdir)
-            jobinfo = myfunc.ReadFile(jobinfofile).strip()
-            jobinfolist = jobinfo.split("\t")
-            if len(jobinfolist) >= 8:
-                submit_date_str = jobinfolist[0]
-                ip = jobinfolist[2]
-                numseq = int(jobinfolist[3])
-                jobname = jobinfolist[5]
-                email = jobinfolist[6]
-                method_submission = jobinfolist[7]
-
-            finished_idx_file = "%s/finished_seqindex.txt"%(rstdir)
-            numFinishedSeq = 0
-            if os.path.exists(finished_idx_file):
-                finished_idxlist = myfunc.ReadIDList(finished_idx_file)
-                numFinishedSeq = len(set(finished_idxlist))
+            summary = GetJobSummary(rstdir)
+            if summary.isJobInfoValid:
+                submit_date_str = summary.submit_date_str
+                ip = summary.client_ip
+                numseq = summary.numseq
+                jobname = summary.jobname
+                email = summary.email
+                method_submission = summary.method_submission
+
+            numFinishedSeq = summary.num_finished
 
             starttagfile = "%s/runjob.start"%(rstdir)
             queuetime = ""
@@ -2554,7 +3864,7 @@ def get_running(request, g_params):#{{{
             except ValueError:
                 isValidSubmitDate = False
             start_date_str = ""
-            if os.path.exists(starttagfile):
+            if GetTagResolver(info).HasTag(jobid, "runjob.start"):
                 start_date_str = myfunc.ReadFile(starttagfile).strip()
             try:
                 start_date = datetime_str_to_time(start_date_str)
@@ -2591,54 +3901,16 @@ def get_finished_job(request, g_params):#{{{
     if info['isSuperUser']:
         info['header'].insert(5, "Host")
 
-    hdl = myfunc.ReadLineByBlock(info['divided_logfile_query'])
-    if hdl.failure:
+    page = GetJobListPage(request, g_params)
+    info['page'] = page
+    (jobRecordList, finished_job_dict) = ReadFinishedJobPage(info, "Finished", page)
+    if jobRecordList is None:
         #info['errmsg'] = "Failed to retrieve finished job information!"
         info['errmsg'] = ""
         pass
     else:
-        finished_job_dict = myfunc.ReadFinishedJobLog(info['divided_logfile_finished_jobid'])
-        jobRecordList = []
-        lines = hdl.readlines()
-        while lines != None:
-            for line in lines:
-                strs = line.split("\t")
-                if len(strs) < 7:
-                    continue
-                ip = strs[2]
-                if not info['isSuperUser'] and ip != info['client_ip']:
-                    continue
-
-                submit_date_str = strs[0]
-                isValidSubmitDate = True
-                try:
-                    submit_date = datetime_str_to_time(submit_date_str)
-                except ValueError:
-                    isValidSubmitDate = False
-                if not isValidSubmitDate:
-                    continue
-
-                current_time = datetime.now(submit_date.tzinfo)
-                diff_date = current_time - submit_date
-                if diff_date.days > info['MAX_DAYS_TO_SHOW']:
-                    continue
-                jobid = strs[1]
-                rstdir = "%s/%s"%(path_result, jobid)
-                if jobid in finished_job_dict:
-                    status = finished_job_dict[jobid][0]
-                    if status == "Finished":
-                        jobRecordList.append(jobid)
-                else:
-                    finishtagfile = "%s/%s"%(rstdir, "runjob.finish")
-                    failedtagfile = "%s/%s"%(rstdir, "runjob.failed")
-                    if (os.path.exists(rstdir) and  os.path.exists(finishtagfile) and
-                            not os.path.exists(failedtagfile)):
-                        jobRecordList.append(jobid)
-            lines = hdl.readlines()
-        hdl.close()
-
         jobinfo_list = []
-        rank = 0
+        rank = page['offset']
         for jobid in jobRecordList:
             rank += 1
             ip =  ""
@@ -2665,15 +3937,13 @@ def get_finished_job(request, g_params):#{{{
                 start_date_str = finished_job_dict[jobid][7]
                 finish_date_str = finished_job_dict[jobid][8]
             else:
-                jobinfofile = "%s/jobinfo"%(rstdir)
-                jobinfo = myfunc.ReadFile(jobinfofile).strip()
-                jobinfolist = jobinfo.split("\t")
-                if len(jobinfolist) >= 8:
-                    submit_date_str = jobinfolist[0]
-                    numseq = int(jobinfolist[3])
-                    jobname = jobinfolist[5]
-                    email = jobinfolist[6]
-                    method_submission = jobinfolist[7]
+                summary = GetJobSummary(rstdir)
+                if summary.isJobInfoValid:
+                    submit_date_str = summary.submit_date_str
+                    numseq = summary.numseq
+                    jobname = summary.jobname
+                    email = summary.email
+                    method_submission = summary.method_submission
 
             isValidSubmitDate = True
             isValidStartDate = True
@@ -2683,7 +3953,7 @@ def get_finished_job(request, g_params):#{{{
             except ValueError:
                 isValidSubmitDate = False
             start_date_str = ""
-            if os.path.exists(starttagfile):
+            if GetTagResolver(info).HasTag(jobid, "runjob.start"):
                 start_date_str = myfunc.ReadFile(starttagfile).strip()
             try:
                 start_date = datetime_str_to_time(start_date_str)
@@ -2727,47 +3997,16 @@ def get_failed_job(request, g_params):#{{{
     if info['isSuperUser']:
         info['header'].insert(5, "Host")
 
-    hdl = myfunc.ReadLineByBlock(info['divided_logfile_query'])
-    if hdl.failure:
+    page = GetJobListPage(request, g_params)
+    info['page'] = page
+    (jobRecordList, finished_job_dict) = ReadFinishedJobPage(info, "Failed", page)
+    if jobRecordList is None:
 #         info['errmsg'] = "Failed to retrieve finished job information!"
         info['errmsg'] = ""
         pass
     else:
-        finished_job_dict = myfunc.ReadFinishedJobLog(info['divided_logfile_finished_jobid'])
-        jobRecordList = []
-        lines = hdl.readlines()
-        while lines != None:
-            for line in lines:
-                strs = line.split("\t")
-                if len(strs) < 7:
-                    continue
-                ip = strs[2]
-                if not info['isSuperUser'] and ip != info['client_ip']:
-                    continue
-
-                submit_date_str = strs[0]
-                submit_date = datetime_str_to_time(submit_date_str)
-                current_time = datetime.now(submit_date.tzinfo)
-                diff_date = current_time - submit_date
-                if diff_date.days > info['MAX_DAYS_TO_SHOW']:
-                    continue
-                jobid = strs[1]
-                rstdir = "%s/%s"%(path_result, jobid)
-
-                if jobid in finished_job_dict:
-                    status = finished_job_dict[jobid][0]
-                    if status == "Failed":
-                        jobRecordList.append(jobid)
-                else:
-                    failedtagfile = "%s/%s"%(rstdir, "runjob.failed")
-                    if os.path.exists(rstdir) and os.path.exists(failedtagfile):
-                        jobRecordList.append(jobid)
-            lines = hdl.readlines()
-        hdl.close()
-
-
         jobinfo_list = []
-        rank = 0
+        rank = page['offset']
         for jobid in jobRecordList:
             rank += 1
 
@@ -2793,15 +4032,13 @@ def get_failed_job(request, g_params):#{{{
                 start_date_str = finished_job_dict[jobid][ 7]
                 finish_date_str = finished_job_dict[jobid][8]
             else:
-                jobinfofile = "%s/jobinfo"%(rstdir)
-                jobinfo = myfunc.ReadFile(jobinfofile).strip()
-                jobinfolist = jobinfo.split("\t")
-                if len(jobinfolist) >= 8:
-                    submit_date_str = jobinfolist[0]
-                    numseq = int(jobinfolist[3])
-                    jobname = jobinfolist[5]
-                    email = jobinfolist[6]
-                    method_submission = jobinfolist[7]
+                summary = GetJobSummary(rstdir)
+                if summary.isJobInfoValid:
+                    submit_date_str = summary.submit_date_str
+                    numseq = summary.numseq
+                    jobname = summary.jobname
+                    email = summary.email
+                    method_submission = summary.method_submission
 
             isValidStartDate = True
             isValidFailedDate = True
@@ -2813,7 +4050,7 @@ def get_failed_job(request, g_params):#{{{
                 isValidSubmitDate = False
 
             start_date_str = ""
-            if os.path.exists(starttagfile):
+            if GetTagResolver(info).HasTag(jobid, "runjob.start"):
                 start_date_str = myfunc.ReadFile(starttagfile).strip()
             try:
                 start_date = datetime_str_to_time(start_date_str)
@@ -2942,6 +4179,8 @@ def help_wsdl_api(request, g_params):#{{{
     return info
 #}}}
 def get_serverstatus(request, g_params):#{{{
+    from geoip import geolite2
+    import pycountry
     info = {}
     set_basic_config(request, info, g_params)
     path_log = os.path.join(g_params['SITE_ROOT'], 'static/log')
@@ -2980,10 +4219,7 @@ def get_serverstatus(request, g_params):#{{{
         numseq = li[4]
         rstdir = "%s/%s"%(path_result, jobid)
         finished_idx_file = "%s/finished_seqindex.txt"%(rstdir)
-        if os.path.exists(finished_idx_file):
-            num_finished = len(myfunc.ReadIDList(finished_idx_file))
-        else:
-            num_finished = 0
+        num_finished = len(myfunc.ReadRangeSet(finished_idx_file))
 
         cntseq_in_remote_queue += (numseq - num_finished)
 
@@ -3224,21 +4460,9 @@ def get_results_eachseq(request, name_resultfile, name_nicetopfile, jobid, seqin
     rstdir = "%s/%s"%(g_params['path_result'], jobid)
     outpathname = jobid
 
-    jobinfofile = "%s/jobinfo"%(rstdir)
-    jobinfo = myfunc.ReadFile(jobinfofile).strip()
-    jobinfolist = jobinfo.split("\t")
-    if len(jobinfolist) >= 8:
-        submit_date_str = jobinfolist[0]
-        numseq = int(jobinfolist[3])
-        jobname = jobinfolist[5]
-        email = jobinfolist[6]
-        method_submission = jobinfolist[7]
-    else:
-        submit_date_str = ""
-        numseq = 1
-        jobname = ""
-        email = ""
-        method_submission = "web"
+    summary = GetJobSummary(rstdir)
+    numseq = summary.numseq
+    jobname = summary.jobname
 
     status = ""
 
@@ -22,7 +22,9 @@ setup(
             'src/show_jobqueuestatus.py',
             'src/job_final_process.py',
             'src/run_server_statistics.py',
-            'src/restart_qd_fe.cgi'
+            'src/restart_qd_fe.cgi',
+            'src/submit_job_worker.py',
+            'src/trace_summary.py'
             ] + PLOTTING_SCRIPTS,
         author="Nanjiang Shu",
         author_email="nanjiang.shu@gmail.com",
@@ -3,112 +3,43 @@
 import sys
 import os
 import sqlite3
-import shutil
 import argparse
 import fcntl
 
-from datetime import datetime
-from pytz import timezone
-import tempfile
-from libpredweb import myfunc
 from libpredweb import webserver_common as webcom
 
-TZ = webcom.TZ
-
 progname = os.path.basename(sys.argv[0])
 rootname_progname = os.path.splitext(progname)[0]
 
 
-def clean_cached_result(MAX_KEEP_DAYS, g_params):  # {{{
-    """Clean out-dated cached result"""
+def clean_cached_result(MAX_KEEP_DAYS, g_params, num_thread=16,  # {{{
+                        isVacuum=False, policy="age", max_size_in_byte=0):
+    """Clean out-dated cached result by the eviction policy, see
+    webcom.EvictCachedResult"""
     path_log = g_params['path_log']
     path_cache = g_params['path_cache']
     logfile = f"{path_log}/{progname}.log"
     errfile = f"{path_log}/{progname}.err"
 
     db = f"{path_log}/cached_job_finished_date.sqlite3"
-    tmpdb = tempfile.mktemp(prefix=f"{db}_")
-
-    webcom.loginfo(f"copy db {db} to tmpdb {tmpdb}", logfile)
-    try:
-        shutil.copyfile(db, tmpdb)
-    except OSError:
-        webcom.loginfo(f"Failed to copy {db} to {tmpdb}.", errfile)
-        return 1
-
-    md5listfile = f"{path_log}/cache_to_delete.md5list"
-    con = sqlite3.connect(tmpdb)
-    webcom.loginfo(f"output the outdated md5 list to {md5listfile}", logfile)
-
-    tablename = "data"
-
-    with con:
-        cur = con.cursor()
-        fpout = open(md5listfile, "w")
-        nn_mag = cur.execute(f"SELECT md5, date_finish FROM {tablename}")
-        cnt = 0
-        chunk_size = 1000
-        while True:
-            result = nn_mag.fetchmany(chunk_size)
-            if not result:
-                break
-            else:
-                for row in result:
-                    cnt += 1
-                    md5_key = row[0]
-                    finish_date_str = row[1]
-                    finish_date = webcom.datetime_str_to_time(finish_date_str)
-                    current_time = datetime.now(timezone(TZ))
-                    timeDiff = current_time - finish_date
-                    if timeDiff.days > MAX_KEEP_DAYS:
-                        fpout.write(f"{md5_key}\n")
-        fpout.close()
-
-        # delete cached result folder and delete the record
-        webcom.loginfo("Delete cached result folder and delete the record", logfile)
-
-        hdl = myfunc.ReadLineByBlock(md5listfile)
-        lines = hdl.readlines()
-        cnt = 0
-        while lines is not None:
-            for line in lines:
-                line = line.strip()
-                if line != "":
-                    cnt += 1
-                    md5_key = line
-
-                    subfoldername = md5_key[:2]
-                    cachedir = os.path.join(path_cache, subfoldername, md5_key)
-                    zipfile_cache = cachedir + ".zip"
-                    if os.path.exists(zipfile_cache):
-                        try:
-                            os.remove(zipfile_cache)
-                            webcom.loginfo(f"rm {zipfile_cache}", logfile)
-                            cmd_d = f"DELETE FROM {tablename} WHERE md5 = '{md5_key}'"
-                            cur.execute(cmd_d)
-                        except Exception as e:
-                            webcom.loginfo(f"Failed to delete with errmsg {e}", errfile)
-                            pass
-
-            lines = hdl.readlines()
-        hdl.close()
-
-        webcom.loginfo(f"VACUUM the database {tmpdb}", logfile)
-        cur.execute("VACUUM")
-
-    # copy back
-    webcom.loginfo(f"cp tmpdb {tmpdb} -> db {db}", logfile)
-    try:
-        shutil.copyfile(tmpdb, db)
-    except Exception as e:
-        webcom.loginfo(f"Failed to copy {tmpdb} to {db} with {e}", errfile)
-        return 1
+    if not os.path.exists(db):
+        webcom.loginfo(f"db {db} does not exist", logfile)
+        return 0
 
-    webcom.loginfo(f"delete tmpdb {tmpdb}", logfile)
     try:
-        os.remove(tmpdb)
-    except Exception as e:
-        webcom.loginfo(f"Failed to delete {tmpdb} with {e}", errfile)
+        (num_evicted, size_evicted) = webcom.EvictCachedResult(
+                db, path_cache, policy, logfile, errfile,
+                max_keep_days=MAX_KEEP_DAYS, max_size_in_byte=max_size_in_byte,
+                num_thread=num_thread)
+        webcom.loginfo(f"Evicted {num_evicted} cached results ({size_evicted} bytes)",
+                       logfile)
+        if isVacuum:
+            webcom.loginfo(f"VACUUM the database {db}", logfile)
+            con = sqlite3.connect(db, timeout=60)
+            con.execute("VACUUM")
+            con.close()
+    except sqlite3.Error as e:
+        webcom.loginfo(f"Failed to clean cached results with errmsg {e}", errfile)
         return 1
 
     return 0
@@ -133,7 +64,26 @@ Examples:
                         default=360, type=int, required=False,
                         help='The age of the cached result to be kept,\
                              (default: 360)')
+    parser.add_argument('-nthread', metavar='INT', dest='num_thread',
+                        default=16, type=int, required=False,
+                        help='Number of threads to delete the zipfiles,\
+                             (default: 16)')
+    parser.add_argument('-vacuum', dest='isVacuum', action='store_true',
+                        help='VACUUM the database after cleaning')
+    parser.add_argument('-policy', metavar='STR', dest='policy',
+                        default="age", type=str, required=False,
+                        choices=["age", "lru", "lfu"],
+                        help='Eviction policy, age: older than -max-keep-day,\
+                             lru/lfu: least recently/frequently used results\
+                             until the cache is within -max-size-gb,\
+                             (default: age)')
+    parser.add_argument('-max-size-gb', metavar='FLOAT', dest='max_size_gb',
+                        default=0.0, type=float, required=False,
+                        help='Size budget of the cache in GB for the\
+                             policies lru and lfu')
     args = parser.parse_args()
+    if args.policy in ["lru", "lfu"] and args.max_size_gb <= 0:
+        parser.error(f"-max-size-gb > 0 is required for the policy {args.policy}")
 
     MAX_KEEP_DAYS = args.max_keep_days
     jsonfile = args.jsonfile
@@ -156,7 +106,10 @@ Examples:
                        g_params['gen_logfile'])
         return 1
 
-    status = clean_cached_result(MAX_KEEP_DAYS, g_params)
+    status = clean_cached_result(MAX_KEEP_DAYS, g_params,
+                                 num_thread=max(1, args.num_thread),
+                                 isVacuum=args.isVacuum, policy=args.policy,
+                                 max_size_in_byte=int(args.max_size_gb*1024**3))
     if os.path.exists(lock_file):
         try:
             os.remove(lock_file)
@@ -43,23 +43,19 @@ def JobFinalProcess(g_params):#{{{
     base_www_url_file = "%s/base_www_url.txt"%(path_log)
     base_www_url = ""
 
-    finished_idx_list = []
-    failed_idx_list = []
-    if os.path.exists(finished_idx_file):
-        finished_idx_list = list(set(myfunc.ReadIDList(finished_idx_file)))
-    if os.path.exists(failed_idx_file):
-        failed_idx_list = list(set(myfunc.ReadIDList(failed_idx_file)))
+    finished_idx_set = myfunc.ReadRangeSet(finished_idx_file)
+    failed_idx_set = myfunc.ReadRangeSet(failed_idx_file)
 
     finishtagfile = "%s/%s"%(rstdir, "runjob.finish")
     failedtagfile = "%s/%s"%(rstdir, "runjob.failed")
     starttagfile = "%s/%s"%(rstdir, "runjob.start")
 
-    num_processed = len(finished_idx_list)+len(failed_idx_list)
+    num_processed = len(finished_idx_set | failed_idx_set)
     finish_status = "" #["success", "failed", "partly_failed"]
     if num_processed >= numseq:# finished
-        if len(failed_idx_list) == 0:
+        if len(failed_idx_set) == 0:
             finish_status = "success"
-        elif len(failed_idx_list) >= numseq:
+        elif len(failed_idx_set) >= numseq:
             finish_status = "failed"
         else:
             finish_status = "partly_failed"
@@ -120,7 +116,7 @@ def JobFinalProcess(g_params):#{{{
             if is_zip_success:
                 webcom.WriteDateTimeTagFile(finishtagfile_zipfile, runjob_logfile, runjob_errfile)
 
-        if len(failed_idx_list)>0:
+        if len(failed_idx_set)>0:
             webcom.WriteDateTimeTagFile(failedtagfile, runjob_logfile, runjob_errfile)
 
         if is_zip_success:
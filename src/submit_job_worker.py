@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# Description:
+#   Long-lived worker that submits the queries spooled by
+#   webcom.SubmitQueryToLocalQueue (with g_params['isSubmitAsync'] set), so
+#   that the web request does not wait for the start of a new Python
+#   interpreter running submit_job_to_queue.py
+#
+#   In the default mode "inprocess", submit_job_to_queue.py is loaded once in
+#   each worker process and its main() is called for every query. In the mode
+#   "subprocess" the script is run as a command as before, but outside of the
+#   web request.
+
+import sys
+import os
+import argparse
+import fcntl
+import time
+import concurrent.futures
+
+from libpredweb import myfunc
+from libpredweb import webserver_common as webcom
+from libpredweb import executor
+
+progname = os.path.basename(sys.argv[0])
+rootname_progname = os.path.splitext(progname)[0]
+
+def SubmitSpoolFile(spoolfile, g_params):#{{{
+    """Submit the query in the spoolfile
+    Return (spoolfile, isSuccess, runtime_in_sec)
+    """
+    item = webcom.LoadJsonFromFile(spoolfile)
+    if not 'jobid' in item:
+        return (spoolfile, False, 0.0)
+    rstdir = item['rstdir']
+    runjob_logfile = "%s/runjob.log"%(rstdir)
+    runjob_errfile = "%s/runjob.err"%(rstdir)
+    failedtagfile = "%s/%s"%(rstdir, "submit_job_to_queue.py.failed")
+
+    cmd = webcom.GetSubmitJobCmd(item, item['tmpdir'], rstdir, g_params,
+            item['isOnlyGetCache'])
+    if g_params['mode'] == "inprocess":
+        # run in the worker processes of the pool, the output is redirected
+        # to the log files of the job
+        (isSuccess, t_runtime) = executor.RunScriptInProcess(cmd[1:],
+                runjob_logfile, runjob_errfile, isRedirect=True)
+    else:
+        (isSuccess, t_runtime) = webcom.RunCmd(cmd, runjob_logfile,
+                runjob_errfile)
+    if not isSuccess:
+        webcom.WriteDateTimeTagFile(failedtagfile, runjob_logfile,
+                runjob_errfile)
+    return (spoolfile, isSuccess, t_runtime)
+#}}}
+def ClaimSpoolFileList(spooldir, maxnum):#{{{
+    """Move at most maxnum spool files from new/ to cur/, in the order of
+    submission
+    Return a list of claimed spool files
+    """
+    newdir = "%s/new"%(spooldir)
+    curdir = "%s/cur"%(spooldir)
+    claimed_list = []
+    try:
+        namelist = sorted(os.listdir(newdir))
+    except OSError:
+        return claimed_list
+    for name in namelist[:maxnum]:
+        spoolfile = "%s/%s"%(curdir, name)
+        try:
+            os.replace("%s/%s"%(newdir, name), spoolfile)
+        except OSError:
+            continue
+        claimed_list.append(spoolfile)
+    return claimed_list
+#}}}
+def RunWorker(g_params):#{{{
+    """Serve the spool directory until being killed"""
+    spooldir = g_params['spooldir']
+    gen_logfile = g_params['gen_logfile']
+    heartbeatfile = "%s/worker.heartbeat"%(spooldir)
+    scriptfile = "%s/app/submit_job_to_queue.py"%(g_params['SITE_ROOT'])
+
+    for subdir in ["tmp", "new", "cur"]:
+        os.makedirs("%s/%s"%(spooldir, subdir), exist_ok=True)
+    # put back the spool files claimed by the previous run of the worker
+    curdir = "%s/cur"%(spooldir)
+    for name in os.listdir(curdir):
+        os.replace("%s/%s"%(curdir, name), "%s/new/%s"%(spooldir, name))
+
+    if g_params['mode'] == "inprocess":
+        pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=g_params['num_worker'],
+                initializer=executor.LoadScriptModule, initargs=(scriptfile,))
+    else:
+        pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=g_params['num_worker'])
+    webcom.loginfo("%s started in mode %s with %d workers, spooldir=%s"%(
+        progname, g_params['mode'], g_params['num_worker'], spooldir),
+        gen_logfile)
+
+    running = set()
+    last_heartbeat = 0.0
+    while 1:
+        if time.time() - last_heartbeat > webcom.SUBMIT_WORKER_HEARTBEAT_TIMEOUT/6:
+            myfunc.WriteFile("%d\n"%(os.getpid()), heartbeatfile)
+            last_heartbeat = time.time()
+
+        numfree = g_params['num_worker'] - len(running)
+        if numfree > 0:
+            for spoolfile in ClaimSpoolFileList(spooldir, numfree):
+                running.add(pool.submit(SubmitSpoolFile, spoolfile,
+                    g_params))
+        if len(running) == 0:
+            time.sleep(g_params['sleep_interval'])
+            continue
+
+        (done, running) = concurrent.futures.wait(running,
+                timeout=g_params['sleep_interval'],
+                return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            try:
+                (spoolfile, isSuccess, t_runtime) = future.result()
+            except Exception as e:
+                webcom.loginfo("Failed to submit a spooled query. errmsg=%s"%(
+                    str(e)), g_params['gen_errfile'])
+                continue
+            msg = "Submitted %s, success=%s, runtime=%.3f s"%(
+                    os.path.basename(spoolfile), isSuccess, t_runtime)
+            webcom.loginfo(msg, gen_logfile)
+            try:
+                os.remove(spoolfile)
+            except OSError:
+                pass
+#}}}
+def main(g_params):# {{{
+    parser = argparse.ArgumentParser(
+            description='Submit the queries spooled by the web-server',
+            formatter_class=argparse.RawDescriptionHelpFormatter,
+            epilog='''\
+Examples:
+    %s -i submit_job_worker.json
+'''%(sys.argv[0]))
+    parser.add_argument('-i' , metavar='JSONFILE', dest='jsonfile',
+            type=str, required=True,
+            help='Provide the Json file with SITE_ROOT, path_static, '
+            'path_result, gen_logfile, gen_errfile and optionally '
+            'path_submit_spool')
+    parser.add_argument('-mode', metavar='MODE', dest='mode', type=str,
+            default="inprocess", choices=["inprocess", "subprocess"],
+            help='How to run submit_job_to_queue.py, (default: inprocess)')
+    parser.add_argument('-nproc', metavar='INT', dest='num_worker', type=int,
+            default=4, help='Number of queries submitted in parallel, (default: 4)')
+    parser.add_argument('-sleep', metavar='FLOAT', dest='sleep_interval',
+            type=float, default=0.2,
+            help='Interval in seconds to check the spool directory, (default: 0.2)')
+
+    args = parser.parse_args()
+
+    jsonfile = args.jsonfile
+    if not os.path.exists(jsonfile):
+        print("Jsonfile %s does not exist. Exit %s!"%(jsonfile, progname), file=sys.stderr);
+        return 1
+
+    g_params.update(webcom.LoadJsonFromFile(jsonfile))
+    g_params['mode'] = args.mode
+    g_params['num_worker'] = max(1, args.num_worker)
+    g_params['sleep_interval'] = args.sleep_interval
+    g_params['spooldir'] = webcom.GetSubmitSpoolDir(g_params)
+    os.makedirs(g_params['spooldir'], exist_ok=True)
+
+    lock_file = "%s/%s.lock"%(g_params['spooldir'], rootname_progname)
+    fp = open(lock_file, 'w')
+    try:
+        fcntl.lockf(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        webcom.loginfo("Another instance of %s is running"%(progname),
+                       g_params['gen_logfile'])
+        return 1
+
+    return RunWorker(g_params)
+# }}}
+
+def InitGlobalParameter():#{{{
+    g_params = {}
+    return g_params
+#}}}
+if __name__ == '__main__' :
+    g_params = InitGlobalParameter()
+    sys.exit(main(g_params))
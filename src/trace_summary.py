@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Description:
+#   Summarize the trace of the qd_fe daemon written by libpredweb/trace.py,
+#   show the runtime of the last N loops, the slowest spans and the total
+#   runtime for each span name
+
+import os
+import sys
+import json
+import argparse
+
+from libpredweb import trace
+
+progname = os.path.basename(sys.argv[0])
+
+def ReadSpanList(tracefile):#{{{
+    """Read the spans from tracefile and its rotated files, in the format of
+    JSON lines or Chrome trace events
+    Return a list of dict with the keys loop, name, ts, dur and attrs
+    """
+    filelist = []
+    i = 1
+    while os.path.exists("%s.%d"%(tracefile, i)):
+        filelist.insert(0, "%s.%d"%(tracefile, i))
+        i += 1
+    if os.path.exists(tracefile):
+        filelist.append(tracefile)
+
+    spanList = []
+    for infile in filelist:
+        with open(infile, "r") as fpin:
+            for line in fpin:
+                line = line.strip().rstrip(",")
+                if line in ["", "[", "]"]:
+                    continue
+                try:
+                    d = json.loads(line)
+                except ValueError:
+                    continue
+                if 'ph' in d: # Chrome trace event
+                    attrs = d.get('args', {})
+                    spanList.append({'loop': attrs.pop('loop', -1),
+                        'name': d['name'], 'ts': d['ts']/1e6,
+                        'dur': d['dur']/1e6,
+                        'isTop': attrs.pop('parent', 0) == 0, 'attrs': attrs})
+                else:
+                    d['isTop'] = d.get('parent', 0) == 0
+                    spanList.append(d)
+    return spanList
+#}}}
+def FormatAttrs(attrs, maxlen=60):#{{{
+    s = " ".join("%s=%s"%(k, attrs[k]) for k in sorted(attrs))
+    if len(s) > maxlen:
+        s = s[:maxlen-3] + "..."
+    return s
+#}}}
+def Summarize(spanList, numloop, numtop, fpout):#{{{
+    loopList = sorted(set(x['loop'] for x in spanList if x['loop'] >= 0))
+    selLoopSet = set(loopList[-numloop:])
+    selSpanList = [x for x in spanList if x['loop'] in selLoopSet]
+    if len(selSpanList) == 0:
+        print("No spans found", file=fpout)
+        return 1
+
+    print("# Runtime of the last %d loops (top level spans)"%(len(selLoopSet)), file=fpout)
+    loopDict = {}
+    for x in selSpanList:
+        if x['isTop']:
+            if not x['loop'] in loopDict:
+                loopDict[x['loop']] = {}
+            loopDict[x['loop']][x['name']] = loopDict[x['loop']].get(x['name'], 0.0) + x['dur']
+    for loop in sorted(loopDict):
+        total = sum(loopDict[loop].values())
+        li = sorted(loopDict[loop].items(), key=lambda x:-x[1])[:3]
+        print("loop %6d %10.3f s  %s"%(loop, total,
+            ", ".join("%s %.3f s"%(name, dur) for (name, dur) in li)), file=fpout)
+
+    print("\n# Top %d slowest spans"%(numtop), file=fpout)
+    print("%-6s %-28s %10s  %s"%("loop", "name", "dur(s)", "attributes"), file=fpout)
+    for x in sorted(selSpanList, key=lambda x:-x['dur'])[:numtop]:
+        print("%-6d %-28s %10.3f  %s"%(x['loop'], x['name'], x['dur'],
+            FormatAttrs(x.get('attrs', {}))), file=fpout)
+
+    print("\n# Total runtime by span name", file=fpout)
+    print("%-28s %8s %10s %10s %10s"%("name", "count", "total(s)", "mean(s)",
+        "max(s)"), file=fpout)
+    nameDict = {}
+    for x in selSpanList:
+        if not x['name'] in nameDict:
+            nameDict[x['name']] = [0, 0.0, 0.0]
+        li = nameDict[x['name']]
+        li[0] += 1
+        li[1] += x['dur']
+        li[2] = max(li[2], x['dur'])
+    for (name, li) in sorted(nameDict.items(), key=lambda x:-x[1][1]):
+        print("%-28s %8d %10.3f %10.3f %10.3f"%(name, li[0], li[1],
+            li[1]/li[0], li[2]), file=fpout)
+    return 0
+#}}}
+def main(g_params):#{{{
+    parser = argparse.ArgumentParser(
+            description='Summarize the trace of the qd_fe daemon',
+            formatter_class=argparse.RawDescriptionHelpFormatter,
+            epilog='''\
+Examples:
+    %s -path-log /var/www/html/topcons2/proj/pred/static/log -n 10
+    %s -i trace.json -top 50
+'''%(sys.argv[0], sys.argv[0]))
+    parser.add_argument('-i' , metavar='FILE', dest='tracefile', type=str,
+            help='The trace file, trace.jsonl or trace.json')
+    parser.add_argument('-path-log' , metavar='DIR', dest='path_log', type=str,
+            help='The log folder of the web-server, with trace.jsonl or trace.json')
+    parser.add_argument('-n', metavar='INT', dest='numloop', type=int,
+            default=10, help='Summarize the last N loops, (default: 10)')
+    parser.add_argument('-top', metavar='INT', dest='numtop', type=int,
+            default=20, help='Number of the slowest spans to show, (default: 20)')
+
+    args = parser.parse_args()
+
+    tracefile = args.tracefile
+    if tracefile is None:
+        if args.path_log is None:
+            parser.print_usage(sys.stderr)
+            return 1
+        tracefile = trace.GetTraceFile(args.path_log, "jsonl")
+        if not os.path.exists(tracefile):
+            tracefile = trace.GetTraceFile(args.path_log, "chrome")
+    if not os.path.exists(tracefile):
+        print("Trace file %s does not exist. Exit %s!"%(tracefile, progname), file=sys.stderr)
+        return 1
+
+    spanList = ReadSpanList(tracefile)
+    return Summarize(spanList, args.numloop, args.numtop, sys.stdout)
+#}}}
+
+def InitGlobalParameter():#{{{
+    g_params = {}
+    return g_params
+#}}}
+if __name__ == '__main__' :
+    g_params = InitGlobalParameter()
+    sys.exit(main(g_params))